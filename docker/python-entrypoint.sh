@@ -9,6 +9,13 @@ SERVICE_PORT=${SERVICE_PORT:-8000}
 
 echo "[entrypoint] Iniciando serviço: $SERVICE_NAME na porta $SERVICE_PORT"
 
+# Métricas Prometheus agregadas entre os workers do uvicorn (instrumentation.py):
+# cada worker grava seu snapshot aqui; limpo a cada start para não somar
+# contadores de uma execução anterior do container
+export ARCADIA_METRICS_DIR=${ARCADIA_METRICS_DIR:-/tmp/arcadia-metrics/$SERVICE_NAME}
+rm -rf "$ARCADIA_METRICS_DIR"
+mkdir -p "$ARCADIA_METRICS_DIR"
+
 case "$SERVICE_NAME" in
   contabil)
     exec python -m uvicorn server.python.contabil_service:app \
@@ -17,6 +24,8 @@ case "$SERVICE_NAME" in
       --workers 2
     ;;
   bi)
+    # Admission control (BI_MAX_CONCURRENT_QUERIES, BI_TENANT_*) vale por
+    # worker: com --workers 2 os tetos efetivos do serviço dobram
     exec python -m uvicorn server.python.bi_engine:app \
       --host 0.0.0.0 \
       --port "$SERVICE_PORT" \
@@ -28,6 +37,9 @@ case "$SERVICE_NAME" in
       --port "$SERVICE_PORT" \
       --workers 1
     ;;
+  automation-worker)
+    exec python -m server.python.automation_worker
+    ;;
   fisco)
     exec python -m uvicorn server.python.fisco_service:app \
       --host 0.0.0.0 \
@@ -48,7 +60,7 @@ case "$SERVICE_NAME" in
     ;;
   *)
     echo "[entrypoint] ERRO: SERVICE_NAME desconhecido: $SERVICE_NAME"
-    echo "Valores válidos: contabil | bi | automation | fisco | people | embeddings"
+    echo "Valores válidos: contabil | bi | automation | automation-worker | fisco | people | embeddings"
     exit 1
     ;;
 esac
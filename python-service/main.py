@@ -1,12 +1,37 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
+import json
 import subprocess
 import sys
 import tempfile
 import os
 
+# Métricas e datasets vêm dos módulos compartilhados em server/python, fora
+# deste diretório: a raiz do repositório (ou ARCADIA_ROOT, quando o serviço
+# roda fora do layout de fontes) entra no sys.path. Sem esses módulos o serviço
+# sobe sem /metrics/prom e com /datasets indisponível.
+ARCADIA_ROOT = os.environ.get("ARCADIA_ROOT") or os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ARCADIA_ROOT not in sys.path:
+    sys.path.append(ARCADIA_ROOT)
+try:
+    from server.python.instrumentation import instrument_app
+except ImportError as e:
+    print(f"[python-service] Métricas desativadas: server.python.instrumentation indisponível ({e})")
+    instrument_app = None
+try:
+    from server.python.dataset_store import DatasetStore, DatasetTooLarge
+except ImportError as e:
+    print(f"[python-service] Datasets desativados: server.python.dataset_store indisponível ({e})")
+    DatasetStore = None
+
+    class DatasetTooLarge(ValueError):
+        pass
+from services.checkpoints import CheckpointStore, RunExists
+
 app = FastAPI(title="Arcádia Python Service", version="1.0.0")
 
 app.add_middleware(
@@ -17,6 +42,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if instrument_app is not None:
+    instrument_app(app, "python-service")
+
+datasets = DatasetStore.from_env() if DatasetStore is not None else None
+checkpoints = CheckpointStore.from_env()
+
+def require_datasets():
+    if datasets is None:
+        raise HTTPException(status_code=503, detail="Datasets indisponíveis neste deploy")
+    return datasets
+
+def resolve_dataset(request: dict, key: str = "data"):
+    """Retorna o DataFrame do handle dataset_id ou os registros brutos enviados."""
+    dataset_id = request.get("dataset_id")
+    if dataset_id:
+        require_datasets()
+        try:
+            return datasets.get(dataset_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' nao encontrado ou expirado")
+    return request.get(key, [])
+
 class PythonExecuteRequest(BaseModel):
     code: str
     timeout: Optional[int] = 30
@@ -36,7 +83,12 @@ class AddDocumentRequest(BaseModel):
     metadata: Optional[Dict[str, Any]] = {}
 
 class AnalyzeDataRequest(BaseModel):
+    data: Optional[List[Dict[str, Any]]] = None
+    dataset_id: Optional[str] = None
+
+class DatasetRequest(BaseModel):
     data: List[Dict[str, Any]]
+    name: Optional[str] = None
 
 @app.get("/health")
 def health_check():
@@ -117,11 +169,38 @@ async def embeddings_search(request: SearchRequest):
     except Exception as e:
         return {"error": str(e), "documents": [], "metadatas": []}
 
+@app.post("/datasets")
+async def create_dataset(request: DatasetRequest):
+    if not request.data:
+        raise HTTPException(status_code=400, detail="Dados vazios")
+    try:
+        return {"success": True, "dataset": require_datasets().put(request.data, name=request.name)}
+    except DatasetTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.get("/datasets")
+async def list_datasets():
+    return require_datasets().stats()
+
+@app.get("/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    try:
+        return require_datasets().info(dataset_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' nao encontrado ou expirado")
+
+@app.delete("/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    if not require_datasets().delete(dataset_id):
+        raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' nao encontrado ou expirado")
+    return {"success": True, "deleted": dataset_id}
+
 @app.post("/analyze")
 async def analyze_data(request: AnalyzeDataRequest):
+    data = resolve_dataset({"data": request.data, "dataset_id": request.dataset_id})
     try:
         from services.cientista import analyze_data
-        result = analyze_data(request.data)
+        result = analyze_data(data)
         return {"success": True, "analysis": result}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -175,11 +254,137 @@ async def run_workflow_endpoint(request: dict):
         from services.workflow import run_workflow
         spec = request.get("spec")
         data = request.get("data", {})
-        result = run_workflow(spec, data)
+        # Fora do event loop: ramos paralelos bloqueiam a thread enquanto esperam o join
+        result = await run_in_threadpool(run_workflow, spec, data, checkpoints, request.get("run_id"))
         return {"success": True, "result": result}
+    except RunExists as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+async def _ndjson_records(stream):
+    """Linhas NDJSON de um corpo em streaming; linhas inválidas viram ValueError no lugar do registro."""
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f"JSON inválido: {e}")
+    if buffer.strip():
+        try:
+            yield json.loads(buffer)
+        except ValueError as e:
+            yield ValueError(f"JSON inválido: {e}")
+
+@app.post("/workflow/run/batch")
+async def run_workflow_batch_endpoint(request: Request):
+    """Roda um spec sobre muitos registros e responde em NDJSON (um resultado por linha + summary).
+
+    JSON: {"spec", "records": [...], "executor", "workers", "chunk_size", "include_steps"}.
+    NDJSON (Content-Type application/x-ndjson): a primeira linha traz spec e
+    opções, cada linha seguinte é um registro; o corpo é lido em streaming.
+
+    workers: com executor=thread, threads do lote; com executor=process,
+    quantos processos do pool compartilhado o lote ocupa (no máximo o tamanho
+    do pool, WORKFLOW_PROCESS_POOL_SIZE). O summary traz o valor efetivo.
+    """
+    from services.workflow import prepare_workflow, run_workflow_batch
+    if "ndjson" in request.headers.get("content-type", ""):
+        records = _ndjson_records(request.stream())
+        try:
+            header = await records.__anext__()
+        except StopAsyncIteration:
+            header = None
+        if not isinstance(header, dict):
+            raise HTTPException(status_code=400, detail="Primeira linha deve ser o cabeçalho {spec, ...}")
+    else:
+        try:
+            header = await request.json()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+        if not isinstance(header, dict):
+            raise HTTPException(status_code=400, detail="Corpo deve ser um objeto {spec, records, ...}")
+        records = header.get("records") or []
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="records deve ser uma lista")
+    if header.get("executor") not in (None, "process", "thread"):
+        raise HTTPException(status_code=400, detail="executor inválido (use process ou thread)")
+    try:
+        spec = prepare_workflow(header.get("spec"))
+        chunk_size = int(header.get("chunk_size") or 100)
+        workers = int(header["workers"]) if header.get("workers") is not None else None
+        if workers is not None and workers < 1:
+            raise ValueError("workers deve ser maior que zero")
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    results = run_workflow_batch(
+        spec, records,
+        executor=header.get("executor"),
+        workers=workers,
+        chunk_size=chunk_size,
+        include_steps=bool(header.get("include_steps")),
+    )
+
+    async def body():
+        async for entry in results:
+            yield json.dumps(entry, default=str) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.post("/workflow/runs/{run_id}/resume")
+async def resume_workflow_endpoint(run_id: str, request: dict = None):
+    """Retoma uma execução parada (wait/human_approval): {approved, approver, comment, data}."""
+    if checkpoints is None:
+        raise HTTPException(status_code=400, detail="Checkpoints de workflow desativados")
+    from services.workflow import resume_workflow
+    try:
+        result = await run_in_threadpool(resume_workflow, run_id, request or {}, checkpoints)
+    except TypeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "result": result}
+
+@app.get("/workflow/runs")
+async def list_workflow_runs(status: Optional[str] = None, limit: int = 50):
+    if checkpoints is None:
+        return {"runs": []}
+    return {"runs": await run_in_threadpool(checkpoints.list, status, limit)}
+
+@app.get("/workflow/runs/stats")
+async def workflow_runs_stats():
+    if checkpoints is None:
+        return {"enabled": False}
+    return {"enabled": True, **await run_in_threadpool(checkpoints.stats)}
+
+@app.get("/workflow/runs/{run_id}")
+async def get_workflow_run(run_id: str):
+    state = await run_in_threadpool(checkpoints.load, run_id) if checkpoints is not None else None
+    if state is None:
+        raise HTTPException(status_code=404, detail="Execução não encontrada")
+    return state
+
+@app.delete("/workflow/runs/{run_id}")
+async def delete_workflow_run(run_id: str):
+    if checkpoints is None or not await run_in_threadpool(checkpoints.delete, run_id):
+        raise HTTPException(status_code=404, detail="Execução não encontrada")
+    return {"success": True}
+
+@app.get("/workflow/spills/{spill_id}")
+async def get_workflow_spill(spill_id: str):
+    """Resultados de um loop com collect="spill" (NDJSON), até expirarem."""
+    from services.workflow import spill_file
+    path = spill_file(spill_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Spill não encontrado ou expirado")
+    return FileResponse(path, media_type="application/x-ndjson")
+
 @app.post("/workflow/validate")
 async def validate_workflow_endpoint(request: dict):
     try:
@@ -279,9 +484,9 @@ async def scientist_status():
 
 @app.post("/scientist/patterns")
 async def detect_patterns_endpoint(request: dict):
+    data = resolve_dataset(request)
     try:
         from services.cientista import detect_patterns
-        data = request.get("data", [])
         patterns = detect_patterns(data)
         return {"success": True, "patterns": patterns}
     except Exception as e:
@@ -289,9 +494,9 @@ async def detect_patterns_endpoint(request: dict):
 
 @app.post("/scientist/insights")
 async def generate_insights_endpoint(request: dict):
+    data = resolve_dataset(request)
     try:
         from services.cientista import generate_insights
-        data = request.get("data", [])
         insights = generate_insights(data)
         return {"success": True, "insights": insights}
     except Exception as e:
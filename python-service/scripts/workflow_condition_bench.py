@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark das condições do interpretador de workflows (services/workflow.py).
+
+Mede o custo por avaliação em um loop de N itens para:
+  - legacy:   avaliador anterior (split recursivo a cada chamada, reproduzido abaixo)
+  - uncached: parser atual recompilando a expressão a cada item
+  - compiled: closure compilada uma vez (caminho usado por safe_evaluate_condition)
+e o tempo de um passo loop completo via run_workflow.
+
+    python scripts/workflow_condition_bench.py --items 100000 --output bench_conditions.json
+"""
+import argparse
+import json
+import operator
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.workflow import compile_condition, compile_expression, run_workflow
+
+CONDITIONS = [
+    "item.value > 500",
+    "item.status == 'approved' and item.value >= 100",
+    "item.region in ['sul', 'sudeste'] or item.priority == 'alta'",
+    "not item.blocked and item.value > 10 and index > 5",
+]
+
+
+def legacy_evaluate_condition(condition, context):
+    try:
+        condition = condition.strip()
+        if ' and ' in condition:
+            parts = condition.split(' and ', 1)
+            return legacy_evaluate_condition(parts[0], context) and legacy_evaluate_condition(parts[1], context)
+        if ' or ' in condition:
+            parts = condition.split(' or ', 1)
+            return legacy_evaluate_condition(parts[0], context) or legacy_evaluate_condition(parts[1], context)
+        if condition.startswith('not '):
+            return not legacy_evaluate_condition(condition[4:], context)
+        for op_str, op_func in [('==', operator.eq), ('!=', operator.ne),
+                                ('>=', operator.ge), ('<=', operator.le),
+                                ('>', operator.gt), ('<', operator.lt),
+                                (' in ', lambda a, b: a in b)]:
+            if op_str in condition:
+                parts = condition.split(op_str, 1)
+                return op_func(legacy_resolve_value(parts[0].strip(), context),
+                               legacy_resolve_value(parts[1].strip(), context))
+        return bool(legacy_resolve_value(condition, context))
+    except Exception:
+        return False
+
+
+def legacy_resolve_value(expr, context):
+    expr = expr.strip()
+    if expr.startswith(("'", '"')) and expr.endswith(("'", '"')):
+        return expr[1:-1]
+    if expr.lower() == 'true':
+        return True
+    if expr.lower() == 'false':
+        return False
+    if expr.lower() in ('none', 'null'):
+        return None
+    try:
+        if '.' in expr:
+            return float(expr)
+        return int(expr)
+    except ValueError:
+        pass
+    if expr.startswith('[') and expr.endswith(']'):
+        return [legacy_resolve_value(item.strip(), context) for item in expr[1:-1].split(',') if item.strip()]
+    if '.' in expr:
+        value = context
+        for part in expr.split('.'):
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+            else:
+                return None
+        return value
+    return context.get(expr)
+
+
+def make_items(count):
+    regions = ['norte', 'sul', 'sudeste', 'nordeste']
+    return [{
+        "value": (i * 37) % 1000,
+        "status": "approved" if i % 3 == 0 else "pending",
+        "region": regions[i % 4],
+        "priority": "alta" if i % 10 == 0 else "normal",
+        "blocked": i % 7 == 0,
+    } for i in range(count)]
+
+
+def time_evaluator(evaluate, condition, contexts):
+    started = time.perf_counter()
+    matches = 0
+    for context in contexts:
+        if evaluate(condition, context):
+            matches += 1
+    elapsed = time.perf_counter() - started
+    return {"ns_per_eval": round(elapsed / len(contexts) * 1e9, 1), "matches": matches}
+
+
+def uncached(condition, context):
+    try:
+        return bool(compile_expression.__wrapped__(condition)(context))
+    except Exception:
+        return False
+
+
+def compiled(condition, context):
+    return compile_condition(condition)(context)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das condições de workflow')
+    parser.add_argument('--items', type=int, default=100000, help='Itens no loop')
+    parser.add_argument('--output', help='Grava o relatório JSON neste arquivo')
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    contexts = [{"item": item, "index": i} for i, item in enumerate(items)]
+    report = {
+        "meta": {"items": args.items, "python": platform.python_version()},
+        "conditions": {},
+    }
+    for condition in CONDITIONS:
+        results = {
+            "legacy": time_evaluator(legacy_evaluate_condition, condition, contexts),
+            "uncached": time_evaluator(uncached, condition, contexts),
+            "compiled": time_evaluator(compiled, condition, contexts),
+        }
+        results["speedup_vs_legacy"] = round(
+            results["legacy"]["ns_per_eval"] / max(results["compiled"]["ns_per_eval"], 0.1), 2)
+        results["same_result"] = results["legacy"]["matches"] == results["compiled"]["matches"]
+        report["conditions"][condition] = results
+        print(f"[bench] {condition}")
+        for name in ("legacy", "uncached", "compiled"):
+            print(f"          {name:<9} {results[name]['ns_per_eval']:>10.1f} ns/aval  "
+                  f"({results[name]['matches']} verdadeiras)")
+        print(f"          speedup {results['speedup_vs_legacy']}x  mesmo resultado: {results['same_result']}")
+
+    spec = {"steps": [{"id": "loop", "type": "loop", "items": "records", "steps": [
+        {"id": "check", "type": "decision", "condition": CONDITIONS[1]},
+    ]}]}
+    started = time.perf_counter()
+    run_workflow(spec, {"records": items})
+    loop_seconds = time.perf_counter() - started
+    report["run_workflow_loop"] = {"seconds": round(loop_seconds, 3),
+                                   "us_per_item": round(loop_seconds / args.items * 1e6, 2)}
+    print(f"[bench] run_workflow loop de {args.items} itens: {loop_seconds:.3f}s "
+          f"({report['run_workflow_loop']['us_per_item']} us/item)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] relatório gravado em {args.output}")
+    return 0 if all(r["same_result"] for r in report["conditions"].values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Checkpoints duráveis de execuções de workflow (services/workflow.py).
+
+Cada execução vira uma linha SQLite com status, posição e um snapshot
+compacto (JSON comprimido com zlib) do spec, contexto e passos executados.
+O snapshot é regravado após cada passo; execuções paradas em wait ou
+human_approval ficam só no disco até serem retomadas.
+
+Uso:
+    store = CheckpointStore.from_env()
+    result = run_workflow(spec, data, checkpoints=store)
+    result = resume_workflow(result["run_id"], {"approved": True}, store)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS workflow_runs (
+        run_id TEXT PRIMARY KEY,
+        name TEXT,
+        status TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        created_ts REAL NOT NULL,
+        updated_ts REAL NOT NULL,
+        snapshot BLOB NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_workflow_runs_status ON workflow_runs (status, updated_ts)",
+)
+
+TERMINAL_STATUSES = ("completed", "error", "rejected")
+
+
+def encode_snapshot(state: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(state, separators=(",", ":"), default=str).encode("utf-8"), 6)
+
+
+def decode_snapshot(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class RunExists(ValueError):
+    pass
+
+
+class CheckpointStore:
+    def __init__(self, path: str, retention_days: float = 7.0):
+        self.path = path
+        self.retention_days = max(float(retention_days), 0.0)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        with self._lock:
+            for ddl in SCHEMA:
+                self._conn.execute(ddl)
+
+    @classmethod
+    def from_env(cls) -> Optional["CheckpointStore"]:
+        """WORKFLOW_CHECKPOINTS=off desliga; caminho em WORKFLOW_CHECKPOINT_PATH."""
+        if os.environ.get("WORKFLOW_CHECKPOINTS", "on").lower() in ("off", "false", "0"):
+            return None
+        return cls(
+            os.environ.get("WORKFLOW_CHECKPOINT_PATH", os.path.join("data", "workflow-checkpoints.db")),
+            retention_days=float(os.environ.get("WORKFLOW_CHECKPOINT_RETENTION_DAYS", "7")),
+        )
+
+    def create(self, run_id: str, status: str, position: int, state: Dict[str, Any]):
+        """Registra uma execução nova; levanta RunExists se o run_id já estiver em uso."""
+        now = time.time()
+        blob = encode_snapshot(state)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO workflow_runs (run_id, name, status, position, created_ts, updated_ts, snapshot) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, (state.get("spec") or {}).get("name"), status, position, now, now, blob))
+        except sqlite3.IntegrityError:
+            raise RunExists(f"Execução '{run_id}' já existe")
+
+    def save(self, run_id: str, status: str, position: int, state: Dict[str, Any]):
+        """Atualiza uma execução criada por create (execuções removidas não voltam)."""
+        now = time.time()
+        blob = encode_snapshot(state)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE workflow_runs SET status = ?, position = ?, updated_ts = ?, snapshot = ? WHERE run_id = ?",
+                (status, position, now, blob, run_id))
+        if status in TERMINAL_STATUSES and now - self._last_prune > 3600:
+            self.prune()
+
+    def load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, position, created_ts, updated_ts, snapshot FROM workflow_runs WHERE run_id = ?",
+                (run_id,)).fetchone()
+        if row is None:
+            return None
+        state = decode_snapshot(row[4])
+        state.update(run_id=run_id, status=row[0], position=row[1], created_ts=row[2], updated_ts=row[3])
+        return state
+
+    def claim(self, run_id: str, expected: tuple, status: str = "running") -> bool:
+        """Troca o status atomicamente se ainda estiver em expected (evita retomada dupla)."""
+        marks = ", ".join("?" * len(expected))
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE workflow_runs SET status = ?, updated_ts = ? WHERE run_id = ? AND status IN ({marks})",
+                (status, time.time(), run_id, *expected))
+            return cur.rowcount == 1
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        sql = "SELECT run_id, name, status, position, created_ts, updated_ts, length(snapshot) FROM workflow_runs"
+        params: List[Any] = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY updated_ts DESC LIMIT ?"
+        params.append(max(min(int(limit), 1000), 1))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"run_id": r[0], "name": r[1], "status": r[2], "position": r[3], "created_ts": r[4],
+                 "updated_ts": r[5], "snapshot_bytes": r[6]} for r in rows]
+
+    def delete(self, run_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM workflow_runs WHERE run_id = ?", (run_id,)).rowcount == 1
+
+    def prune(self) -> int:
+        """Remove execuções terminadas há mais de retention_days (paradas nunca expiram)."""
+        self._last_prune = time.time()
+        if not self.retention_days:
+            return 0
+        marks = ", ".join("?" * len(TERMINAL_STATUSES))
+        with self._lock:
+            cur = self._conn.execute(
+                f"DELETE FROM workflow_runs WHERE status IN ({marks}) AND updated_ts < ?",
+                (*TERMINAL_STATUSES, self._last_prune - self.retention_days * 86400))
+            return max(cur.rowcount, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*), COALESCE(SUM(length(snapshot)), 0) FROM workflow_runs GROUP BY status"
+            ).fetchall()
+        return {
+            "path": self.path,
+            "retention_days": self.retention_days,
+            "runs": {r[0]: r[1] for r in rows},
+            "snapshot_bytes": sum(r[2] for r in rows),
+        }
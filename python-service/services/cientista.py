@@ -1,15 +1,21 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import json
 import re
 
-def analyze_data(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+Records = Union[List[Dict[str, Any]], pd.DataFrame]
+
+def _as_frame(data: Records) -> pd.DataFrame:
+    """Aceita registros ou um DataFrame já carregado (ex.: handle do dataset store)."""
+    return data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+
+def analyze_data(data: Records) -> Dict[str, Any]:
     """Análise estatística completa de dados."""
-    if not data:
+    if data is None or len(data) == 0:
         return {"error": "Dados vazios"}
     
-    df = pd.DataFrame(data)
+    df = _as_frame(data)
     
     analysis = {
         "shape": {"rows": len(df), "columns": len(df.columns)},
@@ -26,12 +32,12 @@ def analyze_data(data: List[Dict[str, Any]]) -> Dict[str, Any]:
     
     return analysis
 
-def detect_patterns(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+def detect_patterns(data: Records) -> Dict[str, Any]:
     """Detecta padrões e correlações nos dados."""
-    if not data:
+    if data is None or len(data) == 0:
         return {"patterns": []}
     
-    df = pd.DataFrame(data)
+    df = _as_frame(data)
     patterns = []
     
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
@@ -65,12 +71,12 @@ def detect_patterns(data: List[Dict[str, Any]]) -> Dict[str, Any]:
     
     return {"patterns": patterns}
 
-def generate_insights(data: List[Dict[str, Any]]) -> List[str]:
+def generate_insights(data: Records) -> List[str]:
     """Gera insights automáticos sobre os dados."""
-    if not data:
+    if data is None or len(data) == 0:
         return []
     
-    df = pd.DataFrame(data)
+    df = _as_frame(data)
     insights = []
     
     missing = df.isnull().sum()
@@ -89,7 +95,7 @@ def generate_insights(data: List[Dict[str, Any]]) -> List[str]:
         if outliers > 0:
             insights.append(f"Coluna '{col}' contém {outliers} possíveis outliers")
     
-    for col in df.select_dtypes(include=['object']).columns:
+    for col in df.select_dtypes(include=['object', 'category']).columns:
         value_counts = df[col].value_counts()
         if len(value_counts) > 0:
             top_value = value_counts.index[0]
@@ -1,6 +1,18 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Iterable, AsyncIterator, Union
+from collections import ChainMap
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import json
+import multiprocessing
+import os
 import re
 import operator
+import tempfile
+import threading
+import time
+import uuid
 
 SAFE_OPERATORS = {
     '==': operator.eq,
@@ -19,114 +31,425 @@ SAFE_OPERATORS = {
     'in': lambda a, b: a in b,
 }
 
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<number>\d+\.\d*|\.\d+|\d+)
+    |(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<op>==|!=|<=|>=|<|>|\+|-|\*|/|\(|\)|\[|\]|,)
+    |(?P<name>[^\W\d]\w*(?:-\w+)*(?:\.\w+(?:-\w+)*)*)
+""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not', 'in'}
+_LITERALS = {'true': True, 'false': False, 'none': None, 'null': None}
+_COMPARISONS = {'==', '!=', '<', '<=', '>', '>='}
+_MISSING = object()
+
+
+class ConditionSyntaxError(ValueError):
+    pass
+
+
+def _tokenize(text: str) -> List[tuple]:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise ConditionSyntaxError(f"Caractere inesperado na posição {pos}: {text[pos:pos + 10]!r}")
+        kind = match.lastgroup
+        value = match.group()
+        pos = match.end()
+        if kind == 'space':
+            continue
+        if kind == 'name' and value in _KEYWORDS:
+            kind = 'op'
+        tokens.append((kind, value))
+    return tokens
+
+
+def _constant(value: Any) -> Callable[[Dict[str, Any]], Any]:
+    return lambda context: value
+
+
+def _lookup(path: str, default: Any = None) -> Callable[[Dict[str, Any]], Any]:
+    """Acesso a variável do contexto; caminhos pontilhados descem em dicts (ausente = default)."""
+    if '.' not in path:
+        return lambda context: context.get(path, default)
+    first, *rest = path.split('.')
+
+    def resolve(context: Dict[str, Any]) -> Any:
+        value = context.get(first, default)
+        for part in rest:
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+            else:
+                return default
+        return value
+    return resolve
+
+
+def _hyphenated(name: str) -> Callable[[Dict[str, Any]], Any]:
+    """Nome com hífen (user-id): a chave do contexto, se existir; senão, subtração (x-1)."""
+    key = _lookup(name, _MISSING)
+    difference = _ConditionParser(name.replace('-', ' - ')).parse()
+
+    def resolve(context: Dict[str, Any]) -> Any:
+        value = key(context)
+        return difference(context) if value is _MISSING else value
+    return resolve
+
+
+def _binary(func: Callable, left: Callable, right: Callable) -> Callable[[Dict[str, Any]], Any]:
+    return lambda context: func(left(context), right(context))
+
+
+class _ConditionParser:
+    """Descida recursiva que gera closures; precedência (menor para maior):
+    or, and, not, comparações/in, + -, * /, menos unário, literais/variáveis/parênteses."""
+
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def parse(self) -> Callable[[Dict[str, Any]], Any]:
+        if not self.tokens:
+            raise ConditionSyntaxError("Expressão vazia")
+        node = self._or()
+        if self.pos < len(self.tokens):
+            raise ConditionSyntaxError(f"Token inesperado: {self.tokens[self.pos][1]!r}")
+        return node
+
+    def _peek(self) -> Optional[str]:
+        if self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'op':
+            return self.tokens[self.pos][1]
+        return None
+
+    def _expect(self, op: str):
+        if self._peek() != op:
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else 'fim da expressão'
+            raise ConditionSyntaxError(f"Esperado {op!r}, encontrado {found!r}")
+        self.pos += 1
+
+    def _or(self):
+        left = self._and()
+        while self._peek() == 'or':
+            self.pos += 1
+            left = (lambda l, r: lambda context: l(context) or r(context))(left, self._and())
+        return left
+
+    def _and(self):
+        left = self._not()
+        while self._peek() == 'and':
+            self.pos += 1
+            left = (lambda l, r: lambda context: l(context) and r(context))(left, self._not())
+        return left
+
+    def _not(self):
+        if self._peek() == 'not':
+            self.pos += 1
+            operand = self._not()
+            return lambda context: not operand(context)
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._additive()
+        op = self._peek()
+        if op in _COMPARISONS or op == 'in':
+            self.pos += 1
+            return _binary(SAFE_OPERATORS[op], left, self._additive())
+        if op == 'not' and self.pos + 1 < len(self.tokens) and self.tokens[self.pos + 1] == ('op', 'in'):
+            self.pos += 2
+            right = self._additive()
+            return lambda context: left(context) not in right(context)
+        return left
+
+    def _additive(self):
+        left = self._multiplicative()
+        while self._peek() in ('+', '-'):
+            op = self.tokens[self.pos][1]
+            self.pos += 1
+            left = _binary(SAFE_OPERATORS[op], left, self._multiplicative())
+        return left
+
+    def _multiplicative(self):
+        left = self._unary()
+        while self._peek() in ('*', '/'):
+            op = self.tokens[self.pos][1]
+            self.pos += 1
+            left = _binary(SAFE_OPERATORS[op], left, self._unary())
+        return left
+
+    def _unary(self):
+        if self._peek() == '-':
+            self.pos += 1
+            operand = self._unary()
+            return lambda context: -operand(context)
+        return self._primary()
+
+    def _primary(self):
+        if self.pos >= len(self.tokens):
+            raise ConditionSyntaxError("Expressão incompleta")
+        kind, value = self.tokens[self.pos]
+        self.pos += 1
+        if kind == 'number':
+            return _constant(float(value) if '.' in value else int(value))
+        if kind == 'string':
+            return _constant(re.sub(r'\\(.)', r'\1', value[1:-1]))
+        if kind == 'name':
+            if value.lower() in _LITERALS:
+                return _constant(_LITERALS[value.lower()])
+            if '-' in value:
+                return _hyphenated(value)
+            return _lookup(value)
+        if value == '(':
+            node = self._or()
+            self._expect(')')
+            return node
+        if value == '[':
+            items = []
+            while self._peek() != ']':
+                items.append(self._or())
+                if self._peek() != ',':
+                    break
+                self.pos += 1
+            self._expect(']')
+            return lambda context: [item(context) for item in items]
+        raise ConditionSyntaxError(f"Token inesperado: {value!r}")
+
+
+@lru_cache(maxsize=2048)
+def compile_expression(expr: str) -> Callable[[Dict[str, Any]], Any]:
+    """Compila a expressão uma única vez em uma closure context -> valor.
+
+    Levanta ConditionSyntaxError para expressões inválidas. O resultado fica em
+    cache por texto, então passos de loop avaliam sem reprocessar a string.
+    """
+    return _ConditionParser(expr.strip()).parse()
+
+
+@lru_cache(maxsize=2048)
+def compile_condition(condition: str) -> Callable[[Dict[str, Any]], bool]:
+    """Versão booleana e segura de compile_expression: erros viram False.
+
+    Expressões inválidas são registradas no log uma vez (o resultado fica
+    em cache); validate_workflow as reporta como erro de validação.
+    """
+    try:
+        expression = compile_expression(condition)
+    except ConditionSyntaxError as e:
+        print(f"[workflow] Condição inválida {condition!r}: {e}; avaliada como False")
+        return lambda context: False
+
+    def evaluate(context: Dict[str, Any]) -> bool:
+        try:
+            return bool(expression(context))
+        except Exception:
+            return False
+    return evaluate
+
+
 def safe_evaluate_condition(condition: str, context: Dict[str, Any]) -> bool:
     """
     Avalia condições de forma segura sem usar eval().
-    Suporta: comparações simples, and/or, variáveis do contexto.
-    Exemplos: "status == 'approved'", "value > 100", "enabled and count > 0"
+    Suporta: comparações, in/not in, and/or/not com precedência usual,
+    parênteses, aritmética, strings, listas e variáveis do contexto.
+    Exemplos: "status == 'approved'", "value > 100", "enabled and (count > 0 or force)"
     """
-    try:
-        condition = condition.strip()
-        
-        if ' and ' in condition:
-            parts = condition.split(' and ', 1)
-            return safe_evaluate_condition(parts[0], context) and safe_evaluate_condition(parts[1], context)
-        
-        if ' or ' in condition:
-            parts = condition.split(' or ', 1)
-            return safe_evaluate_condition(parts[0], context) or safe_evaluate_condition(parts[1], context)
-        
-        if condition.startswith('not '):
-            return not safe_evaluate_condition(condition[4:], context)
-        
-        for op_str, op_func in [('==', operator.eq), ('!=', operator.ne), 
-                                 ('>=', operator.ge), ('<=', operator.le),
-                                 ('>', operator.gt), ('<', operator.lt),
-                                 (' in ', lambda a, b: a in b)]:
-            if op_str in condition:
-                parts = condition.split(op_str, 1)
-                left = resolve_value(parts[0].strip(), context)
-                right = resolve_value(parts[1].strip(), context)
-                return op_func(left, right)
-        
-        value = resolve_value(condition, context)
-        return bool(value)
-        
-    except Exception:
-        return False
+    return compile_condition(condition)(context)
+
 
 def resolve_value(expr: str, context: Dict[str, Any]) -> Any:
-    """Resolve um valor de forma segura."""
-    expr = expr.strip()
-    
-    if expr.startswith(("'", '"')) and expr.endswith(("'", '"')):
-        return expr[1:-1]
-    
-    if expr.lower() == 'true':
-        return True
-    if expr.lower() == 'false':
-        return False
-    if expr.lower() == 'none' or expr.lower() == 'null':
-        return None
-    
+    """Resolve um valor de forma segura (literal, lista ou variável do contexto)."""
     try:
-        if '.' in expr:
-            return float(expr)
-        return int(expr)
-    except ValueError:
-        pass
-    
-    if expr.startswith('[') and expr.endswith(']'):
-        items = expr[1:-1].split(',')
-        return [resolve_value(item.strip(), context) for item in items if item.strip()]
-    
-    if '.' in expr:
-        parts = expr.split('.')
-        value = context
-        for part in parts:
-            if isinstance(value, dict) and part in value:
-                value = value[part]
-            else:
-                return None
+        return compile_expression(expr)(context)
+    except ConditionSyntaxError:
+        return context.get(expr.strip())
+    except Exception:
+        return None
+
+_PLACEHOLDER_RE = re.compile(r'\$\{([^{}]+)\}')
+
+
+def _template_getter(name: str) -> Callable[[Dict[str, Any]], Any]:
+    # Chave literal (mesmo com ponto) tem prioridade sobre o caminho pontilhado
+    nested = _lookup(name, _MISSING) if '.' in name else None
+
+    def resolve(context: Dict[str, Any]) -> Any:
+        value = context.get(name, _MISSING)
+        if value is _MISSING and nested is not None:
+            value = nested(context)
         return value
-    
-    return context.get(expr)
+    return resolve
+
+
+@lru_cache(maxsize=2048)
+def compile_template(template: str) -> Callable[[Dict[str, Any]], str]:
+    """Compila os placeholders ${chave} / ${a.b.c} uma única vez.
+
+    A renderização só consulta as variáveis referenciadas, então o custo
+    depende do tamanho do template e não do contexto. Placeholders sem
+    valor no contexto permanecem no texto.
+    """
+    pieces = []
+    pos = 0
+    for match in _PLACEHOLDER_RE.finditer(template):
+        pieces.append((template[pos:match.start()], match.group(0), _template_getter(match.group(1))))
+        pos = match.end()
+    if not pieces:
+        return lambda context: template
+    tail = template[pos:]
+
+    def render(context: Dict[str, Any]) -> str:
+        out = []
+        for literal, raw, getter in pieces:
+            value = getter(context)
+            out.append(literal)
+            out.append(raw if value is _MISSING else str(value))
+        out.append(tail)
+        return ''.join(out)
+    return render
+
+
+def render_template(template: str, context: Dict[str, Any]) -> str:
+    return compile_template(template)(context)
+
+
+def render_value(value: Any, context: Dict[str, Any]) -> Any:
+    """Renderiza templates em strings, inclusive dentro de dicts e listas (corpos HTTP)."""
+    if isinstance(value, str):
+        return compile_template(value)(context)
+    if isinstance(value, dict):
+        return {key: render_value(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render_value(item, context) for item in value]
+    return value
+
+
+PARKED_STATUSES = ("waiting", "pending_approval")
+
+
+def run_workflow(spec: Dict[str, Any], data: Dict[str, Any], checkpoints: Any = None,
+                 run_id: Optional[str] = None) -> Dict[str, Any]:
+    """Executa um workflow BPMN simplificado.
+
+    Com checkpoints (CheckpointStore), o estado é gravado após cada passo e
+    a execução para no primeiro passo wait/human_approval; resume_workflow
+    continua dali sem repetir os passos já concluídos. Um run_id já
+    registrado levanta RunExists em vez de sobrescrever a execução.
+    """
+    state = {
+        "run_id": run_id or uuid.uuid4().hex,
+        "spec": spec,
+        "position": 0,
+        "steps_executed": [],
+    }
+    if checkpoints is not None:
+        checkpoints.create(state["run_id"], "running", 0, {"spec": spec, "data": data, "steps_executed": []})
+    return _continue_workflow(state, data, checkpoints)
+
+
+def resume_workflow(run_id: str, decision: Dict[str, Any], checkpoints: Any) -> Dict[str, Any]:
+    """Retoma uma execução parada em wait/human_approval.
+
+    decision: data (mesclado ao contexto) e, para human_approval, approved
+    (padrão True), approver e comment. Rejeição encerra com status "rejected".
+    Levanta TypeError se a decisão for inválida, KeyError se a execução não
+    existir e ValueError se ela não estiver aguardando (inclusive se outra
+    chamada já a retomou).
+    """
+    if not isinstance(decision, dict):
+        raise TypeError("Decisão deve ser um objeto {approved, approver, comment, data}")
+    extra = decision.get("data") or {}
+    if not isinstance(extra, dict):
+        raise TypeError("data da decisão deve ser um objeto")
+    state = checkpoints.load(run_id)
+    if state is None:
+        raise KeyError(f"Execução '{run_id}' não encontrada")
+    parked = state["status"]
+    if parked not in PARKED_STATUSES or not checkpoints.claim(run_id, PARKED_STATUSES):
+        raise ValueError(f"Execução '{run_id}' não está aguardando (status {parked})")
 
-def run_workflow(spec: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
-    """Executa um workflow BPMN simplificado."""
     try:
-        result = {
-            "status": "completed",
-            "data": data,
-            "steps_executed": []
-        }
-        
-        if "steps" in spec:
-            for step in spec["steps"]:
-                step_result = execute_step(step, data)
-                result["steps_executed"].append({
-                    "step_id": step.get("id"),
-                    "type": step.get("type"),
-                    "status": step_result.get("status", "completed"),
-                    "output": step_result
-                })
+        data = state.pop("data")
+        data.update(extra)
+        step = state["spec"]["steps"][state["position"]]
+        entry = {"step_id": step.get("id"), "type": step.get("type"), "status": "resumed",
+                 "output": {"data": extra}}
+        if parked == "pending_approval":
+            approved = bool(decision.get("approved", True))
+            entry["status"] = "approved" if approved else "rejected"
+            entry["output"].update(approved=approved, approver=decision.get("approver"),
+                                   comment=decision.get("comment"))
+        state["steps_executed"].append(entry)
+    except Exception:
+        # Nada foi executado ainda: devolve a execução ao estado parado
+        checkpoints.claim(run_id, ("running",), status=parked)
+        raise
+    if entry["status"] == "rejected":
+        state["status"] = "rejected"
+        checkpoints.save(run_id, "rejected", state["position"],
+                         {"spec": state["spec"], "data": data, "steps_executed": state["steps_executed"]})
+        return {"run_id": run_id, "status": "rejected", "data": data, "steps_executed": state["steps_executed"]}
+    state["position"] += 1
+    return _continue_workflow(state, data, checkpoints)
+
+
+def _continue_workflow(state: Dict[str, Any], data: Dict[str, Any], checkpoints: Any) -> Dict[str, Any]:
+    run_id = state["run_id"]
+    result = {
+        "run_id": run_id,
+        "status": "completed",
+        "data": data,
+        "steps_executed": state["steps_executed"],
+    }
+
+    def checkpoint(status: str):
+        if checkpoints is not None:
+            snapshot = {"spec": state["spec"], "data": data, "steps_executed": state["steps_executed"]}
+            if "parked_step" in result:
+                snapshot["parked_step"] = result["parked_step"]
+            checkpoints.save(run_id, status, state["position"], snapshot)
+
+    try:
+        steps = (state["spec"] or {}).get("steps", [])
+        while state["position"] < len(steps):
+            step = steps[state["position"]]
+            step_result = execute_step(step, data)
+            state["steps_executed"].append({
+                "step_id": step.get("id"),
+                "type": step.get("type"),
+                "status": step_result.get("status", "completed"),
+                "output": step_result
+            })
+            
+            if step_result.get("status") == "error":
+                result["status"] = "error"
+                result["error"] = step_result.get("error")
+                break
                 
-                if step_result.get("status") == "error":
-                    result["status"] = "error"
-                    result["error"] = step_result.get("error")
-                    break
-                    
-                data.update(step_result.get("data", {}))
+            data.update(step_result.get("data", {}))
+            if checkpoints is not None and step_result.get("status") in PARKED_STATUSES:
+                # Estaciona: a posição continua no passo parado até o resume
+                result["status"] = step_result["status"]
+                result["parked_step"] = step.get("id")
+                break
+            state["position"] += 1
+            if state["position"] < len(steps):
+                checkpoint("running")
         
         result["data"] = data
-        return result
         
     except Exception as e:
-        return {
-            "status": "error",
-            "error": str(e),
-            "data": data
-        }
+        result["status"] = "error"
+        result["error"] = str(e)
+    checkpoint(result["status"])
+    return result
+
+def _branch_status(result: Dict[str, Any]) -> str:
+    # Ramo que estaciona (wait/human_approval) estaciona o workflow inteiro
+    status = result.get("status", "completed")
+    return status if status in PARKED_STATUSES else "completed"
+
 
 def execute_step(step: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
     """Executa um passo individual do workflow."""
@@ -144,32 +467,20 @@ def execute_step(step: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any
         
         if result and "then" in step:
             then_result = execute_step(step["then"], context)
-            return {"status": "completed", "branch": "then", "result": result, "data": then_result.get("data", {})}
+            return {"status": _branch_status(then_result), "branch": "then", "result": result,
+                    "data": then_result.get("data", {})}
         elif not result and "else" in step:
             else_result = execute_step(step["else"], context)
-            return {"status": "completed", "branch": "else", "result": result, "data": else_result.get("data", {})}
+            return {"status": _branch_status(else_result), "branch": "else", "result": result,
+                    "data": else_result.get("data", {})}
         
         return {"status": "completed", "result": result, "data": {}}
     
     elif step_type == "loop":
-        items = step.get("items", [])
-        if isinstance(items, str):
-            items = context.get(items, [])
-        
-        results = []
-        for i, item in enumerate(items):
-            loop_context = {**context, "item": item, "index": i}
-            for sub_step in step.get("steps", []):
-                result = execute_step(sub_step, loop_context)
-                results.append(result)
-        
-        return {"status": "completed", "iterations": len(items), "results": results, "data": {}}
+        return execute_loop(step, context)
     
     elif step_type == "parallel":
-        results = []
-        for sub_step in step.get("steps", []):
-            results.append(execute_step(sub_step, context))
-        return {"status": "completed", "results": results, "data": {}}
+        return execute_parallel(step, context)
     
     elif step_type == "wait":
         return {"status": "waiting", "condition": step.get("for"), "data": {}}
@@ -184,6 +495,324 @@ def execute_step(step: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any
     
     return {"status": "completed", "data": {}}
 
+def child_scope(context: Dict[str, Any], frame: Optional[Dict[str, Any]] = None) -> ChainMap:
+    """Escopo em camadas sobre o contexto: leituras caem no pai, escritas ficam na camada nova."""
+    frame = {} if frame is None else frame
+    if isinstance(context, ChainMap):
+        return context.new_child(frame)
+    return ChainMap(frame, context)
+
+
+_SPILL_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def spill_dir() -> str:
+    """Diretório dos arquivos de spill (WORKFLOW_SPILL_DIR)."""
+    return os.environ.get("WORKFLOW_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "workflow-spills")
+
+
+def spill_file(spill_id: str) -> Optional[str]:
+    """Caminho do spill pelo id gerado; None se o id for inválido ou o arquivo já expirou."""
+    if not isinstance(spill_id, str) or not _SPILL_ID_RE.match(spill_id):
+        return None
+    path = os.path.join(spill_dir(), f"{spill_id}.ndjson")
+    return path if os.path.isfile(path) else None
+
+
+def prune_spills(ttl_seconds: Optional[float] = None) -> int:
+    """Remove spills mais velhos que WORKFLOW_SPILL_TTL_SECONDS (padrão 24h)."""
+    if ttl_seconds is None:
+        ttl_seconds = float(os.environ.get("WORKFLOW_SPILL_TTL_SECONDS", "86400"))
+    cutoff = time.time() - ttl_seconds
+    removed = 0
+    try:
+        entries = list(os.scandir(spill_dir()))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.name.endswith(".ndjson"):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+_last_spill_prune = 0.0
+
+
+class LoopResults:
+    """Acumula os resultados de um loop conforme step["collect"].
+
+    all: lista completa (padrão); summary: só contagens por status e amostras
+    de erro; spill: grava cada resultado como uma linha NDJSON em um arquivo
+    com nome gerado em spill_dir() e mantém apenas o resumo em memória. O
+    arquivo é lido por spill_id (GET /workflow/spills/{spill_id}) e
+    removido após WORKFLOW_SPILL_TTL_SECONDS.
+    """
+
+    MAX_ERROR_SAMPLES = 10
+
+    def __init__(self, mode: str = "all"):
+        global _last_spill_prune
+        if mode not in ("all", "summary", "spill"):
+            raise ValueError(f"collect inválido: {mode} (use all, summary ou spill)")
+        self.mode = mode
+        self.results: List[Dict[str, Any]] = []
+        self.by_status: Dict[str, int] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self.spill_id: Optional[str] = None
+        self._spill = None
+        if mode == "spill":
+            directory = spill_dir()
+            os.makedirs(directory, exist_ok=True)
+            if time.time() - _last_spill_prune > 600:
+                _last_spill_prune = time.time()
+                prune_spills()
+            self.spill_id = uuid.uuid4().hex
+            # "x": nunca abre um arquivo que já exista
+            self._spill = open(os.path.join(directory, f"{self.spill_id}.ndjson"), "x", encoding="utf-8")
+
+    def add(self, index: int, step_id: Optional[str], result: Dict[str, Any]):
+        status = result.get("status", "completed")
+        self.by_status[status] = self.by_status.get(status, 0) + 1
+        if status == "error" and len(self.errors) < self.MAX_ERROR_SAMPLES:
+            self.errors.append({"index": index, "step_id": step_id, "error": result.get("error")})
+        if self.mode == "all":
+            self.results.append(result)
+        elif self._spill is not None:
+            self._spill.write(json.dumps({"index": index, "step_id": step_id, **result}, default=str))
+            self._spill.write("\n")
+
+    def close(self) -> Dict[str, Any]:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        output: Dict[str, Any] = {"summary": {"by_status": self.by_status, "errors": self.errors}}
+        if self.mode == "all":
+            output["results"] = self.results
+        elif self.mode == "spill":
+            output["spill_id"] = self.spill_id
+        return output
+
+
+def execute_loop(step: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa os sub-passos para cada item sem copiar o contexto.
+
+    Uma única camada {item, index} sobre o contexto é reutilizada entre as
+    iterações; com collect="summary" ou "spill" a memória fica constante
+    independentemente do número de itens.
+    """
+    items = step.get("items", [])
+    if isinstance(items, str):
+        items = context.get(items, [])
+    sub_steps = step.get("steps", [])
+    collector = LoopResults(step.get("collect", "all"))
+    frame: Dict[str, Any] = {}
+    scope = child_scope(context, frame)
+    iterations = 0
+    try:
+        for i, item in enumerate(items):
+            frame.clear()
+            frame["item"] = item
+            frame["index"] = i
+            for sub_step in sub_steps:
+                collector.add(i, sub_step.get("id"), execute_step(sub_step, scope))
+            iterations += 1
+    finally:
+        output = collector.close()
+    return {"status": "completed", "iterations": iterations, **output, "data": {}}
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+_in_pool_worker = False
+
+
+def _mark_pool_worker():
+    # Dentro de um worker do pool, parallel com executor process vira thread:
+    # submeter ao próprio pool (ou a um pool herdado) pode nunca concluir
+    global _in_pool_worker
+    _in_pool_worker = True
+
+
+def _reset_after_fork():
+    # Um filho criado por fork herda o pool do pai sem a thread que o gerencia
+    global _process_pool, _process_pool_lock
+    _process_pool = None
+    _process_pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _process_pool_size() -> int:
+    return int(os.environ.get("WORKFLOW_PROCESS_POOL_SIZE", "0")) or os.cpu_count() or 1
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Pool de processos compartilhado, criado com spawn (ou WORKFLOW_PROCESS_START_METHOD).
+
+    fork não é usado: o processo do uvicorn tem várias threads e o filho
+    herdaria locks e o estado do pool sem a thread que o gerencia.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            context = multiprocessing.get_context(os.environ.get("WORKFLOW_PROCESS_START_METHOD", "spawn"))
+            _process_pool = ProcessPoolExecutor(max_workers=_process_pool_size(), mp_context=context,
+                                                initializer=_mark_pool_worker)
+        return _process_pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    """Descarta um pool quebrado (worker morto); a próxima chamada cria outro."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_process(fn: Callable, *args) -> tuple:
+    """Submete ao pool compartilhado, trocando-o se já estiver quebrado; devolve (future, pool)."""
+    pool = _get_process_pool()
+    try:
+        return pool.submit(fn, *args), pool
+    except BrokenProcessPool:
+        _discard_process_pool(pool)
+        pool = _get_process_pool()
+        return pool.submit(fn, *args), pool
+
+
+def _run_branch(sub_step: Dict[str, Any], context: Dict[str, Any]) -> tuple:
+    started = time.perf_counter()
+    result = execute_step(sub_step, context)
+    return result, started, time.perf_counter()
+
+
+def _join_target(join: Any, total: int) -> int:
+    if join == "all":
+        return total
+    if join == "any":
+        return min(1, total)
+    try:
+        return max(min(int(join), total), 0)
+    except (TypeError, ValueError):
+        raise ValueError(f"join inválido: {join} (use all, any ou um número de ramos)")
+
+
+def execute_parallel(step: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa os ramos concorrentemente e junta conforme step["join"].
+
+    executor: thread (padrão; ações bloqueantes/I/O se sobrepõem), process
+    (ramos CPU-bound em um pool de processos; contexto e passos precisam ser
+    serializáveis; dentro de um worker do pool, como no lote, roda em threads)
+    ou inline (sequencial). max_concurrency limita os ramos
+    simultâneos; join "all" (padrão), "any" ou N conclui quando N ramos
+    terminam sem erro, cancelando os que ainda não começaram e abandonando
+    os demais; timeout_seconds limita a espera total.
+    """
+    sub_steps = step.get("steps", [])
+    total = len(sub_steps)
+    needed = _join_target(step.get("join", "all"), total)
+    mode = step.get("executor", "thread")
+    if mode == "process" and _in_pool_worker:
+        mode = "thread"
+    limit = max(int(step.get("max_concurrency") or total or 1), 1)
+    timeout = step.get("timeout_seconds")
+    deadline = time.perf_counter() + float(timeout) if timeout else None
+
+    branches: List[Dict[str, Any]] = [
+        {"branch": i, "step_id": sub.get("id"), "status": "pending"} for i, sub in enumerate(sub_steps)
+    ]
+    results: List[Optional[Dict[str, Any]]] = [None] * total
+    started = time.perf_counter()
+    succeeded = 0
+
+    def record(index: int, outcome: tuple):
+        nonlocal succeeded
+        result, branch_start, branch_end = outcome
+        results[index] = result
+        status = result.get("status", "completed")
+        branches[index].update({
+            "status": status,
+            "started_ms": round((branch_start - started) * 1000, 3) if mode != "process" else None,
+            "duration_ms": round((branch_end - branch_start) * 1000, 3),
+        })
+        if status != "error":
+            succeeded += 1
+
+    if mode == "inline" or total <= 1:
+        for index, sub_step in enumerate(sub_steps):
+            if succeeded >= needed or (deadline and time.perf_counter() > deadline):
+                break
+            record(index, _run_branch(sub_step, child_scope(context)))
+    else:
+        owners: Dict[Any, ProcessPoolExecutor] = {}
+        if mode == "process":
+            def submit(fn: Callable, *args) -> Any:
+                future, owner = _submit_process(fn, *args)
+                owners[future] = owner
+                return future
+        elif mode == "thread":
+            # Pool por passo: ramos paralelos aninhados nunca esperam por threads do pai
+            pool = ThreadPoolExecutor(max_workers=min(limit, total), thread_name_prefix="workflow-branch")
+            submit = pool.submit
+        else:
+            raise ValueError(f"executor inválido: {mode} (use thread, process ou inline)")
+        queued = list(range(total))
+        running: Dict[Any, int] = {}
+        try:
+            while (queued or running) and succeeded < needed:
+                while queued and len(running) < limit:
+                    index = queued.pop(0)
+                    branch_context = child_scope(context) if mode == "thread" else dict(context)
+                    running[submit(_run_branch, sub_steps[index], branch_context)] = index
+                    branches[index]["status"] = "running"
+                remaining = None if deadline is None else max(deadline - time.perf_counter(), 0)
+                done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    index = running.pop(future)
+                    try:
+                        record(index, future.result())
+                    except BrokenProcessPool as e:
+                        _discard_process_pool(owners[future])
+                        results[index] = {"status": "error", "error": f"Pool de processos quebrado: {e}"}
+                        branches[index]["status"] = "error"
+                    except Exception as e:
+                        results[index] = {"status": "error", "error": str(e)}
+                        branches[index]["status"] = "error"
+        finally:
+            for future, index in running.items():
+                future.cancel()
+                branches[index]["status"] = "timeout" if deadline and time.perf_counter() >= deadline else "abandoned"
+            if mode == "thread":
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    for branch in branches:
+        if branch["status"] == "pending":
+            branch["status"] = "cancelled"
+    output = {
+        "status": "completed" if succeeded >= needed else "error",
+        "join": step.get("join", "all"),
+        "succeeded": succeeded,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "branches": branches,
+        "results": results,
+        "data": {},
+    }
+    if output["status"] == "error":
+        output["error"] = f"Join não satisfeito: {succeeded} de {needed} ramos concluídos sem erro"
+    return output
+
+
 def execute_action(action: str, params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
     """Executa uma ação específica do workflow."""
     
@@ -195,24 +824,212 @@ def execute_action(action: str, params: Dict[str, Any], context: Dict[str, Any])
         return {"status": "completed", "data": {name: value}}
     
     elif action == "log":
-        message = params.get("message", "")
-        for key, val in context.items():
-            message = message.replace(f"${{{key}}}", str(val))
+        message = render_template(params.get("message", ""), context)
         return {"status": "completed", "logged": message, "data": {}}
     
     elif action == "http_request":
-        return {"status": "completed", "action": "http_request", "url": params.get("url"), "data": {}}
+        result = {"status": "completed", "action": "http_request", "url": params.get("url"), "data": {}}
+        if isinstance(result["url"], str):
+            result["url"] = render_template(result["url"], context)
+        if "body" in params:
+            result["body"] = render_value(params["body"], context)
+        return result
     
     elif action == "send_notification":
-        return {
+        result = {
             "status": "completed",
             "action": "notification_queued",
             "channel": params.get("channel", "email"),
             "data": {}
         }
+        for field in ("subject", "message"):
+            if field in params:
+                result[field] = render_value(params[field], context)
+        return result
     
     return {"status": "completed", "data": {}}
 
+def _warm_step(step: Dict[str, Any]):
+    if isinstance(step.get("condition"), str):
+        compile_condition(step["condition"])
+    for value in (step.get("params") or {}).values():
+        if isinstance(value, str):
+            compile_template(value)
+    for key in ("then", "else"):
+        if isinstance(step.get(key), dict):
+            _warm_step(step[key])
+    for sub_step in step.get("steps") or []:
+        _warm_step(sub_step)
+
+
+def prepare_workflow(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Valida o spec uma vez e pré-compila condições e templates.
+
+    Levanta ValueError com os erros de validação. Usado antes de rodar o
+    mesmo spec sobre muitos registros. A pré-compilação só aquece o cache
+    deste processo (executor thread); no executor process cada worker
+    compila na primeira avaliação e reaproveita o cache nos lotes seguintes.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("spec deve ser um objeto com steps")
+    if not isinstance(spec.get("steps", []), list) or not all(isinstance(step, dict) for step in spec.get("steps", [])):
+        raise ValueError("steps deve ser uma lista de objetos")
+    validation = validate_workflow(spec)
+    if not validation["valid"]:
+        raise ValueError("; ".join(validation["errors"]))
+    for step in spec["steps"]:
+        _warm_step(step)
+    return spec
+
+
+def _run_records(spec: Dict[str, Any], records: List[Any], start: int,
+                 include_steps: bool = False) -> List[Dict[str, Any]]:
+    """Roda o spec sobre um lote; erros ficam isolados no registro que os causou."""
+    output = []
+    for offset, record in enumerate(records):
+        started = time.perf_counter()
+        entry: Dict[str, Any] = {"index": start + offset}
+        if isinstance(record, Exception):
+            entry.update(status="error", error=str(record))
+        else:
+            try:
+                data = dict(record) if isinstance(record, dict) else {"record": record}
+                result = run_workflow(spec, data)
+                entry.update(status=result["status"], data=result["data"])
+                if "error" in result:
+                    entry["error"] = result["error"]
+                if include_steps:
+                    entry["steps_executed"] = result["steps_executed"]
+            except Exception as e:
+                entry.update(status="error", error=str(e))
+        entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        output.append(entry)
+    return output
+
+
+async def _chunked(records: Union[Iterable[Any], AsyncIterator[Any]], size: int) -> AsyncIterator[List[Any]]:
+    chunk: List[Any] = []
+    if hasattr(records, "__aiter__"):
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+async def run_workflow_batch(spec: Dict[str, Any], records: Union[Iterable[Any], AsyncIterator[Any]],
+                             executor: Optional[str] = None, workers: Optional[int] = None,
+                             chunk_size: int = 100, include_steps: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Roda um spec já preparado sobre muitos registros, emitindo um resultado por registro.
+
+    Os registros (iterável ou async iterável; exceções viram registros com
+    erro) são agrupados em lotes de chunk_size e distribuídos em um pool de
+    processos (padrão com mais de um núcleo) ou threads. No máximo 2 lotes
+    por worker ficam em andamento, então a entrada é consumida conforme a
+    saída avança. Resultados saem na ordem de conclusão (use index); o
+    último item é {"summary": {...}} com as estatísticas agregadas.
+
+    Com thread, workers é o tamanho do pool criado para o lote. Com process o
+    pool é o compartilhado (WORKFLOW_PROCESS_POOL_SIZE) e workers limita
+    quantos processos do pool este lote ocupa, até o tamanho dele (padrão:
+    todos); o summary informa o valor efetivo e o tamanho do pool.
+    """
+    executor = executor or ("process" if (os.cpu_count() or 1) > 1 else "thread")
+    chunk_size = max(int(chunk_size), 1)
+    if workers is not None and int(workers) < 1:
+        raise ValueError("workers deve ser maior que zero")
+    pool_size = None
+    if executor == "process":
+        pool_size = _process_pool_size()
+        workers = min(int(workers or pool_size), pool_size)
+        owned = None
+    elif executor == "thread":
+        workers = max(int(workers or os.cpu_count() or 1), 1)
+        owned = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="workflow-batch")
+    else:
+        raise ValueError(f"executor inválido: {executor} (use process ou thread)")
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    in_flight: set = set()
+    chunks: Dict[Any, tuple] = {}
+    by_status: Dict[str, int] = {}
+    total = 0
+    total_ms = 0.0
+    max_ms = 0.0
+    next_index = 0
+
+    def submit(chunk: List[Any], start: int):
+        if owned is not None:
+            future = loop.run_in_executor(owned, _run_records, spec, chunk, start, include_steps)
+            chunks[future] = (start, len(chunk), None)
+        else:
+            raw, pool = _submit_process(_run_records, spec, chunk, start, include_steps)
+            future = asyncio.wrap_future(raw)
+            chunks[future] = (start, len(chunk), pool)
+        in_flight.add(future)
+
+    def chunk_entries(future) -> List[Dict[str, Any]]:
+        start, size, pool = chunks.pop(future)
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            # Worker morto: o lote falha, o pool é recriado para os próximos
+            _discard_process_pool(pool)
+            return [{"index": start + i, "status": "error", "error": f"Pool de processos quebrado: {e}",
+                     "duration_ms": 0.0} for i in range(size)]
+
+    def collect(done: set) -> List[Dict[str, Any]]:
+        nonlocal total, total_ms, max_ms
+        entries = [entry for future in done for entry in chunk_entries(future)]
+        for entry in entries:
+            total += 1
+            by_status[entry["status"]] = by_status.get(entry["status"], 0) + 1
+            total_ms += entry["duration_ms"]
+            max_ms = max(max_ms, entry["duration_ms"])
+        return entries
+
+    try:
+        async for chunk in _chunked(records, chunk_size):
+            submit(chunk, next_index)
+            next_index += len(chunk)
+            while len(in_flight) >= workers * 2:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for entry in collect(done):
+                    yield entry
+        while in_flight:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for entry in collect(done):
+                yield entry
+    finally:
+        for future in in_flight:
+            future.cancel()
+        if owned is not None:
+            owned.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    yield {"summary": {
+        "records": total,
+        "by_status": by_status,
+        "executor": executor,
+        "workers": workers,
+        "process_pool_size": pool_size,
+        "chunk_size": chunk_size,
+        "elapsed_s": round(elapsed, 3),
+        "records_per_s": round(total / elapsed, 1) if elapsed > 0 else 0,
+        "avg_record_ms": round(total_ms / total, 3) if total else 0,
+        "max_record_ms": round(max_ms, 3),
+    }}
+
+
 def validate_workflow(spec: Dict[str, Any]) -> Dict[str, Any]:
     """Valida a especificação de um workflow."""
     errors = []
@@ -248,13 +1065,24 @@ def validate_step(step: Dict[str, Any], index: int) -> List[str]:
     
     if step_type == "decision" and "condition" not in step:
         errors.append(f"Passo {index} (decision) deve ter uma condição")
+    elif step_type == "decision":
+        try:
+            compile_expression(str(step["condition"]))
+        except ConditionSyntaxError as e:
+            errors.append(f"Passo {index} (decision) tem condição inválida: {e}")
     
     if step_type == "loop" and "items" not in step:
         errors.append(f"Passo {index} (loop) deve ter items para iterar")
     
+    if step_type == "loop" and step.get("collect", "all") not in ("all", "summary", "spill"):
+        errors.append(f"Passo {index} (loop) tem collect inválido: use all, summary ou spill")
+    
     if step_type == "parallel" and "steps" not in step:
         errors.append(f"Passo {index} (parallel) deve ter sub-steps")
     
+    if step_type == "parallel" and step.get("executor", "thread") not in ("thread", "process", "inline"):
+        errors.append(f"Passo {index} (parallel) tem executor inválido: use thread, process ou inline")
+    
     return errors
 
 def create_workflow_template(workflow_type: str) -> Dict[str, Any]:
@@ -35,6 +35,14 @@ async function proxyToEngine(path: string, options: RequestInit = {}): Promise<a
   }
 }
 
+function executionQuery(req: Request): string {
+  const params = new URLSearchParams({ limit: String(req.query.limit || 50) });
+  for (const key of ["status", "cursor", "since"]) {
+    if (typeof req.query[key] === "string") params.set(key, req.query[key] as string);
+  }
+  return params.toString();
+}
+
 export function registerAutomationEngineRoutes(app: Express): void {
   app.get("/api/automation-engine/health", async (_req: Request, res: Response) => {
     try {
@@ -220,7 +228,8 @@ export function registerAutomationEngineRoutes(app: Express): void {
   app.post("/api/automation-engine/workflows/:workflowId/execute", async (req: Request, res: Response) => {
     try {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
-      const data = await proxyToEngine(`/workflows/${req.params.workflowId}/execute`, {
+      const wait = req.query.wait ? `?wait=${encodeURIComponent(String(req.query.wait))}` : "";
+      const data = await proxyToEngine(`/workflows/${req.params.workflowId}/execute${wait}`, {
         method: "POST",
         body: JSON.stringify(req.body),
       });
@@ -233,7 +242,7 @@ export function registerAutomationEngineRoutes(app: Express): void {
   app.get("/api/automation-engine/workflows/:workflowId/executions", async (req: Request, res: Response) => {
     try {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
-      const data = await proxyToEngine(`/workflows/${req.params.workflowId}/executions?limit=${req.query.limit || 50}`);
+      const data = await proxyToEngine(`/workflows/${req.params.workflowId}/executions?${executionQuery(req)}`);
       res.json(data);
     } catch (err: any) {
       res.status(502).json({ error: err.message });
@@ -243,7 +252,18 @@ export function registerAutomationEngineRoutes(app: Express): void {
   app.get("/api/automation-engine/executions", async (req: Request, res: Response) => {
     try {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
-      const data = await proxyToEngine(`/executions?limit=${req.query.limit || 50}`);
+      const data = await proxyToEngine(`/executions?${executionQuery(req)}`);
+      res.json(data);
+    } catch (err: any) {
+      res.status(502).json({ error: err.message });
+    }
+  });
+
+  app.get("/api/automation-engine/executions/:executionId", async (req: Request, res: Response) => {
+    try {
+      if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
+      const wait = Math.min(Number(req.query.wait) || 0, 25);
+      const data = await proxyToEngine(`/executions/${req.params.executionId}?wait=${wait}`);
       res.json(data);
     } catch (err: any) {
       res.status(502).json({ error: err.message });
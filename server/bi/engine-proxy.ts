@@ -35,6 +35,11 @@ async function proxyToEngine(path: string, options: RequestInit = {}): Promise<a
   }
 }
 
+function tenantHeaders(req: Request): Record<string, string> {
+  const tenantId = req.user?.tenantId;
+  return tenantId ? { "X-Tenant-Id": String(tenantId) } : {};
+}
+
 export function registerBiEngineRoutes(app: Express): void {
   app.get("/api/bi-engine/health", async (_req: Request, res: Response) => {
     try {
@@ -71,7 +76,7 @@ export function registerBiEngineRoutes(app: Express): void {
   app.get("/api/bi-engine/tables", async (req: Request, res: Response) => {
     try {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
-      const data = await proxyToEngine("/tables");
+      const data = await proxyToEngine("/tables", { headers: tenantHeaders(req) });
       res.json(data);
     } catch (err: any) {
       res.status(502).json({ error: err.message });
@@ -81,7 +86,7 @@ export function registerBiEngineRoutes(app: Express): void {
   app.get("/api/bi-engine/tables/:tableName/columns", async (req: Request, res: Response) => {
     try {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
-      const data = await proxyToEngine(`/tables/${req.params.tableName}/columns`);
+      const data = await proxyToEngine(`/tables/${req.params.tableName}/columns`, { headers: tenantHeaders(req) });
       res.json(data);
     } catch (err: any) {
       res.status(502).json({ error: err.message });
@@ -92,7 +97,7 @@ export function registerBiEngineRoutes(app: Express): void {
     try {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
       const limit = req.query.limit || 50;
-      const data = await proxyToEngine(`/tables/${req.params.tableName}/preview?limit=${limit}`);
+      const data = await proxyToEngine(`/tables/${req.params.tableName}/preview?limit=${limit}`, { headers: tenantHeaders(req) });
       res.json(data);
     } catch (err: any) {
       res.status(502).json({ error: err.message });
@@ -102,7 +107,7 @@ export function registerBiEngineRoutes(app: Express): void {
   app.get("/api/bi-engine/tables/:tableName/stats", async (req: Request, res: Response) => {
     try {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
-      const data = await proxyToEngine(`/tables/${req.params.tableName}/stats`);
+      const data = await proxyToEngine(`/tables/${req.params.tableName}/stats`, { headers: tenantHeaders(req) });
       res.json(data);
     } catch (err: any) {
       res.status(502).json({ error: err.message });
@@ -114,6 +119,7 @@ export function registerBiEngineRoutes(app: Express): void {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
       const data = await proxyToEngine("/query", {
         method: "POST",
+        headers: tenantHeaders(req),
         body: JSON.stringify(req.body),
       });
       res.json(data);
@@ -127,6 +133,7 @@ export function registerBiEngineRoutes(app: Express): void {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
       const data = await proxyToEngine("/chart-data", {
         method: "POST",
+        headers: tenantHeaders(req),
         body: JSON.stringify(req.body),
       });
       res.json(data);
@@ -140,6 +147,7 @@ export function registerBiEngineRoutes(app: Express): void {
       if (!req.isAuthenticated()) return res.status(401).json({ error: "Not authenticated" });
       const data = await proxyToEngine("/micro-bi", {
         method: "POST",
+        headers: tenantHeaders(req),
         body: JSON.stringify(req.body),
       });
       res.json(data);
@@ -0,0 +1,332 @@
+"""
+Arcadia Admission Control - Isolamento de queries por tenant
+Controlador de admissao com weighted fair queuing na frente da execucao de
+queries: limite global de concorrencia, limite de concorrencia por tenant,
+rate limit (token bucket) por tenant, fila limitada com timeout e metricas
+de latencia/rejeicao por tenant.
+
+Todo o estado e manipulado no event loop (sem locks): acquire/release devem
+ser chamados a partir de corrotinas do mesmo loop.
+
+Os limites valem por processo: com uvicorn --workers N (o bi roda com 2)
+cada worker tem seu proprio controlador, entao os tetos efetivos do servico
+sao N vezes os configurados. O rate limit por tenant e opt-in
+(<PREFIX>_TENANT_RATE_LIMIT > 0); sem X-Tenant-Id/X-Api-Key todas as
+chamadas caem no tenant compartilhado "anonymous", que pode receber limites
+proprios em <PREFIX>_TENANT_OVERRIDES.
+
+O tenant vem de um header do cliente, entao o estado e as metricas por
+tenant sao limitados: tenants ociosos (nada em execucao nem na fila) saem da
+memoria apos <PREFIX>_TENANT_IDLE_SECONDS, e so os tenants de
+<PREFIX>_TENANT_OVERRIDES, "anonymous" e os primeiros
+<PREFIX>_TENANT_METRIC_LABELS tenants vistos ganham label proprio nas
+metricas; os demais sao agregados no label "other".
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+try:
+    from .instrumentation import Counter, Gauge, Histogram
+except ImportError:
+    from instrumentation import Counter, Gauge, Histogram
+
+ADMISSION_WAIT = Histogram(
+    "arcadia_admission_wait_seconds",
+    "Tempo em fila ate a admissao da query",
+    ("tenant",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+TENANT_QUERY_LATENCY = Histogram(
+    "arcadia_tenant_query_duration_seconds",
+    "Latencia de execucao das queries admitidas por tenant",
+    ("tenant", "endpoint"),
+)
+ADMISSION_REJECTED = Counter(
+    "arcadia_admission_rejected_total",
+    "Queries rejeitadas pelo controle de admissao",
+    ("tenant", "reason"),
+)
+TENANT_IN_FLIGHT = Gauge(
+    "arcadia_tenant_queries_in_flight",
+    "Queries em execucao por tenant",
+    ("tenant",),
+)
+TENANT_QUEUED = Gauge(
+    "arcadia_tenant_queries_queued",
+    "Queries aguardando admissao por tenant",
+    ("tenant",),
+)
+
+
+class TenantLimits:
+    def __init__(self, weight: float = 1.0, max_concurrent: int = 4, rate_per_sec: float = 0.0,
+                 burst: int = 20, max_queue: int = 200):
+        self.weight = max(float(weight), 0.01)
+        self.max_concurrent = max(int(max_concurrent), 1)
+        self.rate_per_sec = float(rate_per_sec)
+        self.burst = max(int(burst), 1)
+        self.max_queue = max(int(max_queue), 0)
+
+    def merged(self, overrides: Dict) -> "TenantLimits":
+        values = {**self.__dict__, **{k: v for k, v in overrides.items() if k in self.__dict__}}
+        return TenantLimits(**values)
+
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+
+class _TenantState:
+    def __init__(self, limits: TenantLimits):
+        self.limits = limits
+        self.active = 0
+        self.waiters: Deque[Tuple[float, float, asyncio.Future]] = deque()
+        self.last_finish = 0.0
+        self.tokens = float(limits.burst)
+        self.last_refill = time.monotonic()
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.total_wait = 0.0
+        self.last_used = time.monotonic()
+
+    def idle_for(self, now: float) -> Optional[float]:
+        """Segundos ocioso (None se ha queries em execucao ou na fila)."""
+        if self.active or self.waiters:
+            return None
+        return now - self.last_used
+
+    def take_token(self) -> Optional[float]:
+        """Consome um token; retorna None se permitido ou os segundos ate o proximo token."""
+        if self.limits.rate_per_sec <= 0:
+            return None
+        now = time.monotonic()
+        self.tokens = min(self.limits.burst, self.tokens + (now - self.last_refill) * self.limits.rate_per_sec)
+        self.last_refill = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        return (1 - self.tokens) / self.limits.rate_per_sec
+
+
+class AdmissionController:
+    OTHER_LABEL = "other"
+    SWEEP_INTERVAL_SECONDS = 60.0
+
+    def __init__(self, max_concurrent: int = 16, default_limits: Optional[TenantLimits] = None,
+                 overrides: Optional[Dict[str, Dict]] = None, queue_timeout: float = 15.0,
+                 tenant_idle_seconds: float = 600.0, max_metric_labels: int = 50):
+        self._max_concurrent = max(int(max_concurrent), 1)
+        self._default_limits = default_limits or TenantLimits()
+        self._overrides = overrides or {}
+        self._queue_timeout = queue_timeout
+        self._tenants: Dict[str, _TenantState] = {}
+        self._active_total = 0
+        self._queued_total = 0
+        self._virtual_time = 0.0
+        self._tenant_idle_seconds = max(float(tenant_idle_seconds), 0.0)
+        self._next_sweep = time.monotonic() + self.SWEEP_INTERVAL_SECONDS
+        self._evicted = 0
+        self._max_metric_labels = max(int(max_metric_labels), 0)
+        self._labelled = set(self._overrides) | {"anonymous"}
+        self._dynamic_labels = 0
+
+    @classmethod
+    def from_env(cls, prefix: str = "BI") -> "AdmissionController":
+        defaults = TenantLimits(
+            weight=1.0,
+            max_concurrent=int(os.environ.get(f"{prefix}_TENANT_MAX_CONCURRENT", "4")),
+            # 0 = sem rate limit por tenant (padrao); limites por worker do uvicorn
+            rate_per_sec=float(os.environ.get(f"{prefix}_TENANT_RATE_LIMIT", "0")),
+            burst=int(os.environ.get(f"{prefix}_TENANT_BURST", "20")),
+            max_queue=int(os.environ.get(f"{prefix}_TENANT_MAX_QUEUE", "200")),
+        )
+        try:
+            overrides = json.loads(os.environ.get(f"{prefix}_TENANT_OVERRIDES", "") or "{}")
+        except ValueError:
+            print(f"[Admission] {prefix}_TENANT_OVERRIDES invalido, ignorando")
+            overrides = {}
+        return cls(
+            max_concurrent=int(os.environ.get(f"{prefix}_MAX_CONCURRENT_QUERIES", "16")),
+            default_limits=defaults,
+            overrides={str(k): v for k, v in overrides.items()},
+            queue_timeout=float(os.environ.get(f"{prefix}_ADMISSION_QUEUE_TIMEOUT", "15")),
+            tenant_idle_seconds=float(os.environ.get(f"{prefix}_TENANT_IDLE_SECONDS", "600")),
+            max_metric_labels=int(os.environ.get(f"{prefix}_TENANT_METRIC_LABELS", "50")),
+        )
+
+    def _state(self, tenant: str) -> _TenantState:
+        state = self._tenants.get(tenant)
+        if state is None:
+            limits = self._default_limits.merged(self._overrides.get(tenant, {}))
+            state = self._tenants[tenant] = _TenantState(limits)
+        return state
+
+    def _label(self, tenant: str) -> str:
+        """Label de metrica do tenant; alem do limite, tenants novos caem em "other"."""
+        if tenant in self._labelled:
+            return tenant
+        if self._dynamic_labels < self._max_metric_labels:
+            self._labelled.add(tenant)
+            self._dynamic_labels += 1
+            return tenant
+        return self.OTHER_LABEL
+
+    def _evict_idle(self):
+        """Remove tenants ociosos ha mais que o TTL (no maximo uma varredura por minuto).
+
+        O TTL nunca e menor que o tempo de reposicao do token bucket: um tenant
+        removido voltaria com o bucket cheio, que e o estado em que ja estaria.
+        """
+        now = time.monotonic()
+        if not self._tenant_idle_seconds or now < self._next_sweep:
+            return
+        self._next_sweep = now + self.SWEEP_INTERVAL_SECONDS
+        for tenant, state in list(self._tenants.items()):
+            idle = state.idle_for(now)
+            if idle is None:
+                continue
+            limits = state.limits
+            refill = limits.burst / limits.rate_per_sec if limits.rate_per_sec > 0 else 0.0
+            if idle >= max(self._tenant_idle_seconds, refill):
+                del self._tenants[tenant]
+                self._evicted += 1
+
+    def _reject(self, tenant: str, state: _TenantState, reason: str, status: int, detail: str,
+                retry_after: float):
+        state.rejected[reason] = state.rejected.get(reason, 0) + 1
+        ADMISSION_REJECTED.labels(self._label(tenant), reason).inc()
+        raise HTTPException(status_code=status, detail=detail,
+                            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+    def _grant(self, tenant: str, state: _TenantState):
+        state.active += 1
+        state.admitted += 1
+        state.last_used = time.monotonic()
+        self._active_total += 1
+        TENANT_IN_FLIGHT.labels(self._label(tenant)).inc()
+
+    def _dispatch(self):
+        """Libera waiters em ordem de finish tag (WFQ) enquanto houver capacidade."""
+        while self._active_total < self._max_concurrent and self._queued_total:
+            best: Optional[Tuple[float, str, _TenantState]] = None
+            for tenant, state in self._tenants.items():
+                if state.waiters and state.active < state.limits.max_concurrent:
+                    finish = state.waiters[0][1]
+                    if best is None or finish < best[0]:
+                        best = (finish, tenant, state)
+            if best is None:
+                return
+            _, tenant, state = best
+            start_tag, _, fut = state.waiters.popleft()
+            self._queued_total -= 1
+            TENANT_QUEUED.labels(self._label(tenant)).dec()
+            self._virtual_time = max(self._virtual_time, start_tag)
+            self._grant(tenant, state)
+            fut.set_result(True)
+
+    def _forget_waiter(self, tenant: str, state: _TenantState, fut: asyncio.Future):
+        for i, waiter in enumerate(state.waiters):
+            if waiter[2] is fut:
+                del state.waiters[i]
+                self._queued_total -= 1
+                TENANT_QUEUED.labels(self._label(tenant)).dec()
+                return
+
+    async def acquire(self, tenant: str):
+        self._evict_idle()
+        state = self._state(tenant)
+
+        retry_after = state.take_token()
+        if retry_after is not None:
+            self._reject(tenant, state, "rate_limited", 429,
+                         f"Limite de requisicoes excedido para o tenant '{tenant}'", retry_after)
+
+        if (self._active_total < self._max_concurrent and state.active < state.limits.max_concurrent
+                and not self._queued_total):
+            self._grant(tenant, state)
+            ADMISSION_WAIT.labels(self._label(tenant)).observe(0.0)
+            return
+
+        if len(state.waiters) >= state.limits.max_queue:
+            self._reject(tenant, state, "queue_full", 429,
+                         f"Fila de queries cheia para o tenant '{tenant}'", 1.0)
+
+        start_tag = max(self._virtual_time, state.last_finish)
+        finish_tag = start_tag + 1.0 / state.limits.weight
+        state.last_finish = finish_tag
+        fut = asyncio.get_running_loop().create_future()
+        state.waiters.append((start_tag, finish_tag, fut))
+        self._queued_total += 1
+        TENANT_QUEUED.labels(self._label(tenant)).inc()
+        self._dispatch()
+
+        queued_at = time.perf_counter()
+        try:
+            done, _ = await asyncio.wait({fut}, timeout=self._queue_timeout)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(tenant)
+            else:
+                self._forget_waiter(tenant, state, fut)
+                fut.cancel()
+            raise
+
+        waited = time.perf_counter() - queued_at
+        if not done:
+            self._forget_waiter(tenant, state, fut)
+            fut.cancel()
+            self._reject(tenant, state, "queue_timeout", 503,
+                         f"Tempo de espera por execucao excedido ({self._queue_timeout}s)", self._queue_timeout)
+
+        state.total_wait += waited
+        ADMISSION_WAIT.labels(self._label(tenant)).observe(waited)
+
+    def release(self, tenant: str):
+        state = self._tenants[tenant]
+        state.active -= 1
+        state.last_used = time.monotonic()
+        self._active_total -= 1
+        TENANT_IN_FLIGHT.labels(self._label(tenant)).dec()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, endpoint: str = "query"):
+        await self.acquire(tenant)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            TENANT_QUERY_LATENCY.labels(self._label(tenant), endpoint).observe(time.perf_counter() - start)
+            self.release(tenant)
+
+    def stats(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "scope": "per_process",
+            "max_concurrent": self._max_concurrent,
+            "active": self._active_total,
+            "queued": self._queued_total,
+            "queue_timeout_seconds": self._queue_timeout,
+            "default_limits": self._default_limits.to_dict(),
+            "tenant_idle_seconds": self._tenant_idle_seconds,
+            "tenants_evicted": self._evicted,
+            "metric_labels": {"used": self._dynamic_labels, "max": self._max_metric_labels},
+            "tenants": {
+                tenant: {
+                    "limits": state.limits.to_dict(),
+                    "active": state.active,
+                    "queued": len(state.waiters),
+                    "admitted": state.admitted,
+                    "rejected": dict(state.rejected),
+                    "avg_wait_ms": round(state.total_wait / state.admitted * 1000, 2) if state.admitted else 0,
+                }
+                for tenant, state in self._tenants.items()
+            },
+        }
@@ -9,15 +9,21 @@ Porta padrao: 8005
 import os
 import json
 import time
+import asyncio
 import re
 import threading
 import hashlib
-from typing import Optional, List, Dict, Any
+import uuid
+import heapq
+import socket
+from typing import Optional, List, Dict, Any, Callable, Tuple, Union
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
 from enum import Enum
+from itertools import islice
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
@@ -28,6 +34,25 @@ try:
 except ImportError:
     HAS_PSYCOPG2 = False
 
+try:
+    from .instrumentation import Counter, Gauge, Histogram, instrument_app, track_db, track_http
+    from .cron import compile_cron
+    from .leader_election import LeaderElector
+    from .event_log import EventLog
+    from .http_pool import HAS_HTTPX, CircuitOpenError, HttpPool, ResponseTooLarge
+    from .db_pool import DbPool
+    from .execution_store import ExecutionStore, decode_cursor, encode_cursor, open_execution_store
+    from .work_queue import WorkQueue, open_work_queue
+except ImportError:
+    from instrumentation import Counter, Gauge, Histogram, instrument_app, track_db, track_http
+    from cron import compile_cron
+    from leader_election import LeaderElector
+    from event_log import EventLog
+    from http_pool import HAS_HTTPX, CircuitOpenError, HttpPool, ResponseTooLarge
+    from db_pool import DbPool
+    from execution_store import ExecutionStore, decode_cursor, encode_cursor, open_execution_store
+    from work_queue import WorkQueue, open_work_queue
+
 app = FastAPI(
     title="Arcadia Automation Engine",
     description="Motor de Automacao - Scheduler, Event Bus, Workflow Executor",
@@ -42,7 +67,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "automation-engine")
+
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
+MAX_EXECUTION_WAIT_SECONDS = 60.0
+MAX_QUERY_ROWS = 1000
 
 
 class EventType(str, Enum):
@@ -69,68 +98,55 @@ class WorkflowStepType(str, Enum):
     NOTIFY = "notify"
 
 
-class CronExpression:
-    def __init__(self, expr: str):
-        self.expr = expr.strip()
-        self.parts = self.expr.split()
-        if len(self.parts) != 5:
-            raise ValueError(f"Cron expression deve ter 5 partes: {expr}")
-
-    def _match_part(self, part: str, value: int, max_val: int) -> bool:
-        if part == "*":
-            return True
-        for item in part.split(","):
-            if "/" in item:
-                base, step = item.split("/")
-                base_val = 0 if base == "*" else int(base)
-                step_val = int(step)
-                if (value - base_val) % step_val == 0 and value >= base_val:
-                    return True
-            elif "-" in item:
-                low, high = item.split("-")
-                if int(low) <= value <= int(high):
-                    return True
-            else:
-                if int(item) == value:
-                    return True
-        return False
+class EventBus:
+    """Pub/sub de eventos com historico em ring buffers.
 
-    def matches(self, dt: datetime) -> bool:
-        return (
-            self._match_part(self.parts[0], dt.minute, 59) and
-            self._match_part(self.parts[1], dt.hour, 23) and
-            self._match_part(self.parts[2], dt.day, 31) and
-            self._match_part(self.parts[3], dt.month, 12) and
-            self._match_part(self.parts[4], dt.weekday(), 6)
-        )
+    O historico global e um deque limitado (append O(1)) e cada tipo de
+    evento tem o seu proprio ring, entao consultas por tipo custam O(limit).
+    """
 
-    def next_run(self, from_dt: datetime = None) -> datetime:
-        dt = from_dt or datetime.now()
-        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
-        for _ in range(525960):
-            if self.matches(dt):
-                return dt
-            dt += timedelta(minutes=1)
-        return dt
+    def __init__(self, max_history: int = 10000, max_history_per_type: int = 1000):
+        self._subscribers: Dict[str, List[Dict]] = defaultdict(list)
+        self._max_history = max(int(max_history), 1)
+        self._max_history_per_type = max(int(max_history_per_type), 1)
+        self._event_history: deque = deque(maxlen=self._max_history)
+        self._history_by_type: Dict[str, deque] = {}
+        self._dispatcher: Optional["EventDispatcher"] = None
+        self._log: Optional[EventLog] = None
 
+    def attach_log(self, log: Optional[EventLog]):
+        self._log = log
 
-class EventBus:
-    def __init__(self):
-        self._subscribers: Dict[str, List[Dict]] = defaultdict(list)
-        self._event_history: List[Dict] = []
-        self._max_history = 500
+    def attach_dispatcher(self, dispatcher: "EventDispatcher"):
+        self._dispatcher = dispatcher
+        dispatcher.attach_bus(self)
 
     def subscribe(self, event_type: str, handler_id: str, config: Dict = None):
+        """Assina handler_id em event_type; reassinar substitui a assinatura anterior."""
+        self.unsubscribe(event_type, handler_id)
         self._subscribers[event_type].append({
+            "event_type": event_type,
             "handler_id": handler_id,
             "config": config or {},
             "subscribed_at": datetime.now().isoformat(),
         })
 
     def unsubscribe(self, event_type: str, handler_id: str):
-        self._subscribers[event_type] = [
-            s for s in self._subscribers[event_type] if s["handler_id"] != handler_id
-        ]
+        subscribers = self._subscribers.get(event_type)
+        if not subscribers:
+            return
+        remaining = [s for s in subscribers if s["handler_id"] != handler_id]
+        if len(remaining) == len(subscribers):
+            return
+        if remaining:
+            self._subscribers[event_type] = remaining
+        else:
+            del self._subscribers[event_type]
+        if self._dispatcher is not None:
+            self._dispatcher.forget(event_type, handler_id)
+
+    def is_subscribed(self, event_type: str, handler_id: str) -> bool:
+        return any(s["handler_id"] == handler_id for s in self._subscribers.get(event_type, ()))
 
     def emit(self, event_type: str, payload: Dict = None) -> List[str]:
         event = {
@@ -139,16 +155,32 @@ class EventBus:
             "timestamp": datetime.now().isoformat(),
             "id": hashlib.sha256(f"{event_type}:{time.time()}".encode()).hexdigest()[:16],
         }
+        if self._log is not None:
+            try:
+                event["offset"] = self._log.append({"kind": "event", "ts": time.time(), "data": event})
+            except Exception as e:
+                print(f"[EventBus] Falha ao gravar evento no log: {e}")
+        self.record(event)
+
+        matched = self._subscribers.get(event_type, []) + self._subscribers.get("*", [])
+        if self._dispatcher is not None and matched:
+            self._dispatcher.submit(event, matched)
+        return [sub["handler_id"] for sub in matched]
+
+    def record(self, event: Dict):
+        """Adiciona o evento ao historico (sem gravar no log nem despachar)."""
         self._event_history.append(event)
-        if len(self._event_history) > self._max_history:
-            self._event_history = self._event_history[-self._max_history:]
-
-        triggered = []
-        for sub in self._subscribers.get(event_type, []):
-            triggered.append(sub["handler_id"])
-        for sub in self._subscribers.get("*", []):
-            triggered.append(sub["handler_id"])
-        return triggered
+        typed = self._history_by_type.get(event["type"])
+        if typed is None:
+            typed = self._history_by_type[event["type"]] = deque(maxlen=self._max_history_per_type)
+        typed.append(event)
+
+    def redeliver(self, event: Dict) -> List[str]:
+        """Reentrega um evento ja gravado aos assinantes atuais."""
+        matched = self._subscribers.get(event["type"], []) + self._subscribers.get("*", [])
+        if self._dispatcher is not None and matched:
+            self._dispatcher.submit(event, matched)
+        return [sub["handler_id"] for sub in matched]
 
     def get_subscribers(self, event_type: str = None) -> Dict:
         if event_type:
@@ -156,20 +188,31 @@ class EventBus:
         return dict(self._subscribers)
 
     def get_history(self, limit: int = 50, event_type: str = None) -> List[Dict]:
-        history = self._event_history
-        if event_type:
-            history = [e for e in history if e["type"] == event_type]
-        return history[-limit:]
+        history = self._history_by_type.get(event_type, ()) if event_type else self._event_history
+        if limit <= 0:
+            return []
+        recent = list(islice(reversed(history), limit))
+        recent.reverse()
+        return recent
 
     def stats(self) -> Dict:
         return {
             "total_event_types": len(self._subscribers),
             "total_subscribers": sum(len(v) for v in self._subscribers.values()),
             "history_size": len(self._event_history),
+            "history_capacity": self._max_history,
+            "history_capacity_per_type": self._max_history_per_type,
+            "history_types": len(self._history_by_type),
             "event_types": list(self._subscribers.keys()),
         }
 
 
+class MisfirePolicy(str, Enum):
+    FIRE_ONCE = "fire_once"
+    FIRE_ALL = "fire_all"
+    SKIP = "skip"
+
+
 class SchedulerEntry(BaseModel):
     id: str
     name: str
@@ -178,28 +221,104 @@ class SchedulerEntry(BaseModel):
     action: str = "trigger"
     config: Optional[Dict] = None
     is_active: bool = True
+    misfire_policy: MisfirePolicy = MisfirePolicy.FIRE_ONCE
+    misfire_grace_seconds: int = 60
     last_run: Optional[str] = None
     next_run: Optional[str] = None
     run_count: int = 0
+    missed_count: int = 0
 
 
 class Scheduler:
-    def __init__(self):
+    """Scheduler por fila de prioridade (heap) ordenada pelo proximo disparo.
+
+    A thread dorme exatamente ate o disparo mais proximo (ou ate ser acordada
+    por add/remove/stop), reagenda cada entrada em O(log n) e nunca dispara o
+    mesmo slot duas vezes: o proximo slot e sempre calculado a partir do slot
+    anterior. Entradas removidas ou substituidas ficam no heap com geracao
+    antiga e sao descartadas ao chegar no topo.
+
+    Com eleicao de lider em Postgres as entradas sao compartilhadas pelo banco
+    (LeaderElector.publish_entry/load_entries): qualquer replica grava as
+    alteracoes vindas da API e todas recarregam a tabela a cada
+    SYNC_INTERVAL_SECONDS. So o lider dispara, e apenas depois de uma recarga
+    feita ja no epoch atual, para retomar o progresso gravado pelo lider
+    anterior; cada disparo passa pelo fencing do LeaderElector (registro por
+    entry/slot condicionado ao epoch do lease).
+
+    Slots atrasados alem de misfire_grace_seconds (processo suspenso,
+    scheduler parado) seguem a misfire_policy da entrada:
+        fire_once  dispara uma vez pelos slots perdidos e segue do agora
+        fire_all   dispara cada slot perdido (ate MAX_CATCHUP), em ordem
+        skip       descarta os slots perdidos
+    """
+
+    MAX_CATCHUP = 100
+    MAX_SLEEP_SECONDS = 60.0
+    LEADER_POLL_SECONDS = 1.0
+    PROGRESS_FIELDS = {"last_run", "next_run", "run_count", "missed_count"}
+
+    def __init__(self, leader: LeaderElector, sync_interval: float = 5.0):
+        self._leader = leader
+        self._shared = not leader.local
+        self._sync_interval = max(float(sync_interval), 0.5)
+        self._synced_epoch: Optional[int] = None
+        self._synced_once = False
+        self._last_sync: Optional[str] = None
+        self._sync_wake = threading.Event()
+        self._sync_lock = threading.Lock()
         self._entries: Dict[str, SchedulerEntry] = {}
+        self._heap: List[tuple] = []
+        self._generations: Dict[str, int] = {}
+        self._slots: Dict[str, datetime] = {}
+        self._seq = 0
+        self._cond = threading.Condition()
         self._running = False
+        self._run_id = 0
         self._thread: Optional[threading.Thread] = None
-        self._check_interval = 30
-
-    def add(self, entry: SchedulerEntry):
+        self._fired_total = 0
+        self._misfired_total = 0
+        self._skipped_not_leader = 0
+
+    def _push(self, entry: SchedulerEntry, slot: datetime):
+        self._seq += 1
+        self._slots[entry.id] = slot
+        entry.next_run = slot.isoformat()
+        heapq.heappush(self._heap, (slot.timestamp(), self._seq, entry.id, self._generations[entry.id]))
+
+    def add(self, entry: SchedulerEntry, restore: bool = False):
+        """Agenda a entrada a partir de agora.
+
+        Com restore=True (entrada vinda do event log) retoma o next_run gravado:
+        se ele ficou para tras enquanto o servico estava parado, o slot vence
+        na hora e os slots perdidos seguem a misfire_policy da entrada.
+        """
         try:
-            cron = CronExpression(entry.cron)
-            entry.next_run = cron.next_run().isoformat()
+            cron = compile_cron(entry.cron)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
-        self._entries[entry.id] = entry
+        slot = None
+        if restore and entry.next_run:
+            try:
+                slot = datetime.fromisoformat(entry.next_run)
+            except ValueError:
+                print(f"[Scheduler] next_run invalido em {entry.id}: {entry.next_run}")
+        if slot is None:
+            slot = cron.next_run()
+        with self._cond:
+            self._entries[entry.id] = entry
+            self._generations[entry.id] = self._generations.get(entry.id, 0) + 1
+            self._slots.pop(entry.id, None)
+            if entry.is_active:
+                self._push(entry, slot)
+            self._cond.notify()
 
     def remove(self, entry_id: str):
-        self._entries.pop(entry_id, None)
+        with self._cond:
+            if self._entries.pop(entry_id, None) is not None:
+                self._generations[entry_id] += 1
+                self._slots.pop(entry_id, None)
+                self._cond.notify()
 
     def get(self, entry_id: str) -> Optional[SchedulerEntry]:
         return self._entries.get(entry_id)
@@ -208,52 +327,209 @@ class Scheduler:
         return list(self._entries.values())
 
     def start(self):
-        if self._running:
-            return
-        self._running = True
-        self._thread = threading.Thread(target=self._run_loop, daemon=True)
-        self._thread.start()
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._run_id += 1
+            self._thread = threading.Thread(target=self._run_loop, args=(self._run_id,), daemon=True)
+            self._thread.start()
+            if self._shared:
+                self._sync_wake.clear()
+                threading.Thread(target=self._sync_loop, args=(self._run_id,), daemon=True).start()
 
     def stop(self):
-        self._running = False
-
-    def _run_loop(self):
-        while self._running:
-            now = datetime.now()
-            for entry_id, entry in list(self._entries.items()):
-                if not entry.is_active:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._sync_wake.set()
+
+    # --- entradas compartilhadas entre replicas ---
+
+    def config_of(self, entry: SchedulerEntry) -> Dict:
+        """Campos de configuracao da entrada (sem o progresso), normalizados como JSON."""
+        return json.loads(json.dumps(entry.dict(exclude=self.PROGRESS_FIELDS), default=str))
+
+    def update(self, entry_id: str, entry: Optional[SchedulerEntry]):
+        """Publica a alteracao (entry None = remocao) para as outras replicas e a aplica aqui.
+
+        A publicacao vem antes e levanta em erro de banco, sem alterar o heap.
+        Em modo local equivale a add/remove.
+        """
+        with self._sync_lock:
+            self._leader.publish_entry(entry_id, self.config_of(entry) if entry is not None else None)
+            if entry is None:
+                self.remove(entry_id)
+            else:
+                self.add(entry)
+
+    def sync_shared(self):
+        """Recarrega as entradas do banco e aplica as diferencas ao heap local.
+
+        Seguidores espelham tambem o progresso do lider. O lider, depois da
+        primeira recarga no seu epoch, so aplica mudancas de configuracao: o
+        progresso gravado e o dele mesmo e pode estar atras do heap local.
+        """
+        with self._sync_lock:
+            epoch = self._leader.epoch if self._leader.is_leader() else None
+            rows = self._leader.load_entries()
+            owns_progress = epoch is not None and self._synced_epoch == epoch
+            shared_ids = set()
+            for entry_id, config, progress in rows:
+                shared_ids.add(entry_id)
+                current = self._entries.get(entry_id)
+                if config is None:
+                    if current is not None:
+                        self.remove(entry_id)
+                        persist_state("scheduler", entry_id, None)
+                    continue
+                if current is not None and self.config_of(current) == config:
+                    if progress is None or owns_progress or current.next_run == progress.get("next_run"):
+                        continue
+                try:
+                    entry = SchedulerEntry(**{**config, **(progress or {})})
+                    self.add(entry, restore=progress is not None)
+                except Exception as e:
+                    print(f"[Scheduler] Entrada compartilhada {entry_id} ignorada: {e}")
+                    continue
+                persist_state("scheduler", entry_id, entry.dict())
+
+            if not self._synced_once:
+                # Entradas do event log local anteriores ao modo compartilhado
+                for entry in self.list_all():
+                    if entry.id not in shared_ids:
+                        self._leader.publish_entry(entry.id, self.config_of(entry))
+                self._synced_once = True
+            with self._cond:
+                self._synced_epoch = epoch
+                self._last_sync = datetime.now().isoformat()
+                self._cond.notify()
+
+    def _sync_loop(self, run_id: int):
+        while self._running and self._run_id == run_id:
+            try:
+                self.sync_shared()
+            except Exception as e:
+                print(f"[Scheduler] Falha ao recarregar entradas compartilhadas: {e}")
+            self._sync_wake.wait(self._sync_interval)
+
+    def _may_fire(self) -> bool:
+        if not self._leader.is_leader():
+            return False
+        return not self._shared or self._synced_epoch == self._leader.epoch
+
+    def _pop_due(self, run_id: int) -> Optional[Tuple[SchedulerEntry, List[tuple]]]:
+        """Espera o proximo slot vencido e retorna a entrada e os disparos a emitir (None = parar)."""
+        with self._cond:
+            while self._running and self._run_id == run_id:
+                while self._heap and self._heap[0][3] != self._generations.get(self._heap[0][2]):
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._cond.wait(min(delay, self.MAX_SLEEP_SECONDS))
+                    continue
+                if not self._may_fire():
+                    # Seguidor (ou lider ainda sem recarga no epoch): mantem o
+                    # slot no heap para aplicar a misfire_policy se assumir
+                    self._cond.wait(self.LEADER_POLL_SECONDS)
+                    continue
+                _, _, entry_id, _ = heapq.heappop(self._heap)
+                entry = self._entries[entry_id]
+                return entry, self._reschedule(entry, datetime.now())
+            return None
+
+    def _reschedule(self, entry: SchedulerEntry, now: datetime) -> List[tuple]:
+        """Aplica a politica de misfire ao slot vencido e agenda o proximo."""
+        cron = compile_cron(entry.cron)
+        slot = self._slots.pop(entry.id)
+        fires = []
+        if (now - slot).total_seconds() <= entry.misfire_grace_seconds:
+            fires.append((entry, slot, 0))
+            next_slot = cron.next_run(slot)
+        else:
+            missed = [slot]
+            while len(missed) <= self.MAX_CATCHUP:
+                following = cron.next_run(missed[-1])
+                if following > now:
+                    break
+                missed.append(following)
+            if entry.misfire_policy == MisfirePolicy.FIRE_ALL and len(missed) <= self.MAX_CATCHUP:
+                # Os slots seguintes tambem estao vencidos e saem do heap em sequencia
+                missed = missed[:1]
+                fires.append((entry, slot, 1))
+                next_slot = cron.next_run(slot)
+            elif entry.misfire_policy == MisfirePolicy.SKIP:
+                next_slot = cron.next_run(now)
+            else:
+                fires.append((entry, missed[-1], len(missed)))
+                next_slot = cron.next_run(now)
+            entry.missed_count += len(missed)
+            self._misfired_total += len(missed)
+        self._push(entry, next_slot)
+        return fires
+
+    def _run_loop(self, run_id: int):
+        while True:
+            popped = self._pop_due(run_id)
+            if popped is None:
+                return
+            entry, fires = popped
+            for _, slot, missed in fires:
+                if not self._leader.fence_fire(entry.id, slot):
+                    self._skipped_not_leader += 1
                     continue
+                entry.last_run = datetime.now().isoformat()
+                entry.run_count += 1
+                self._fired_total += 1
                 try:
-                    cron = CronExpression(entry.cron)
-                    if cron.matches(now):
-                        entry.last_run = now.isoformat()
-                        entry.run_count += 1
-                        entry.next_run = cron.next_run(now).isoformat()
-                        event_bus.emit(EventType.SCHEDULE_FIRED, {
-                            "scheduler_id": entry.id,
-                            "automation_id": entry.automation_id,
-                            "name": entry.name,
-                        })
+                    event_bus.emit(EventType.SCHEDULE_FIRED, {
+                        "scheduler_id": entry.id,
+                        "automation_id": entry.automation_id,
+                        "name": entry.name,
+                        "scheduled_for": slot.isoformat(),
+                        "missed_runs": missed,
+                        "leader_epoch": self._leader.epoch,
+                    })
                 except Exception as e:
-                    print(f"[Scheduler] Error checking {entry_id}: {e}")
-            time.sleep(self._check_interval)
+                    print(f"[Scheduler] Error firing {entry.id}: {e}")
+            # Grava next_run/last_run a cada slot para a restauracao retomar daqui;
+            # sob o lock para nao ressuscitar uma entrada removida nesse meio tempo
+            with self._cond:
+                live = self._entries.get(entry.id) is entry
+                if live:
+                    persist_state("scheduler", entry.id, entry.dict())
+            if live and self._shared:
+                self._leader.record_progress(entry.id, {field: getattr(entry, field) for field in self.PROGRESS_FIELDS})
 
     def stats(self) -> Dict:
-        active = sum(1 for e in self._entries.values() if e.is_active)
-        return {
-            "total_entries": len(self._entries),
-            "active_entries": active,
-            "is_running": self._running,
-            "check_interval_seconds": self._check_interval,
-        }
+        with self._cond:
+            active = sum(1 for e in self._entries.values() if e.is_active)
+            upcoming = min(self._slots.values()) if self._slots else None
+            return {
+                "total_entries": len(self._entries),
+                "active_entries": active,
+                "is_running": self._running,
+                "next_fire_at": upcoming.isoformat() if upcoming else None,
+                "heap_size": len(self._heap),
+                "fired_total": self._fired_total,
+                "misfired_total": self._misfired_total,
+                "skipped_not_leader": self._skipped_not_leader,
+                "is_leader": self._leader.is_leader(),
+                "shared_entries": self._shared,
+                "synced_epoch": self._synced_epoch,
+                "last_sync": self._last_sync,
+            }
 
 
 class WorkflowStep(BaseModel):
     id: str
     type: str
     config: Dict = {}
-    on_success: Optional[str] = None
-    on_failure: Optional[str] = None
+    on_success: Optional[Union[str, List[str]]] = None
+    on_failure: Optional[Union[str, List[str]]] = None
 
 
 class WorkflowDefinition(BaseModel):
@@ -270,17 +546,218 @@ class WorkflowExecution(BaseModel):
     variables: Optional[Dict] = None
 
 
+def resolve_variable(path: str, variables: Dict) -> Any:
+    """Le "nome" ou "nome.campo.0" das variaveis; KeyError se nao existir."""
+    current: Any = variables
+    for part in path.split("."):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        elif isinstance(current, (list, tuple)) and part.isdigit() and int(part) < len(current):
+            current = current[int(part)]
+        else:
+            raise KeyError(f"Variavel nao encontrada: {path}")
+    return current
+
+
+def resolve_params(params: Any, variables: Dict) -> Any:
+    """Resolve referencias "$var" em parametros de query ("$$" escapa um "$" literal)."""
+    def resolve(value):
+        if isinstance(value, str) and value.startswith("$"):
+            if value.startswith("$$"):
+                return value[1:]
+            return resolve_variable(value[1:], variables)
+        return value
+
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: resolve(value) for key, value in params.items()}
+    if isinstance(params, list):
+        return [resolve(value) for value in params]
+    raise TypeError("params deve ser objeto ou lista")
+
+
+def _edge_targets(value: Union[str, List[str], None]) -> List[str]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+class WorkflowGraph:
+    """DAG de um workflow, compilado uma vez no register.
+
+    Sem on_success/on_failure em nenhum passo, os passos formam uma cadeia
+    na ordem da lista (comportamento historico). Com arestas declaradas, o
+    grafo e explicito:
+        - on_success: passos liberados quando este termina com sucesso; um
+          passo com varios predecessores espera todos (join)
+        - on_failure: passos de compensacao, executados quando este falha
+          (excecao, resultado com "error" ou condicao falsa)
+        - passos sem predecessores sao raizes e iniciam juntos
+    Ciclos e destinos inexistentes sao rejeitados com ValueError.
+    """
+
+    def __init__(self, workflow: "WorkflowDefinition"):
+        self.steps: Dict[str, WorkflowStep] = {}
+        for step in workflow.steps:
+            if step.id in self.steps:
+                raise ValueError(f"Passo duplicado no workflow '{workflow.id}': {step.id}")
+            self.steps[step.id] = step
+
+        self.explicit = any(step.on_success or step.on_failure for step in workflow.steps)
+        self.success_next: Dict[str, List[str]] = {sid: [] for sid in self.steps}
+        self.failure_next: Dict[str, List[str]] = {sid: [] for sid in self.steps}
+        if self.explicit:
+            for step in workflow.steps:
+                for edges, targets in ((self.success_next, step.on_success), (self.failure_next, step.on_failure)):
+                    for target in _edge_targets(targets):
+                        if target not in self.steps:
+                            raise ValueError(f"Passo '{step.id}' aponta para passo inexistente: {target}")
+                        if target not in edges[step.id]:
+                            edges[step.id].append(target)
+        else:
+            ids = list(self.steps)
+            for prev, nxt in zip(ids, ids[1:]):
+                self.success_next[prev].append(nxt)
+
+        self.success_prev: Dict[str, List[str]] = {sid: [] for sid in self.steps}
+        self.failure_prev: Dict[str, List[str]] = {sid: [] for sid in self.steps}
+        for sid in self.steps:
+            for target in self.success_next[sid]:
+                self.success_prev[target].append(sid)
+            for target in self.failure_next[sid]:
+                self.failure_prev[target].append(sid)
+
+        self.order = self._topological_order(workflow.id)
+        self.roots = [sid for sid in self.order if not self.success_prev[sid] and not self.failure_prev[sid]]
+        self.depth: Dict[str, int] = {}
+        for sid in self.order:
+            preds = self.success_prev[sid] + self.failure_prev[sid]
+            self.depth[sid] = 1 + max((self.depth[p] for p in preds), default=-1)
+
+        # Passos alcancaveis a partir das raizes so por arestas de sucesso;
+        # os demais so rodam como compensacao.
+        happy = set(self.roots)
+        for sid in self.order:
+            if sid in happy:
+                happy.update(self.success_next[sid])
+        self.compensation = [sid for sid in self.order if sid not in happy]
+
+    def _topological_order(self, workflow_id: str) -> List[str]:
+        indegree = {sid: len(self.success_prev[sid]) + len(self.failure_prev[sid]) for sid in self.steps}
+        ready = deque(sid for sid in self.steps if indegree[sid] == 0)
+        order = []
+        while ready:
+            sid = ready.popleft()
+            order.append(sid)
+            for target in self.success_next[sid] + self.failure_next[sid]:
+                indegree[target] -= 1
+                if indegree[target] == 0:
+                    ready.append(target)
+        if len(order) != len(self.steps):
+            cyclic = [sid for sid in self.steps if indegree[sid] > 0]
+            raise ValueError(f"Ciclo no workflow '{workflow_id}' envolvendo: {', '.join(cyclic)}")
+        return order
+
+    def outcome(self, step: WorkflowStep, result: Any) -> str:
+        """Classifica o resultado de um passo: completed, error ou false."""
+        if not self.explicit or not isinstance(result, dict):
+            return "completed"
+        if result.get("error"):
+            return "error"
+        if step.type == WorkflowStepType.CONDITION and result.get("result") is False:
+            return "false"
+        return "completed"
+
+    def describe(self) -> Dict:
+        return {
+            "mode": "graph" if self.explicit else "linear",
+            "order": self.order,
+            "roots": self.roots,
+            "compensation": self.compensation,
+            "depth": max(self.depth.values(), default=-1) + 1,
+            "edges": {
+                sid: {"on_success": self.success_next[sid], "on_failure": self.failure_next[sid]}
+                for sid in self.order
+            },
+        }
+
+
+class StepExecutionError(RuntimeError):
+    """Falha de um passo composto (parallel/loop) que carrega o registro parcial."""
+
+    def __init__(self, message: str, result: Dict):
+        super().__init__(message)
+        self.result = result
+
+
 class WorkflowExecutor:
-    def __init__(self):
+    """Executa workflows no event loop sem bloquea-lo.
+
+    submit() cria a execucao, agenda uma task e retorna imediatamente; o
+    cliente acompanha pelo id (GET /executions/{id}, com long-poll opcional).
+    Delays viram asyncio.sleep e passos de I/O (SQL, HTTP) rodam em threads
+    via asyncio.to_thread. max_concurrent limita as execucoes em andamento;
+    as demais ficam com status "queued".
+
+    Com work queue, a API nao executa nada: _run enfileira a execucao (com a
+    definicao do workflow) e aguarda collect_queue() recolher o resultado
+    gravado por um processo worker (automation_worker.py). defer_events=True
+    (usado pelos workers) faz o passo emit_event apenas registrar o evento
+    em execution["deferred_events"], inclusive dentro de parallel e loop, e a
+    API emite essa lista ao recolher a execucao.
+    """
+
+    def __init__(self, max_concurrent: int = 1000, max_executions: int = 5000,
+                 store: Optional[ExecutionStore] = None, queue: Optional[WorkQueue] = None,
+                 instance_id: str = "", defer_events: bool = False):
         self._workflows: Dict[str, WorkflowDefinition] = {}
-        self._executions: List[Dict] = []
-        self._max_executions = 200
+        self._executions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._max_executions = max(int(max_executions), 1)
+        self._max_concurrent = max(int(max_concurrent), 1)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._active: Dict[str, Dict] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._graphs: Dict[str, WorkflowGraph] = {}
+        self._store = store
+        self._status_totals: Dict[str, int] = defaultdict(int)
+        self._running = 0
+        self._queue = queue
+        self._instance_id = instance_id or "local"
+        self._defer_events = defer_events
+        self._remote: Dict[str, asyncio.Future] = {}
+
+    @property
+    def store(self) -> Optional[ExecutionStore]:
+        return self._store
+
+    @property
+    def queue(self) -> Optional[WorkQueue]:
+        return self._queue
+
+    def load_counters(self):
+        """Carrega os totais por status do execution store (bloqueante)."""
+        if self._store is None:
+            return
+        self._store.flush()
+        totals: Dict[str, int] = defaultdict(int)
+        for by_status in self._store.counters().values():
+            for status, total in by_status.items():
+                totals[status] += total
+        self._status_totals = totals
 
     def register(self, workflow: WorkflowDefinition):
+        """Compila o DAG do workflow; levanta ValueError se o grafo for invalido."""
+        graph = WorkflowGraph(workflow)
         self._workflows[workflow.id] = workflow
+        self._graphs[workflow.id] = graph
 
     def unregister(self, workflow_id: str):
         self._workflows.pop(workflow_id, None)
+        self._graphs.pop(workflow_id, None)
+
+    def graph(self, workflow_id: str) -> Optional[WorkflowGraph]:
+        return self._graphs.get(workflow_id)
 
     def get(self, workflow_id: str) -> Optional[WorkflowDefinition]:
         return self._workflows.get(workflow_id)
@@ -288,18 +765,17 @@ class WorkflowExecutor:
     def list_all(self) -> List[WorkflowDefinition]:
         return list(self._workflows.values())
 
-    def execute(self, workflow_id: str, trigger_data: Dict = None, variables: Dict = None) -> Dict:
+    def _new_execution(self, workflow_id: str, trigger_data: Dict = None, variables: Dict = None) -> Dict:
         workflow = self._workflows.get(workflow_id)
         if not workflow:
             raise HTTPException(status_code=404, detail=f"Workflow '{workflow_id}' nao encontrado")
-
-        exec_id = hashlib.sha256(f"{workflow_id}:{time.time()}".encode()).hexdigest()[:16]
         execution = {
-            "id": exec_id,
+            "id": uuid.uuid4().hex[:16],
             "workflow_id": workflow_id,
             "workflow_name": workflow.name,
-            "status": "running",
-            "started_at": datetime.now().isoformat(),
+            "status": "queued",
+            "submitted_at": datetime.now().isoformat(),
+            "started_at": None,
             "completed_at": None,
             "steps_completed": 0,
             "steps_total": len(workflow.steps),
@@ -307,55 +783,482 @@ class WorkflowExecutor:
             "error": None,
             "variables": {**(workflow.variables or {}), **(variables or {}), **(trigger_data or {})},
         }
+        self._active[execution["id"]] = execution
+        return execution
+
+    def submit(self, workflow_id: str, trigger_data: Dict = None, variables: Dict = None) -> Dict:
+        """Agenda a execucao no event loop corrente e retorna sem esperar."""
+        execution = self._new_execution(workflow_id, trigger_data, variables)
+        task = asyncio.get_running_loop().create_task(self._run(execution))
+        self._tasks[execution["id"]] = task
+        task.add_done_callback(lambda _, exec_id=execution["id"]: self._tasks.pop(exec_id, None))
+        return execution
+
+    async def execute(self, workflow_id: str, trigger_data: Dict = None, variables: Dict = None) -> Dict:
+        """Executa e aguarda o termino (usado pelo dispatcher de eventos)."""
+        return await self._run(self._new_execution(workflow_id, trigger_data, variables))
+
+    async def wait(self, exec_id: str, timeout: float) -> Optional[Dict]:
+        task = self._tasks.get(exec_id)
+        if task is not None and timeout > 0:
+            await asyncio.wait({task}, timeout=timeout)
+        execution = self.get_execution(exec_id)
+        if execution is None and self._store is not None:
+            execution = await asyncio.to_thread(self._store.get, exec_id)
+        return execution
 
+    def get_execution(self, exec_id: str) -> Optional[Dict]:
+        """Execucao em andamento ou recente (memoria); o historico completo fica no store."""
+        return self._active.get(exec_id) or self._executions.get(exec_id)
+
+    def record(self, execution: Dict, restored: bool = False):
+        """Guarda a execucao concluida no cache recente e no execution store.
+
+        restored=True (replay do event log) nao soma nos contadores quando ha
+        store: eles sao recarregados dele, que ignora ids ja gravados.
+        """
+        self._executions[execution["id"]] = execution
+        while len(self._executions) > self._max_executions:
+            self._executions.popitem(last=False)
+        if self._store is not None:
+            self._store.put(execution)
+        if self._store is None or not restored:
+            self._status_totals[execution["status"]] += 1
+
+    async def _run(self, execution: Dict) -> Dict:
+        if self._queue is not None:
+            await self._run_queued(execution)
+        else:
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(self._max_concurrent)
+            async with self._slots:
+                await self.run_execution(execution, self._graphs.get(execution["workflow_id"]))
+
+        if self._store is None:
+            persist_state("execution", None, execution)
+        self.record(execution)
+        self._active.pop(execution["id"], None)
+
+        return execution
+
+    async def run_execution(self, execution: Dict, graph: Optional[WorkflowGraph]) -> Dict:
+        """Roda o DAG e preenche status/erro da execucao, sem registra-la."""
+        self._running += 1
+        execution["status"] = "running"
+        execution["started_at"] = datetime.now().isoformat()
         try:
-            for i, step in enumerate(workflow.steps):
-                step_result = self._execute_step(step, execution["variables"])
-                execution["results"].append({
-                    "step_id": step.id,
-                    "type": step.type,
-                    "status": "completed",
-                    "result": step_result,
-                    "executed_at": datetime.now().isoformat(),
-                })
-                execution["steps_completed"] = i + 1
-
-                if isinstance(step_result, dict):
-                    execution["variables"].update(step_result.get("output", {}))
-
-            execution["status"] = "completed"
+            if graph is None:
+                raise RuntimeError(f"Workflow '{execution['workflow_id']}' removido antes da execucao")
+            compensated = await self._run_graph(execution, graph)
+            if compensated:
+                execution["status"] = "compensated"
+                execution["compensated_steps"] = compensated
+            else:
+                execution["status"] = "completed"
             execution["completed_at"] = datetime.now().isoformat()
         except Exception as e:
             execution["status"] = "error"
             execution["error"] = str(e)
             execution["completed_at"] = datetime.now().isoformat()
-
-        self._executions.append(execution)
-        if len(self._executions) > self._max_executions:
-            self._executions = self._executions[-self._max_executions:]
-
+        finally:
+            self._running -= 1
         return execution
 
-    def _execute_step(self, step: WorkflowStep, variables: Dict) -> Any:
+    async def _run_queued(self, execution: Dict):
+        """Enfileira na work queue e espera o resultado recolhido por collect_queue."""
+        future = asyncio.get_running_loop().create_future()
+        self._remote[execution["id"]] = future
+        try:
+            workflow = self._workflows.get(execution["workflow_id"])
+            if workflow is None:
+                raise RuntimeError(f"Workflow '{execution['workflow_id']}' removido antes da execucao")
+            payload = {"execution": execution, "workflow": workflow.dict()}
+            await asyncio.to_thread(self._queue.enqueue, execution["id"], execution["workflow_id"],
+                                    self._instance_id, payload)
+            finished = await future
+        except Exception as e:
+            finished = {"status": "error", "error": str(e), "completed_at": datetime.now().isoformat()}
+        finally:
+            self._remote.pop(execution["id"], None)
+        execution.update(finished)
+
+    async def collect_queue(self, interval: float = 0.2, batch: int = 500):
+        """Loop da API: recolhe as execucoes concluidas pelos workers."""
+        while True:
+            try:
+                rows = await asyncio.to_thread(self._queue.collect, self._instance_id, batch)
+            except Exception as e:
+                print(f"[WorkQueue] Falha ao recolher execucoes: {e}")
+                rows = []
+            for row in rows:
+                self._finish_queued(row)
+            if len(rows) < batch:
+                await asyncio.sleep(interval)
+
+    def _finish_queued(self, row: Dict):
+        finished = row["result"]
+        if finished is None:
+            finished = {
+                **row["payload"]["execution"],
+                "status": "error",
+                "error": f"Execucao abandonada apos {row['attempts']} tentativas sem heartbeat do worker",
+                "worker_id": row["worker_id"],
+                "completed_at": datetime.now().isoformat(),
+            }
+        deferred = finished.pop("deferred_events", None)
+        if deferred is None:
+            # Resultado de um worker anterior a deferred_events: so o nivel superior
+            deferred = [entry["result"] for entry in finished.get("results", [])
+                        if isinstance(entry.get("result"), dict) and entry["result"].get("deferred")]
+        for event in deferred:
+            event_bus.emit(event["event_type"], event.get("payload", {}))
+        future = self._remote.get(row["id"])
+        if future is not None and not future.done():
+            future.set_result(finished)
+        else:
+            # Enfileirada por uma instancia anterior da API com o mesmo instance_id
+            self.record(finished)
+
+    async def _run_graph(self, execution: Dict, graph: WorkflowGraph) -> List[str]:
+        """Executa o DAG: cada passo inicia assim que suas dependencias resolvem.
+
+        Ramos independentes rodam concorrentemente, entao a duracao total e a
+        do caminho critico. Uma falha sem on_failure interrompe o workflow
+        (nao inicia novos passos, aguarda os que ja estao rodando) e levanta
+        RuntimeError; falhas com on_failure disparam a compensacao. Retorna
+        os passos cujas falhas foram compensadas.
+        """
+        status: Dict[str, str] = {}
+        running: Dict[asyncio.Task, tuple] = {}
+        compensated: List[str] = []
+        failure: Optional[tuple] = None
+
+        def decide(sid: str) -> Optional[str]:
+            success_prev, failure_prev = graph.success_prev[sid], graph.failure_prev[sid]
+            if any(status.get(p) in ("error", "false") for p in failure_prev):
+                return "run"
+            if not success_prev and not failure_prev:
+                return "run"
+            if success_prev and all(status.get(p) == "completed" for p in success_prev):
+                return "run"
+            blocked = not success_prev or any(status.get(p) in ("error", "false", "skipped") for p in success_prev)
+            if blocked and all(p in status for p in failure_prev):
+                return "skip"
+            return None
+
+        def start(sid: str):
+            step = graph.steps[sid]
+            task = asyncio.create_task(self._execute_step(step, dict(execution["variables"]), execution))
+            running[task] = (sid, time.perf_counter(), datetime.now().isoformat())
+
+        def skip(sid: str):
+            status[sid] = "skipped"
+            step = graph.steps[sid]
+            execution["results"].append({"step_id": sid, "type": step.type, "status": "skipped"})
+
+        def settle(sid: str):
+            pending = [sid]
+            while pending:
+                current = pending.pop()
+                for target in graph.success_next[current] + graph.failure_next[current]:
+                    if target in status or any(target == info[0] for info in running.values()):
+                        continue
+                    decision = decide(target)
+                    if decision == "run" and failure is None:
+                        start(target)
+                    elif decision == "skip":
+                        skip(target)
+                        pending.append(target)
+
+        for sid in graph.roots:
+            start(sid)
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    sid, started, started_at = running.pop(task)
+                    step = graph.steps[sid]
+                    error = None
+                    try:
+                        result = task.result()
+                        outcome = graph.outcome(step, result)
+                        if outcome == "error":
+                            error = str(result["error"])
+                    except StepExecutionError as e:
+                        result, outcome, error = e.result, "error", str(e)
+                    except Exception as e:
+                        result, outcome, error = None, "error", str(e)
+
+                    entry = {
+                        "step_id": sid,
+                        "type": step.type,
+                        "status": outcome,
+                        "result": result,
+                        "started_at": started_at,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                        "executed_at": datetime.now().isoformat(),
+                    }
+                    if error is not None:
+                        entry["error"] = error
+                    execution["results"].append(entry)
+                    status[sid] = outcome
+
+                    if outcome == "completed":
+                        execution["steps_completed"] += 1
+                        if isinstance(result, dict):
+                            execution["variables"].update(result.get("output", {}))
+                    elif outcome == "error":
+                        if graph.failure_next[sid]:
+                            compensated.append(sid)
+                            execution["variables"]["last_error"] = {"step_id": sid, "error": error}
+                        elif failure is None:
+                            failure = (sid, error)
+                    settle(sid)
+        except asyncio.CancelledError:
+            for task in running:
+                task.cancel()
+            raise
+
+        if failure is not None:
+            for sid in graph.order:
+                if sid not in status:
+                    skip(sid)
+            execution["failed_step"] = failure[0]
+            raise RuntimeError(failure[1])
+        return compensated
+
+    async def _execute_step(self, step: WorkflowStep, variables: Dict, execution: Dict) -> Any:
         if step.type == WorkflowStepType.CONDITION:
             return self._exec_condition(step.config, variables)
         elif step.type == WorkflowStepType.ACTION:
-            return self._exec_action(step.config, variables)
+            return self._exec_action(step.config, variables, execution)
         elif step.type == WorkflowStepType.DELAY:
             delay_seconds = step.config.get("seconds", 1)
-            time.sleep(min(delay_seconds, 30))
+            await asyncio.sleep(min(float(delay_seconds), 30))
             return {"delayed": delay_seconds}
         elif step.type == WorkflowStepType.SQL_QUERY:
-            return self._exec_query(step.config, variables)
+            return await asyncio.to_thread(self._exec_query, step.config, variables)
         elif step.type == WorkflowStepType.HTTP_REQUEST:
-            return self._exec_http(step.config, variables)
+            if HAS_HTTPX:
+                return await self._exec_http_pooled(step.config, variables)
+            return await asyncio.to_thread(self._exec_http, step.config, variables)
         elif step.type == WorkflowStepType.TRANSFORM:
             return self._exec_transform(step.config, variables)
         elif step.type == WorkflowStepType.NOTIFY:
             return {"notified": True, "message": step.config.get("message", ""), "channel": step.config.get("channel", "system")}
+        elif step.type == WorkflowStepType.PARALLEL:
+            return await self._exec_parallel(step, variables, execution)
+        elif step.type == WorkflowStepType.LOOP:
+            return await self._exec_loop(step, variables, execution)
         else:
             return {"type": step.type, "status": "unknown_step_type"}
 
+    # --- passos compostos (fan-out / fan-in) ---
+
+    @staticmethod
+    def _child_steps(raw: Any, where: str) -> List[WorkflowStep]:
+        if not isinstance(raw, list):
+            raise ValueError(f"{where}: esperada uma lista de passos")
+        return [s if isinstance(s, WorkflowStep) else WorkflowStep(**s) for s in raw]
+
+    async def _run_branch(self, name: Any, steps: List[WorkflowStep], scope: Dict,
+                          timeout: Optional[float], execution: Dict) -> Dict:
+        """Executa uma lista de passos em sequencia sobre o escopo do ramo.
+
+        scope pertence ao ramo (o chamador ja o copiou) e recebe as saidas dos
+        passos. Nunca levanta excecao: o resultado (ok/erro/timeout) e a
+        duracao ficam no registro retornado, que vai para o historico da execucao.
+        """
+        record = {"branch": name, "status": "running", "steps": []}
+        output: Dict = {}
+
+        async def run_steps():
+            for child in steps:
+                result = await self._execute_step(child, scope, execution)
+                record["steps"].append({"step_id": child.id, "type": child.type, "result": result})
+                if isinstance(result, dict):
+                    step_output = result.get("output", {})
+                    scope.update(step_output)
+                    output.update(step_output)
+
+        record["started_at"] = datetime.now().isoformat()
+        started = time.perf_counter()
+        try:
+            if timeout:
+                await asyncio.wait_for(run_steps(), timeout)
+            else:
+                await run_steps()
+            record["status"] = "completed"
+        except asyncio.TimeoutError:
+            record["status"] = "timeout"
+            record["error"] = f"Tempo limite de {timeout}s excedido"
+        except asyncio.CancelledError:
+            record["status"] = "cancelled"
+            raise
+        except StepExecutionError as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+            record["steps"].append({"result": e.result})
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        record["output"] = output
+        return record
+
+    async def _gather_branches(self, names: List, job: Callable[[Any], Tuple[List[WorkflowStep], Dict]],
+                               max_concurrency: int, timeout: Optional[float], fail_fast: bool,
+                               execution: Dict) -> List[Dict]:
+        """Roda um ramo por nome com no maximo max_concurrency simultaneos.
+
+        job(nome) devolve (passos, escopo) e so e chamado quando o ramo vai
+        comecar: os workers puxam os nomes de um iterador compartilhado, entao
+        um loop sequencial mantem um unico escopo vivo por vez, em vez de
+        montar todos e criar uma task por item. Com fail_fast, o primeiro ramo
+        com erro cancela os que estao rodando e os restantes nao comecam
+        (todos marcados como "cancelled").
+        """
+        records: List[Optional[Dict]] = [None] * len(names)
+        positions = iter(range(len(names)))
+        workers: List[asyncio.Task] = []
+        failed = False
+
+        async def worker():
+            nonlocal failed
+            for i in positions:
+                if failed:
+                    return
+                steps, scope = job(names[i])
+                records[i] = await self._run_branch(names[i], steps, scope, timeout, execution)
+                if fail_fast and records[i]["status"] != "completed" and not failed:
+                    failed = True
+                    for other in workers:
+                        if other is not asyncio.current_task():
+                            other.cancel()
+
+        workers.extend(asyncio.create_task(worker())
+                       for _ in range(min(max(int(max_concurrency), 1), len(names))))
+        try:
+            results = await asyncio.gather(*workers, return_exceptions=True)
+        except asyncio.CancelledError:
+            for task in workers:
+                task.cancel()
+            raise
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        for i, name in enumerate(names):
+            if records[i] is None:
+                records[i] = {"branch": name, "status": "cancelled", "steps": [], "output": {}}
+        return records
+
+    async def _exec_parallel(self, step: WorkflowStep, variables: Dict, execution: Dict) -> Dict:
+        """Fan-out de listas de passos com fan-in das saidas.
+
+        config:
+            branches: lista de listas de passos, ou {nome: [passos]}
+            max_concurrency: ramos simultaneos (padrao: todos)
+            timeout_seconds: limite por ramo (opcional)
+            fail_fast: cancela os demais ramos no primeiro erro (padrao False)
+            output: variavel que recebe {ramo: saida} (padrao: id do passo)
+
+        As saidas dos ramos sao mescladas nas variaveis na ordem declarada.
+        """
+        config = step.config
+        branches = config.get("branches") or []
+        if isinstance(branches, dict):
+            named = list(branches.items())
+        elif isinstance(branches, list):
+            named = list(enumerate(branches))
+        else:
+            raise ValueError(f"parallel '{step.id}': branches deve ser lista ou objeto")
+        branch_steps = {name: self._child_steps(steps, f"parallel '{step.id}' ramo {name}")
+                        for name, steps in named}
+
+        started = time.perf_counter()
+        records = await self._gather_branches(
+            list(branch_steps),
+            lambda name: (branch_steps[name], dict(variables)),
+            max_concurrency=config.get("max_concurrency") or max(len(branch_steps), 1),
+            timeout=config.get("timeout_seconds"),
+            fail_fast=bool(config.get("fail_fast", False)),
+            execution=execution,
+        )
+
+        output: Dict = {}
+        for record in records:
+            output.update(record["output"])
+        output[config.get("output", step.id)] = {str(r["branch"]): r["output"] for r in records}
+        result = {
+            "parallel": True,
+            "branches": records,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "output": output,
+        }
+        failed = [str(r["branch"]) for r in records if r["status"] != "completed"]
+        if failed:
+            raise StepExecutionError(f"parallel '{step.id}': ramos com falha: {', '.join(failed)}", result)
+        return result
+
+    async def _exec_loop(self, step: WorkflowStep, variables: Dict, execution: Dict) -> Dict:
+        """Executa os passos filhos para cada item de uma variavel.
+
+        config:
+            source: variavel com a lista a iterar
+            steps: passos executados por item
+            item_var / index_var: nomes expostos aos filhos (padrao item/index)
+            max_concurrency: iteracoes simultaneas (padrao 1 = sequencial)
+            max_iterations: limite de itens processados (padrao 1000)
+            timeout_seconds: limite por iteracao (opcional)
+            continue_on_error: segue apos falhas (padrao False)
+            output: variavel que recebe a lista de saidas (padrao: id do passo)
+        """
+        config = step.config
+        items = variables.get(config.get("source", ""))
+        if items is None:
+            items = []
+        elif isinstance(items, dict):
+            items = list(items.items())
+        elif not isinstance(items, (list, tuple)):
+            raise ValueError(f"loop '{step.id}': variavel '{config.get('source')}' nao e uma lista")
+        max_iterations = int(config.get("max_iterations", 1000))
+        truncated = len(items) > max_iterations
+        items = items[:max_iterations]
+
+        steps = self._child_steps(config.get("steps", []), f"loop '{step.id}'")
+        item_var = config.get("item_var", "item")
+        index_var = config.get("index_var", "index")
+
+        started = time.perf_counter()
+        records = await self._gather_branches(
+            list(range(len(items))),
+            lambda i: (steps, {**variables, item_var: items[i], index_var: i}),
+            max_concurrency=config.get("max_concurrency", 1),
+            timeout=config.get("timeout_seconds"),
+            fail_fast=not config.get("continue_on_error", False),
+            execution=execution,
+        )
+
+        iterations = [{k: r.get(k) for k in ("branch", "status", "started_at", "duration_ms", "error")}
+                      for r in records]
+        for it in iterations:
+            it["index"] = it.pop("branch")
+        result = {
+            "loop": True,
+            "count": len(records),
+            "truncated": truncated,
+            "iterations": iterations,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "output": {config.get("output", step.id): [r["output"] for r in records]},
+        }
+        failed = [r for r in records if r["status"] != "completed"]
+        if failed and not config.get("continue_on_error", False):
+            raise StepExecutionError(f"loop '{step.id}': iteracao {failed[0]['branch']} falhou: "
+                                     f"{failed[0].get('error') or failed[0]['status']}", result)
+        result["failed"] = len(failed)
+        return result
+
     def _exec_condition(self, config: Dict, variables: Dict) -> Dict:
         field = config.get("field", "")
         operator = config.get("operator", "==")
@@ -378,7 +1281,7 @@ class WorkflowExecutor:
             result = False
         return {"condition": True, "result": result, "field": field, "operator": operator}
 
-    def _exec_action(self, config: Dict, variables: Dict) -> Dict:
+    def _exec_action(self, config: Dict, variables: Dict, execution: Dict) -> Dict:
         action_type = config.get("type", "log")
         if action_type == "log":
             return {"action": "log", "message": config.get("message", "")}
@@ -388,29 +1291,93 @@ class WorkflowExecutor:
             return {"action": "set_variable", "output": {key: val}}
         elif action_type == "emit_event":
             event_type = config.get("event_type", "custom.event")
+            if self._defer_events:
+                execution.setdefault("deferred_events", []).append(
+                    {"event_type": event_type, "payload": config.get("payload", {})})
+                return {"action": "emit_event", "event_type": event_type, "deferred": True}
             event_bus.emit(event_type, config.get("payload", {}))
             return {"action": "emit_event", "event_type": event_type}
         return {"action": action_type, "status": "executed"}
 
     def _exec_query(self, config: Dict, variables: Dict) -> Dict:
-        if not HAS_PSYCOPG2 or not DATABASE_URL:
+        """Passo SQL pelo pool compartilhado (somente leitura).
+
+        config: sql com placeholders psycopg2 (%(nome)s ou %s), params (dict
+        ou lista; strings "$var" / "$var.campo" vem das variaveis do workflow),
+        max_rows (padrao 100, ate MAX_QUERY_ROWS) e output (padrao
+        query_result). O limite vai para dentro da query, entao o banco nunca
+        transfere mais que max_rows + 1 linhas.
+        """
+        if not query_pool.available:
             return {"error": "Database nao disponivel"}
-        sql = config.get("sql", "")
-        if not sql.strip().upper().startswith("SELECT"):
+        sql = config.get("sql", "").strip().rstrip(";").strip()
+        if not sql.upper().startswith(("SELECT", "WITH")):
             return {"error": "Somente SELECT permitido"}
         try:
-            conn = psycopg2.connect(DATABASE_URL)
-            conn.set_session(readonly=True, autocommit=True)
-            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            cur.execute(f"SET statement_timeout = '10000';")
-            cur.execute(sql)
-            rows = cur.fetchall()
-            conn.close()
-            data = [dict(r) for r in rows[:100]]
-            return {"query": "executed", "row_count": len(data), "output": {"query_result": data}}
+            max_rows = min(max(int(config.get("max_rows", 100)), 1), MAX_QUERY_ROWS)
+            params = resolve_params(config.get("params"), variables)
+        except (KeyError, TypeError, ValueError) as e:
+            return {"error": f"Parametros invalidos: {e.args[0] if e.args else e}"}
+
+        limited = f"SELECT * FROM ({sql}) AS workflow_query LIMIT {max_rows + 1}"
+        try:
+            started = time.perf_counter()
+            with track_db("workflow_query"), query_pool.connection() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(limited, params)
+                    rows = cur.fetchall()
+            data = [dict(r) for r in rows[:max_rows]]
+            return {
+                "query": "executed",
+                "row_count": len(data),
+                "truncated": len(rows) > max_rows,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+                "output": {config.get("output", "query_result"): data},
+            }
         except Exception as e:
             return {"error": f"Query falhou: {str(e)}"}
 
+    async def _exec_http_pooled(self, config: Dict, variables: Dict) -> Dict:
+        """Passo HTTP pelo pool compartilhado (keep-alive, retries, breaker).
+
+        config: url, method, headers, params, body (JSON), timeout, retries,
+        retry_non_idempotent, max_bytes, on_oversize (truncate|error) e
+        output (variavel de destino, padrao http_response).
+        """
+        url = config.get("url", "")
+        if not url:
+            return {"error": "URL nao informada"}
+        try:
+            resp = await http_pool.request(
+                config.get("method", "GET"), url,
+                headers=config.get("headers"),
+                params=config.get("params"),
+                json_body=config.get("body"),
+                timeout=config.get("timeout"),
+                retries=config.get("retries"),
+                retry_non_idempotent=bool(config.get("retry_non_idempotent", False)),
+                max_bytes=config.get("max_bytes"),
+                on_oversize=config.get("on_oversize", "truncate"),
+            )
+        except (CircuitOpenError, ResponseTooLarge) as e:
+            return {"error": f"HTTP falhou: {str(e)}"}
+        except Exception as e:
+            return {"error": f"HTTP falhou: {type(e).__name__}: {str(e)}"}
+
+        result = {
+            "status": resp["status"],
+            "bytes": resp["bytes"],
+            "truncated": resp["truncated"],
+            "attempts": resp["attempts"],
+            "http_version": resp["http_version"],
+            "elapsed_ms": resp["elapsed_ms"],
+        }
+        if resp["status"] >= 400:
+            result["error"] = f"HTTP falhou: status {resp['status']}"
+            return result
+        result["output"] = {config.get("output", "http_response"): resp["body"]}
+        return result
+
     def _exec_http(self, config: Dict, variables: Dict) -> Dict:
         import urllib.request
         url = config.get("url", "")
@@ -423,7 +1390,7 @@ class WorkflowExecutor:
             if config.get("body"):
                 body = json.dumps(config["body"]).encode()
                 req.data = body
-            with urllib.request.urlopen(req, timeout=10) as resp:
+            with track_http("workflow_http"), urllib.request.urlopen(req, timeout=10) as resp:
                 return {"status": resp.status, "output": {"http_response": resp.read().decode()[:5000]}}
         except Exception as e:
             return {"error": f"HTTP falhou: {str(e)}"}
@@ -445,28 +1412,575 @@ class WorkflowExecutor:
             return {"output": {"filtered": filtered}}
         return {"output": {}}
 
-    def get_executions(self, workflow_id: str = None, limit: int = 50) -> List[Dict]:
-        execs = self._executions
-        if workflow_id:
-            execs = [e for e in execs if e["workflow_id"] == workflow_id]
-        return execs[-limit:]
+    def get_executions(self, workflow_id: str = None, limit: int = 50, status: str = None,
+                       cursor: str = None, since: float = None) -> Tuple[List[Dict], Optional[str]]:
+        """Pagina do historico, da mais recente para a mais antiga (bloqueante com store).
+
+        Retorna (execucoes, proximo_cursor); ValueError se o cursor for invalido.
+        """
+        limit = max(min(int(limit), 1000), 1)
+        if self._store is not None:
+            self._store.flush(timeout=1.0)
+            return self._store.query(workflow_id=workflow_id, status=status, since=since,
+                                     limit=limit, cursor=cursor)
+
+        # Sem store: historico recente em memoria, ordenado pela mesma chave do keyset
+        after = decode_cursor(cursor) if cursor else None
+        candidates = []
+        for execution in self._executions.values():
+            if workflow_id and execution["workflow_id"] != workflow_id:
+                continue
+            if status and execution["status"] != status:
+                continue
+            key = (datetime.fromisoformat(execution["submitted_at"]).timestamp(), execution["id"])
+            if since is not None and key[0] < since:
+                continue
+            if after is not None and key >= after:
+                continue
+            candidates.append((key, execution))
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        next_cursor = encode_cursor(*candidates[limit - 1][0]) if len(candidates) > limit else None
+        return [execution for _, execution in candidates[:limit]], next_cursor
 
     def stats(self) -> Dict:
-        total = len(self._executions)
-        completed = sum(1 for e in self._executions if e["status"] == "completed")
-        errors = sum(1 for e in self._executions if e["status"] == "error")
+        totals = self._status_totals
+        total = sum(totals.values())
+        completed = totals.get("completed", 0)
         return {
             "total_workflows": len(self._workflows),
             "total_executions": total,
             "completed": completed,
-            "errors": errors,
+            "errors": totals.get("error", 0),
+            "compensated": totals.get("compensated", 0),
             "success_rate": round(completed / total * 100, 1) if total > 0 else 0,
+            "running": self._running,
+            "queued": len(self._active) - self._running,
+            "max_concurrent": self._max_concurrent,
+            "store": self._store.backend if self._store is not None else "memory",
+            "mode": "queue" if self._queue is not None else "local",
+        }
+
+
+EVENT_DISPATCH_LATENCY = Histogram(
+    "arcadia_event_dispatch_latency_seconds",
+    "Tempo entre o emit do evento e o inicio da execucao do workflow assinante",
+    ("event_type",),
+)
+EVENT_HANDLER_DURATION = Histogram(
+    "arcadia_event_handler_duration_seconds",
+    "Duracao das execucoes de workflow disparadas por eventos",
+    ("handler",),
+)
+EVENT_DISPATCH_TOTAL = Counter(
+    "arcadia_event_dispatch_total",
+    "Entregas de eventos a assinantes por resultado",
+    ("handler", "outcome"),
+)
+EVENT_DISPATCH_QUEUE = Gauge(
+    "arcadia_event_dispatch_queue_depth",
+    "Entregas aguardando na fila do dispatcher",
+)
+
+
+class DeliveryShaper:
+    """Debounce, micro-batch e throttle das entregas de uma assinatura.
+
+    Roda inteiramente no event loop (timers via call_later). A ordem e
+    debounce -> batch -> throttle, entao o limite de taxa vale para as
+    entregas ja agrupadas. Config do assinante:
+        debounce_ms: so entrega apos debounce_ms sem novos eventos (o ultimo vence)
+        debounce_key: campo do payload que separa as janelas (ex.: "id")
+        debounce_max_wait_ms: entrega mesmo com eventos continuos apos esse tempo
+        batch_size / batch_window_ms: agrupa ate N eventos ou T ms em uma entrega
+            com payload {"events": [...], "count": n}
+        max_per_second / burst: token bucket das entregas; o excedente espera
+        max_pending: limite de entregas retidas pelo throttle (descarta as antigas)
+    """
+
+    OPTIONS = ("debounce_ms", "batch_size", "batch_window_ms", "max_per_second")
+
+    def __init__(self, key: str, config: Dict, loop: asyncio.AbstractEventLoop, emit, counts: Dict[str, int],
+                 subscription: Tuple[str, str] = ("", "")):
+        self.key = key
+        self.subscription = subscription
+        self.debounce = max(float(config.get("debounce_ms", 0)), 0.0) / 1000
+        self.debounce_key = config.get("debounce_key")
+        self.debounce_max_wait = max(float(config.get("debounce_max_wait_ms", 0)), 0.0) / 1000
+        self.batch_size = max(int(config.get("batch_size", 0)), 0)
+        self.batch_window = max(float(config.get("batch_window_ms", 0)), 0.0) / 1000
+        if self.batch_size and not self.batch_window:
+            self.batch_window = 1.0  # evita reter um lote incompleto para sempre
+        self.rate = max(float(config.get("max_per_second", 0)), 0.0)
+        self.burst = max(int(config.get("burst", 1)), 1)
+        self.max_pending = max(int(config.get("max_pending", 10000)), 1)
+        self._loop = loop
+        self._emit = emit
+        self._counts = counts
+        self._debounced: Dict[str, Dict] = {}
+        self._batch: List[Dict] = []
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+        self._tokens = float(self.burst)
+        self._refilled_at = loop.time()
+        self._throttled: deque = deque()
+        self._drain_timer: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+
+    @classmethod
+    def wanted(cls, config: Dict) -> bool:
+        return any(config.get(option) for option in cls.OPTIONS)
+
+    def offer(self, delivery: Dict):
+        if self._closed:
+            return
+        if self.debounce:
+            self._debounce(delivery)
+        else:
+            self._to_batch(delivery)
+
+    # --- debounce ---
+
+    def _debounce(self, delivery: Dict):
+        key = ""
+        if self.debounce_key:
+            key = str(delivery["event"]["payload"].get(self.debounce_key, ""))
+        now = self._loop.time()
+        entry = self._debounced.get(key)
+        if entry is None:
+            entry = self._debounced[key] = {"first": now, "coalesced": 0}
+        else:
+            entry["timer"].cancel()
+            entry["coalesced"] += 1
+            self._counts["debounced"] += 1
+        entry["delivery"] = delivery
+        delay = self.debounce
+        if self.debounce_max_wait:
+            delay = min(delay, max(entry["first"] + self.debounce_max_wait - now, 0.0))
+        entry["timer"] = self._loop.call_later(delay, self._debounce_fire, key)
+
+    def _debounce_fire(self, key: str):
+        entry = self._debounced.pop(key, None)
+        if entry is not None:
+            self._to_batch(entry["delivery"])
+
+    # --- micro-batch ---
+
+    def _to_batch(self, delivery: Dict):
+        if not self.batch_size and not self.batch_window:
+            self._to_throttle(delivery)
+            return
+        self._batch.append(delivery)
+        if self.batch_size and len(self._batch) >= self.batch_size:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            self._batch_timer = self._loop.call_later(self.batch_window, self._flush_batch)
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        items, self._batch = self._batch, []
+        if not items:
+            return
+        first = items[0]
+        types = {item["event"]["type"] for item in items}
+        batch_event = {
+            "type": types.pop() if len(types) == 1 else first.get("event_type", "*"),
+            "payload": {
+                "events": [{k: item["event"].get(k) for k in ("id", "type", "timestamp", "payload")}
+                           for item in items],
+                "count": len(items),
+            },
+            "timestamp": datetime.now().isoformat(),
+            "id": uuid.uuid4().hex[:16],
+            "batch": True,
         }
+        self._counts["batches"] += 1
+        self._counts["batched_events"] += len(items)
+        self._to_throttle({**first, "event": batch_event})
 
+    # --- throttle ---
 
-event_bus = EventBus()
-scheduler = Scheduler()
-workflow_executor = WorkflowExecutor()
+    def _refill(self):
+        now = self._loop.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _to_throttle(self, delivery: Dict):
+        if self._closed:
+            return
+        if not self.rate:
+            self._emit(delivery)
+            return
+        self._refill()
+        if not self._throttled and self._tokens >= 1:
+            self._tokens -= 1
+            self._emit(delivery)
+            return
+        self._throttled.append(delivery)
+        self._counts["throttled"] += 1
+        if len(self._throttled) > self.max_pending:
+            self._throttled.popleft()
+            self._counts["throttle_dropped"] += 1
+        self._schedule_drain()
+
+    def _schedule_drain(self):
+        if self._drain_timer is None and self._throttled:
+            delay = max((1 - self._tokens) / self.rate, 0.0)
+            self._drain_timer = self._loop.call_later(delay, self._drain)
+
+    def _drain(self):
+        self._drain_timer = None
+        self._refill()
+        while self._throttled and self._tokens >= 1:
+            self._tokens -= 1
+            self._emit(self._throttled.popleft())
+        self._schedule_drain()
+
+    def close(self) -> int:
+        """Cancela os timers e descarta as entregas retidas; retorna quantas foram descartadas."""
+        self._closed = True
+        for entry in self._debounced.values():
+            entry["timer"].cancel()
+        for timer in (self._batch_timer, self._drain_timer):
+            if timer is not None:
+                timer.cancel()
+        self._batch_timer = self._drain_timer = None
+        discarded = len(self._debounced) + len(self._batch) + len(self._throttled)
+        self._debounced.clear()
+        self._batch.clear()
+        self._throttled.clear()
+        return discarded
+
+    def stats(self) -> Dict:
+        return {
+            "subscription": self.key,
+            "debounce_pending": len(self._debounced),
+            "batch_pending": len(self._batch),
+            "throttle_pending": len(self._throttled),
+        }
+
+
+class EventDispatcher:
+    """Entrega eventos aos workflows assinantes sem bloquear quem emite.
+
+    emit() enfileira uma entrega por assinante em uma fila limitada (pode ser
+    chamado do event loop ou de outras threads, como o scheduler). Um pump no
+    event loop transforma as entregas em tasks, limitadas globalmente por
+    max_workers e por assinante por config["max_concurrency"]. Falhas sao
+    reexecutadas com backoff exponencial ate config["max_retries"]; depois
+    disso, ou com a fila cheia, a entrega vai para a dead letter queue.
+
+    Config do assinante (EventBus.subscribe): workflow_id (padrao handler_id),
+    max_concurrency, max_retries, backoff_seconds, dispatch (False desliga) e
+    as opcoes de debounce/batch/throttle de DeliveryShaper.
+    """
+
+    def __init__(self, executor: "WorkflowExecutor", queue_size: int = 1000, max_workers: int = 8,
+                 max_dead_letters: int = 500):
+        self._executor = executor
+        self._queue_size = max(int(queue_size), 1)
+        self._max_workers = max(int(max_workers), 1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Optional[asyncio.Semaphore] = None
+        self._subscriber_limits: Dict[str, asyncio.Semaphore] = {}
+        self._pump_task: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+        self._dead_letters: deque = deque(maxlen=max_dead_letters)
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._shapers: Dict[str, DeliveryShaper] = {}
+        self._bus: Optional[EventBus] = None
+        EVENT_DISPATCH_QUEUE.set_function(lambda: self._queue.qsize() if self._queue else 0)
+
+    @classmethod
+    def from_env(cls, executor: "WorkflowExecutor") -> "EventDispatcher":
+        return cls(
+            executor,
+            queue_size=int(os.environ.get("AUTOMATION_DISPATCH_QUEUE_SIZE", "1000")),
+            max_workers=int(os.environ.get("AUTOMATION_DISPATCH_WORKERS", "8")),
+        )
+
+    def attach_bus(self, bus: EventBus):
+        """Bus consultado antes de cada entrega, para pular handlers que sairam."""
+        self._bus = bus
+
+    def start(self):
+        if self._pump_task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._workers = asyncio.Semaphore(self._max_workers)
+        self._pump_task = self._loop.create_task(self._pump())
+
+    async def stop(self):
+        if self._pump_task is None:
+            return
+        self._pump_task.cancel()
+        for shaper in self._shapers.values():
+            shaper.close()
+        self._shapers.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(self._pump_task, *self._tasks, return_exceptions=True)
+        self._pump_task = None
+        self._loop = None
+
+    def submit(self, event: Dict, subscribers: List[Dict], shape: bool = True):
+        """Enfileira uma entrega por assinante. Nunca bloqueia o chamador.
+
+        Assinaturas com debounce/batch/throttle passam pelo DeliveryShaper;
+        shape=False (redrive) entrega direto.
+        """
+        deliveries = []
+        for sub in subscribers:
+            config = sub.get("config") or {}
+            if config.get("dispatch", True) is False:
+                continue
+            workflow_id = config.get("workflow_id") or sub["handler_id"]
+            if self._executor.get(workflow_id) is None:
+                continue
+            deliveries.append({
+                "event": event,
+                "event_type": sub.get("event_type", event["type"]),
+                "handler_id": sub["handler_id"],
+                "workflow_id": workflow_id,
+                "config": config,
+                "attempt": 1,
+                "enqueued_at": time.monotonic(),
+                "shape": shape and DeliveryShaper.wanted(config),
+                "redrive": not shape,
+            })
+        if not deliveries:
+            return
+        if self._loop is None:
+            for delivery in deliveries:
+                self._dead_letter(delivery, "dispatcher_not_started")
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._accept(deliveries)
+        else:
+            self._loop.call_soon_threadsafe(self._accept, deliveries)
+
+    def _accept(self, deliveries: List[Dict]):
+        direct = []
+        for delivery in deliveries:
+            if delivery.pop("shape", False):
+                self._shaper_for(delivery).offer(delivery)
+            else:
+                direct.append(delivery)
+        if direct:
+            self._enqueue(direct)
+
+    def _shaper_for(self, delivery: Dict) -> DeliveryShaper:
+        # A config faz parte da chave: reassinar com outras opcoes cria um shaper novo
+        key = f"{delivery['event_type']}:{delivery['handler_id']}:{json.dumps(delivery['config'], sort_keys=True)}"
+        shaper = self._shapers.get(key)
+        if shaper is None:
+            shaper = self._shapers[key] = DeliveryShaper(
+                f"{delivery['event_type']}:{delivery['handler_id']}", delivery["config"],
+                self._loop, lambda d: self._enqueue([d]), self._counts,
+                subscription=(delivery["event_type"], delivery["handler_id"]))
+        return shaper
+
+    def forget(self, event_type: str, handler_id: str):
+        """Fecha os shapers da assinatura removida, descartando debounce/lotes/throttle pendentes."""
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self._loop:
+            self._loop.call_soon_threadsafe(self.forget, event_type, handler_id)
+            return
+        for key, shaper in list(self._shapers.items()):
+            if shaper.subscription == (event_type, handler_id):
+                del self._shapers[key]
+                self._counts["unsubscribed_discarded"] += shaper.close()
+
+    def _enqueue(self, deliveries: List[Dict]):
+        for delivery in deliveries:
+            try:
+                self._queue.put_nowait(delivery)
+                self._counts["enqueued"] += 1
+            except asyncio.QueueFull:
+                self._dead_letter(delivery, "queue_full")
+
+    def _dead_letter(self, delivery: Dict, reason: str):
+        self._counts["dead_lettered"] += 1
+        EVENT_DISPATCH_TOTAL.labels(delivery["handler_id"], "dead_letter").inc()
+        self._dead_letters.append({
+            "id": hashlib.sha256(f"{delivery['event']['id']}:{delivery['handler_id']}:{time.time()}".encode()).hexdigest()[:16],
+            "reason": reason,
+            "event": delivery["event"],
+            "handler_id": delivery["handler_id"],
+            "workflow_id": delivery["workflow_id"],
+            "config": delivery["config"],
+            "attempts": delivery["attempt"],
+            "failed_at": datetime.now().isoformat(),
+        })
+
+    def _limit_for(self, delivery: Dict) -> asyncio.Semaphore:
+        handler_id = delivery["handler_id"]
+        sem = self._subscriber_limits.get(handler_id)
+        if sem is None:
+            sem = self._subscriber_limits[handler_id] = asyncio.Semaphore(
+                max(int(delivery["config"].get("max_concurrency", 4)), 1))
+        return sem
+
+    async def _pump(self):
+        while True:
+            delivery = await self._queue.get()
+            task = asyncio.create_task(self._deliver(delivery))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            # Limita as tasks pendentes ao tamanho da fila; o restante espera na fila
+            while len(self._tasks) >= self._queue_size:
+                await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+
+    async def _deliver(self, delivery: Dict):
+        handler_id = delivery["handler_id"]
+        if (self._bus is not None and not delivery.get("redrive")
+                and not self._bus.is_subscribed(delivery["event_type"], handler_id)):
+            # Assinatura removida depois do enfileiramento (ou durante os retries)
+            self._counts["unsubscribed_skipped"] += 1
+            return
+        async with self._limit_for(delivery), self._workers:
+            event = delivery["event"]
+            EVENT_DISPATCH_LATENCY.labels(event["type"]).observe(time.monotonic() - delivery["enqueued_at"])
+            trigger_data = {**event["payload"], "event_id": event["id"], "event_type": event["type"]}
+            started = time.perf_counter()
+            try:
+                result = await self._executor.execute(delivery["workflow_id"], trigger_data)
+                error = result.get("error") if result.get("status") == "error" else None
+            except Exception as e:
+                error = str(e)
+            EVENT_HANDLER_DURATION.labels(handler_id).observe(time.perf_counter() - started)
+
+        if error is None:
+            self._counts["succeeded"] += 1
+            EVENT_DISPATCH_TOTAL.labels(handler_id, "success").inc()
+            return
+
+        max_retries = int(delivery["config"].get("max_retries", 3))
+        if delivery["attempt"] > max_retries:
+            delivery["error"] = error
+            self._dead_letter(delivery, f"max_retries: {error}")
+            return
+        self._counts["retried"] += 1
+        EVENT_DISPATCH_TOTAL.labels(handler_id, "retry").inc()
+        backoff = float(delivery["config"].get("backoff_seconds", 1.0))
+        delay = min(backoff * (2 ** (delivery["attempt"] - 1)), 60.0)
+        retry = {**delivery, "attempt": delivery["attempt"] + 1, "enqueued_at": time.monotonic() + delay}
+        self._loop.call_later(delay, self._enqueue, [retry])
+
+    def dead_letters(self, limit: int = 50) -> List[Dict]:
+        return list(self._dead_letters)[-limit:]
+
+    def redrive(self, dead_letter_id: str) -> bool:
+        """Reenfileira uma entrega da dead letter queue com as tentativas zeradas."""
+        for item in self._dead_letters:
+            if item["id"] == dead_letter_id:
+                self._dead_letters.remove(item)
+                self.submit(item["event"], [{"handler_id": item["handler_id"], "config": item["config"]}],
+                            shape=False)
+                return True
+        return False
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._pump_task is not None,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self._queue_size,
+            "max_workers": self._max_workers,
+            "in_flight": len(self._tasks),
+            "dead_letters": len(self._dead_letters),
+            **dict(self._counts),
+            "shaping": [shaper.stats() for shaper in self._shapers.values()],
+        }
+
+
+def persist_state(kind: str, key: Optional[str], data: Optional[Dict]):
+    """Grava uma mudanca de estado no event log (key permite compactacao; data None = remocao)."""
+    if event_log is None:
+        return
+    try:
+        event_log.append({"kind": kind, "key": f"{kind}:{key}" if key is not None else None,
+                          "ts": time.time(), "data": data})
+    except Exception as e:
+        print(f"[EventLog] Falha ao gravar {kind}: {e}")
+
+
+def restore_state() -> Dict[str, int]:
+    """Reconstroi workflows, agendamentos, assinaturas, historico e execucoes a partir do log."""
+    if event_log is None:
+        return {}
+    latest: Dict[str, Dict] = {}
+    counts: Dict[str, int] = defaultdict(int)
+    try:
+        for offset, record in event_log.read(0):
+            kind, data = record.get("kind"), record.get("data")
+            if kind == "event":
+                event_bus.record({**data, "offset": offset})
+            elif kind == "execution":
+                workflow_executor.record(data, restored=True)
+            elif record.get("key"):
+                if data is None:
+                    latest.pop(record["key"], None)
+                else:
+                    latest[record["key"]] = record
+            counts[kind] += 1
+    except ValueError as e:
+        # Restaura o que foi lido ate o registro corrompido
+        print(f"[EventLog] Restauracao interrompida: {e}")
+
+    for record in latest.values():
+        kind, data = record["kind"], record["data"]
+        try:
+            if kind == "workflow":
+                workflow_executor.register(WorkflowDefinition(**data))
+            elif kind == "scheduler":
+                scheduler.add(SchedulerEntry(**data), restore=True)
+            elif kind == "subscription":
+                event_bus.subscribe(data["event_type"], data["handler_id"], data.get("config"))
+        except Exception as e:
+            print(f"[EventLog] Registro {record['key']} ignorado na restauracao: {e}")
+    return dict(counts)
+
+
+event_log = EventLog.from_env(os.path.join("data", "automation", "event-log"))
+event_bus = EventBus(
+    max_history=int(os.environ.get("EVENT_HISTORY_SIZE", "10000")),
+    max_history_per_type=int(os.environ.get("EVENT_HISTORY_PER_TYPE", "1000")),
+)
+leader_elector = LeaderElector.from_env(DATABASE_URL)
+scheduler = Scheduler(leader_elector, sync_interval=float(os.environ.get("AUTOMATION_SCHEDULE_SYNC_SECONDS", "5")))
+try:
+    execution_store = open_execution_store(os.path.join("data", "automation", "executions.db"), DATABASE_URL)
+except Exception as e:
+    print(f"[ExecutionStore] Indisponivel, historico apenas em memoria: {e}")
+    execution_store = None
+try:
+    work_queue = open_work_queue(os.path.join("data", "automation", "work-queue.db"), DATABASE_URL)
+except Exception as e:
+    print(f"[WorkQueue] Indisponivel, execucao no proprio processo: {e}")
+    work_queue = None
+workflow_executor = WorkflowExecutor(
+    max_concurrent=int(os.environ.get("AUTOMATION_MAX_CONCURRENT_EXECUTIONS", "1000")),
+    max_executions=int(os.environ.get("AUTOMATION_EXECUTION_HISTORY", "5000")),
+    store=execution_store,
+    queue=work_queue,
+    instance_id=os.environ.get("AUTOMATION_INSTANCE_ID") or socket.gethostname(),
+)
+event_dispatcher = EventDispatcher.from_env(workflow_executor)
+http_pool = HttpPool.from_env("AUTOMATION_HTTP")
+query_pool = DbPool.from_env(DATABASE_URL, "AUTOMATION_DB")
+event_bus.attach_dispatcher(event_dispatcher)
+event_bus.attach_log(event_log)
 
 
 # ==================== ENDPOINTS ====================
@@ -507,12 +2021,23 @@ async def metrics():
     return {
         "scheduler": scheduler.stats(),
         "event_bus": event_bus.stats(),
+        "event_dispatch": event_dispatcher.stats(),
         "workflows": workflow_executor.stats(),
     }
 
 
 # --- Scheduler endpoints ---
 
+async def _update_scheduler_entry(entry_id: str, entry: Optional[SchedulerEntry]):
+    """Compartilha a alteracao com as outras replicas e a aplica aqui."""
+    try:
+        await run_in_threadpool(scheduler.update, entry_id, entry)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Agendamento nao compartilhado com as replicas: {e}")
+
+
 @app.get("/scheduler/entries")
 async def list_scheduler_entries():
     return {"entries": [e.dict() for e in scheduler.list_all()]}
@@ -520,13 +2045,19 @@ async def list_scheduler_entries():
 
 @app.post("/scheduler/entries")
 async def add_scheduler_entry(entry: SchedulerEntry):
-    scheduler.add(entry)
+    try:
+        compile_cron(entry.cron)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await _update_scheduler_entry(entry.id, entry)
+    persist_state("scheduler", entry.id, entry.dict())
     return {"success": True, "entry": entry.dict()}
 
 
 @app.delete("/scheduler/entries/{entry_id}")
 async def remove_scheduler_entry(entry_id: str):
-    scheduler.remove(entry_id)
+    await _update_scheduler_entry(entry_id, None)
+    persist_state("scheduler", entry_id, None)
     return {"success": True}
 
 
@@ -547,6 +2078,12 @@ async def scheduler_stats():
     return scheduler.stats()
 
 
+@app.get("/scheduler/leader")
+async def scheduler_leader():
+    holder = await run_in_threadpool(leader_elector.current_holder)
+    return {**leader_elector.status(), "current_holder": holder}
+
+
 # --- Event Bus endpoints ---
 
 @app.post("/events/emit")
@@ -558,12 +2095,15 @@ async def emit_event(event_type: str, payload: Dict = None):
 @app.post("/events/subscribe")
 async def subscribe_event(event_type: str, handler_id: str, config: Dict = None):
     event_bus.subscribe(event_type, handler_id, config)
+    persist_state("subscription", f"{event_type}:{handler_id}",
+                  {"event_type": event_type, "handler_id": handler_id, "config": config})
     return {"success": True, "event_type": event_type, "handler_id": handler_id}
 
 
 @app.post("/events/unsubscribe")
 async def unsubscribe_event(event_type: str, handler_id: str):
     event_bus.unsubscribe(event_type, handler_id)
+    persist_state("subscription", f"{event_type}:{handler_id}", None)
     return {"success": True}
 
 
@@ -582,6 +2122,73 @@ async def event_stats():
     return event_bus.stats()
 
 
+@app.get("/http/pool/stats")
+async def http_pool_stats():
+    return {"available": HAS_HTTPX, **http_pool.stats()}
+
+
+@app.get("/db/pool/stats")
+async def db_pool_stats():
+    return query_pool.stats()
+
+
+@app.get("/events/dispatch/stats")
+async def event_dispatch_stats():
+    return event_dispatcher.stats()
+
+
+@app.get("/events/dead-letters")
+async def event_dead_letters(limit: int = 50):
+    return {"dead_letters": event_dispatcher.dead_letters(limit)}
+
+
+@app.post("/events/dead-letters/{dead_letter_id}/redrive")
+async def redrive_dead_letter(dead_letter_id: str):
+    if not event_dispatcher.redrive(dead_letter_id):
+        raise HTTPException(status_code=404, detail="Dead letter nao encontrada")
+    return {"success": True}
+
+
+@app.get("/events/log/stats")
+async def event_log_stats():
+    if event_log is None:
+        return {"enabled": False}
+    return {"enabled": True, **event_log.stats()}
+
+
+@app.post("/events/log/replay")
+async def replay_event_log(from_offset: int = 0, limit: int = 1000, redrive: bool = False):
+    """Le eventos do log a partir de um offset; com redrive=true reentrega aos assinantes atuais."""
+    if event_log is None:
+        raise HTTPException(status_code=400, detail="Event log desabilitado")
+    def collect() -> List[Dict]:
+        events = []
+        for offset, record in event_log.read(from_offset):
+            if record.get("kind") == "event":
+                events.append({**record["data"], "offset": offset})
+                if len(events) >= limit:
+                    break
+        return events
+
+    try:
+        events = await run_in_threadpool(collect)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    redelivered = 0
+    if redrive:
+        for event in events:
+            redelivered += len(event_bus.redeliver(event))
+    next_offset = events[-1]["offset"] + 1 if events else event_log.next_offset
+    return {"events": events, "next_offset": next_offset, "redelivered": redelivered}
+
+
+@app.post("/events/log/compact")
+async def compact_event_log():
+    if event_log is None:
+        raise HTTPException(status_code=400, detail="Event log desabilitado")
+    return await run_in_threadpool(event_log.compact)
+
+
 @app.get("/events/types")
 async def event_types():
     return {"types": [e.value for e in EventType]}
@@ -591,13 +2198,18 @@ async def event_types():
 
 @app.post("/workflows/register")
 async def register_workflow(workflow: WorkflowDefinition):
-    workflow_executor.register(workflow)
+    try:
+        workflow_executor.register(workflow)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    persist_state("workflow", workflow.id, workflow.dict())
     return {"success": True, "workflow_id": workflow.id}
 
 
 @app.delete("/workflows/{workflow_id}")
 async def unregister_workflow(workflow_id: str):
     workflow_executor.unregister(workflow_id)
+    persist_state("workflow", workflow_id, None)
     return {"success": True}
 
 
@@ -606,6 +2218,11 @@ async def list_workflows():
     return {"workflows": [w.dict() for w in workflow_executor.list_all()]}
 
 
+@app.get("/workflows/stats")
+async def workflow_stats_endpoint():
+    return workflow_executor.stats()
+
+
 @app.get("/workflows/{workflow_id}")
 async def get_workflow(workflow_id: str):
     w = workflow_executor.get(workflow_id)
@@ -614,27 +2231,84 @@ async def get_workflow(workflow_id: str):
     return w.dict()
 
 
-@app.post("/workflows/{workflow_id}/execute")
-async def execute_workflow(workflow_id: str, execution: WorkflowExecution = None):
+@app.get("/workflows/{workflow_id}/graph")
+async def get_workflow_graph(workflow_id: str):
+    graph = workflow_executor.graph(workflow_id)
+    if not graph:
+        raise HTTPException(status_code=404, detail="Workflow nao encontrado")
+    return {"workflow_id": workflow_id, **graph.describe()}
+
+
+@app.post("/workflows/{workflow_id}/execute", status_code=202)
+async def execute_workflow(workflow_id: str, execution: WorkflowExecution = None, wait: float = 0):
+    """Agenda a execucao e retorna o id; wait > 0 aguarda o termino por ate wait segundos."""
     trigger_data = execution.trigger_data if execution else None
     variables = execution.variables if execution else None
-    result = workflow_executor.execute(workflow_id, trigger_data, variables)
-    return result
+    submitted = workflow_executor.submit(workflow_id, trigger_data, variables)
+    if wait > 0:
+        return await workflow_executor.wait(submitted["id"], min(wait, MAX_EXECUTION_WAIT_SECONDS))
+    return {"execution_id": submitted["id"], "status": submitted["status"],
+            "status_url": f"/executions/{submitted['id']}"}
+
+
+async def query_executions(workflow_id: Optional[str], limit: int, status: Optional[str],
+                           cursor: Optional[str], since: Optional[str]) -> Dict:
+    try:
+        since_ts = datetime.fromisoformat(since).timestamp() if since else None
+        executions, next_cursor = await run_in_threadpool(
+            workflow_executor.get_executions, workflow_id, limit, status, cursor, since_ts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"executions": executions, "next_cursor": next_cursor}
 
 
 @app.get("/workflows/{workflow_id}/executions")
-async def workflow_executions(workflow_id: str, limit: int = 50):
-    return {"executions": workflow_executor.get_executions(workflow_id, limit)}
+async def workflow_executions(workflow_id: str, limit: int = 50, status: Optional[str] = None,
+                              cursor: Optional[str] = None, since: Optional[str] = None):
+    """Historico paginado (mais recentes primeiro); passe next_cursor para a proxima pagina."""
+    return await query_executions(workflow_id, limit, status, cursor, since)
 
 
 @app.get("/executions")
-async def all_executions(limit: int = 50):
-    return {"executions": workflow_executor.get_executions(limit=limit)}
+async def all_executions(limit: int = 50, status: Optional[str] = None,
+                         cursor: Optional[str] = None, since: Optional[str] = None):
+    return await query_executions(None, limit, status, cursor, since)
 
 
-@app.get("/workflows/stats")
-async def workflow_stats_endpoint():
-    return workflow_executor.stats()
+@app.get("/executions/store/stats")
+async def execution_store_stats():
+    if workflow_executor.store is None:
+        return {"backend": "memory"}
+    return workflow_executor.store.stats()
+
+
+@app.post("/executions/store/prune")
+async def execution_store_prune():
+    """Aplica a retencao do execution store imediatamente."""
+    if workflow_executor.store is None:
+        raise HTTPException(status_code=400, detail="Execution store desativado")
+    removed = await run_in_threadpool(workflow_executor.store.prune)
+    return {"success": True, "removed": removed}
+
+
+@app.get("/workers")
+async def list_workers():
+    """Workers da work queue com heartbeat, jobs em andamento e throughput."""
+    if work_queue is None:
+        return {"mode": "local", "workers": []}
+    stale_after = float(os.environ.get("AUTOMATION_WORKER_STALE_SECONDS", "60"))
+    workers = await run_in_threadpool(work_queue.workers, stale_after)
+    depth = await run_in_threadpool(work_queue.depth)
+    return {"mode": "queue", "queue": {**work_queue.stats(), "depth": depth}, "workers": workers}
+
+
+@app.get("/executions/{execution_id}")
+async def get_execution(execution_id: str, wait: float = 0):
+    """Status da execucao; com wait > 0 faz long-poll ate o termino ou o timeout."""
+    execution = await workflow_executor.wait(execution_id, min(wait, MAX_EXECUTION_WAIT_SECONDS))
+    if execution is None:
+        raise HTTPException(status_code=404, detail="Execucao nao encontrada")
+    return execution
 
 
 # --- Cron helper ---
@@ -642,22 +2316,44 @@ async def workflow_stats_endpoint():
 @app.post("/cron/validate")
 async def validate_cron(expression: str):
     try:
-        cron = CronExpression(expression)
-        next_runs = []
-        dt = datetime.now()
-        for _ in range(5):
-            dt = cron.next_run(dt)
-            next_runs.append(dt.isoformat())
-            dt += timedelta(minutes=1)
-        return {"valid": True, "expression": expression, "next_runs": next_runs}
+        cron = compile_cron(expression)
+        next_runs = [dt.isoformat() for dt in cron.upcoming(5)]
+        return {"valid": True, "expression": expression, "next_runs": next_runs, "fields": cron.describe()}
     except ValueError as e:
         return {"valid": False, "expression": expression, "error": str(e)}
 
 
 @app.on_event("startup")
 async def startup():
+    restored = await run_in_threadpool(restore_state)
+    if restored:
+        print(f"[Automation Engine] Estado restaurado do event log: {restored}")
+    await run_in_threadpool(workflow_executor.load_counters)
+    event_dispatcher.start()
+    if work_queue is not None:
+        poll = float(os.environ.get("AUTOMATION_WORK_QUEUE_POLL_SECONDS", "0.2"))
+        app.state.queue_collector = asyncio.create_task(workflow_executor.collect_queue(poll))
+    leader_elector.start()
     scheduler.start()
-    print("[Automation Engine] Scheduler iniciado automaticamente")
+    print(f"[Automation Engine] Scheduler iniciado automaticamente (eleicao de lider: {leader_elector.status()['mode']})")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    scheduler.stop()
+    leader_elector.stop()
+    await event_dispatcher.stop()
+    collector = getattr(app.state, "queue_collector", None)
+    if collector is not None:
+        collector.cancel()
+    await http_pool.close()
+    query_pool.close()
+    if execution_store is not None:
+        await run_in_threadpool(execution_store.close)
+    if work_queue is not None:
+        work_queue.close()
+    if event_log is not None:
+        event_log.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,248 @@
+"""
+Arcadia Automation Worker - Processos que executam workflows da work queue
+Com AUTOMATION_WORK_QUEUE ligado, a API so enfileira execucoes; estes
+processos as reivindicam (claim com lease), rodam o DAG com o mesmo
+executor da API e gravam o resultado na fila, de onde a API o recolhe.
+
+    - --processes N sobe N processos (um event loop por nucleo); em varios
+      nos, rode o comando em cada um apontando para o mesmo PostgreSQL
+    - --concurrency limita as execucoes simultaneas por processo
+    - heartbeat renova o lease dos jobs em andamento a cada
+      --heartbeat-interval e grava as metricas do worker (GET /workers)
+    - se um worker morrer, seus jobs voltam a fila quando o lease
+      (--visibility-timeout) expira
+    - SIGTERM/SIGINT: para de reivindicar, espera os jobs em andamento ate
+      --drain-timeout e devolve os que sobrarem a fila
+
+Uso:
+    AUTOMATION_WORK_QUEUE=sqlite python automation_worker.py --processes 4 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Optional
+
+# O worker nao guarda estado proprio: historico e event log ficam com a API
+os.environ["AUTOMATION_EXECUTION_STORE"] = "off"
+os.environ["AUTOMATION_EVENT_LOG_DIR"] = ""
+
+try:
+    from . import automation_engine as engine
+    from .work_queue import WorkQueue
+except ImportError:
+    import automation_engine as engine
+    from work_queue import WorkQueue
+
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+
+class WorkflowWorker:
+    def __init__(self, queue: WorkQueue, concurrency: int = 10, visibility_timeout: float = 60.0,
+                 heartbeat_interval: float = 10.0, poll_interval: float = 0.5,
+                 drain_timeout: float = 30.0, worker_id: Optional[str] = None):
+        self.queue = queue
+        self.concurrency = max(int(concurrency), 1)
+        self.visibility_timeout = max(float(visibility_timeout), 1.0)
+        self.heartbeat_interval = min(max(float(heartbeat_interval), 0.1), self.visibility_timeout / 2)
+        self.poll_interval = max(float(poll_interval), 0.01)
+        self.drain_timeout = float(drain_timeout)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.executor = engine.WorkflowExecutor(max_concurrent=self.concurrency, defer_events=True)
+        self._graphs: "OrderedDict[str, engine.WorkflowGraph]" = OrderedDict()
+        self._jobs: Dict[str, asyncio.Task] = {}
+        self._finished: deque = deque()
+        self._started_ts = time.time()
+        self._counts = {"claimed": 0, "completed": 0, "failed": 0, "lost": 0}
+        self._stopping: Optional[asyncio.Event] = None
+
+    def _graph(self, definition: Dict) -> "engine.WorkflowGraph":
+        # Cache pela definicao completa: versoes diferentes do mesmo workflow convivem
+        key = json.dumps(definition, sort_keys=True, default=str)
+        graph = self._graphs.get(key)
+        if graph is None:
+            graph = engine.WorkflowGraph(engine.WorkflowDefinition(**definition))
+            self._graphs[key] = graph
+            while len(self._graphs) > 256:
+                self._graphs.popitem(last=False)
+        else:
+            self._graphs.move_to_end(key)
+        return graph
+
+    def throughput(self) -> float:
+        """Execucoes concluidas por segundo na ultima janela."""
+        cutoff = time.monotonic() - THROUGHPUT_WINDOW_SECONDS
+        while self._finished and self._finished[0] < cutoff:
+            self._finished.popleft()
+        window = min(THROUGHPUT_WINDOW_SECONDS, max(time.time() - self._started_ts, 1.0))
+        return round(len(self._finished) / window, 3)
+
+    def snapshot(self) -> Dict:
+        return {
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started_ts": self._started_ts,
+            "concurrency": self.concurrency,
+            "running": len(self._jobs),
+            **self._counts,
+            "throughput": self.throughput(),
+        }
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        await asyncio.to_thread(self.queue.heartbeat, self.worker_id, [], self.visibility_timeout,
+                                self.snapshot())
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
+        print(f"[Worker {self.worker_id}] Consumindo a work queue ({self.queue.backend}, "
+              f"concorrencia {self.concurrency})")
+        try:
+            while not self._stopping.is_set():
+                free = self.concurrency - len(self._jobs)
+                jobs = []
+                if free > 0:
+                    try:
+                        jobs = await asyncio.to_thread(self.queue.claim, self.worker_id, free,
+                                                       self.visibility_timeout)
+                    except Exception as e:
+                        print(f"[Worker {self.worker_id}] Falha no claim: {e}")
+                for job in jobs:
+                    self._counts["claimed"] += 1
+                    task = asyncio.create_task(self._process(job))
+                    self._jobs[job["id"]] = task
+                    task.add_done_callback(lambda _, job_id=job["id"]: self._jobs.pop(job_id, None))
+                if not jobs:
+                    # Fila vazia (ou worker cheio): espera o poll ou a primeira vaga
+                    waiters = [asyncio.ensure_future(self._stopping.wait())]
+                    if free <= 0:
+                        waiters.extend(self._jobs.values())
+                    await asyncio.wait(waiters, timeout=self.poll_interval,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    waiters[0].cancel()
+        finally:
+            await self._drain()
+            heartbeat.cancel()
+            await asyncio.to_thread(self.queue.heartbeat, self.worker_id, [], self.visibility_timeout,
+                                    self.snapshot())
+            await engine.http_pool.close()
+
+    async def _drain(self):
+        if self._jobs:
+            await asyncio.wait(list(self._jobs.values()), timeout=self.drain_timeout)
+        pending = list(self._jobs)
+        for task in list(self._jobs.values()):
+            task.cancel()
+        if pending:
+            released = await asyncio.to_thread(self.queue.release, pending, self.worker_id)
+            print(f"[Worker {self.worker_id}] {released} jobs devolvidos a fila no desligamento")
+
+    async def _process(self, job: Dict):
+        payload = job["payload"]
+        execution = payload["execution"]
+        execution["worker_id"] = self.worker_id
+        execution["attempt"] = job["attempts"]
+        try:
+            graph = self._graph(payload["workflow"])
+        except Exception as e:
+            execution.update(status="error", error=f"Definicao de workflow invalida: {e}",
+                             completed_at=datetime.now().isoformat())
+        else:
+            await self.executor.run_execution(execution, graph)
+        try:
+            owned = await asyncio.to_thread(self.queue.complete, job["id"], self.worker_id, execution)
+        except Exception as e:
+            print(f"[Worker {self.worker_id}] Falha ao gravar {job['id']}: {e}")
+            owned = False
+        if not owned:
+            # Lease expirou e outro worker reivindicou o job: este resultado e descartado
+            self._counts["lost"] += 1
+            return
+        self._counts["failed" if execution["status"] == "error" else "completed"] += 1
+        self._finished.append(time.monotonic())
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.queue.heartbeat, self.worker_id, list(self._jobs),
+                                        self.visibility_timeout, self.snapshot())
+            except Exception as e:
+                print(f"[Worker {self.worker_id}] Falha no heartbeat: {e}")
+
+
+def parse_args(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="Workers da work queue do Automation Engine")
+    parser.add_argument("--processes", type=int, default=int(env("AUTOMATION_WORKER_PROCESSES", "1")),
+                        help="Processos worker (padrao 1; use o numero de nucleos)")
+    parser.add_argument("--concurrency", type=int, default=int(env("AUTOMATION_WORKER_CONCURRENCY", "10")),
+                        help="Execucoes simultaneas por processo")
+    parser.add_argument("--visibility-timeout", type=float,
+                        default=float(env("AUTOMATION_WORKER_VISIBILITY_SECONDS", "60")),
+                        help="Lease de cada job; expira se o worker parar de mandar heartbeat")
+    parser.add_argument("--heartbeat-interval", type=float,
+                        default=float(env("AUTOMATION_WORKER_HEARTBEAT_SECONDS", "10")))
+    parser.add_argument("--poll-interval", type=float, default=float(env("AUTOMATION_WORKER_POLL_SECONDS", "0.5")))
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Espera pelos jobs em andamento ao desligar")
+    return parser.parse_args(argv)
+
+
+def run_worker(args) -> int:
+    queue = engine.work_queue
+    if queue is None:
+        print("[Worker] AUTOMATION_WORK_QUEUE desligado ou indisponivel; nada a consumir")
+        return 1
+    worker = WorkflowWorker(queue, concurrency=args.concurrency, visibility_timeout=args.visibility_timeout,
+                            heartbeat_interval=args.heartbeat_interval, poll_interval=args.poll_interval,
+                            drain_timeout=args.drain_timeout)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+
+    try:
+        asyncio.run(main())
+    finally:
+        queue.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.processes <= 1:
+        return run_worker(args)
+    # spawn: cada processo abre suas proprias conexoes (nada herdado via fork)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(args,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+    return max((process.exitcode or 0) for process in processes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
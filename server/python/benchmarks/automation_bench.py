@@ -0,0 +1,163 @@
+"""
+Arcadia Automation Engine - Benchmark de execucao de workflows
+Submete N execucoes simultaneas (padrao 1000) de um workflow com delay e
+passos de acao contra o app FastAPI do Automation Engine (in-process, via
+httpx.ASGITransport), acompanha cada uma por long-poll e mede, ao mesmo
+tempo, a latencia de /health para verificar que o event loop continua
+responsivo durante a carga. Ao final verifica que, em modo work queue
+(executor com defer_events, como nos workers), eventos emitidos dentro de
+parallel e loop chegam ao event bus quando a API recolhe a execucao.
+
+    python -m server.python.benchmarks.automation_bench --executions 1000 \\
+        --delay 1.0 --output bench_automation.json
+
+Executar a partir da raiz do repositorio.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from server.python.benchmarks.bi_engine_bench import git_revision, peak_rss_mb, percentile
+
+BENCH_WORKFLOW = "bench-workflow"
+
+
+def summarize_ms(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0,
+    }
+
+
+async def check_queue_events(engine) -> Dict[str, Any]:
+    """Roda um workflow com emit_event no topo, em parallel e em loop como um worker faria."""
+    emit = {"type": "action", "config": {"type": "emit_event", "event_type": "bench.queued"}}
+    workflow = engine.WorkflowDefinition(id="bench-queue-events", name="bench", steps=[
+        engine.WorkflowStep(id="top", **emit),
+        engine.WorkflowStep(id="fan", type="parallel", config={"branches": [[{"id": "p0", **emit}], [{"id": "p1", **emit}]]}),
+        engine.WorkflowStep(id="each", type="loop", config={"source": "items", "steps": [{"id": "l", **emit}]}),
+    ])
+    worker_executor = engine.WorkflowExecutor(defer_events=True)
+    worker_executor.register(workflow)
+    execution = worker_executor._new_execution(workflow.id, variables={"items": [1, 2, 3]})
+    await worker_executor.run_execution(execution, worker_executor.graph(workflow.id))
+
+    before = len(engine.event_bus.get_history(limit=100, event_type="bench.queued"))
+    engine.workflow_executor._finish_queued({"id": execution["id"], "result": execution, "payload": {},
+                                             "attempts": 1, "worker_id": "bench"})
+    emitted = len(engine.event_bus.get_history(limit=100, event_type="bench.queued")) - before
+    return {"status": execution["status"], "deferred_emitted": emitted, "queue_events_ok": emitted == 6}
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    import httpx
+
+    # Benchmark isolado: sem event log/execution store em disco e sem eleicao de lider
+    os.environ["AUTOMATION_EVENT_LOG_DIR"] = ""
+    os.environ["AUTOMATION_EXECUTION_STORE"] = "off"
+    os.environ["AUTOMATION_LEADER_ELECTION"] = "off"
+    os.environ["AUTOMATION_MAX_CONCURRENT_EXECUTIONS"] = str(args.max_concurrent)
+    engine = importlib.import_module("server.python.automation_engine")
+
+    steps = [{"id": "wait", "type": "delay", "config": {"seconds": args.delay}}]
+    steps += [{"id": f"act{i}", "type": "action", "config": {"type": "set_variable", "key": f"v{i}", "value": i}}
+              for i in range(args.steps)]
+    transport = httpx.ASGITransport(app=engine.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://automation-bench", timeout=300) as client:
+        resp = await client.post("/workflows/register", json={"id": BENCH_WORKFLOW, "name": "bench", "steps": steps})
+        resp.raise_for_status()
+
+        submit_ms: List[float] = []
+        completion_ms: List[float] = []
+        health_ms: List[float] = []
+        statuses: Dict[str, int] = {}
+        done = asyncio.Event()
+
+        async def probe_health():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/health")
+                health_ms.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(0.05)
+
+        async def one_execution():
+            t0 = time.perf_counter()
+            resp = await client.post(f"/workflows/{BENCH_WORKFLOW}/execute")
+            submit_ms.append((time.perf_counter() - t0) * 1000)
+            execution_id = resp.json()["execution_id"]
+            status = "queued"
+            while status in ("queued", "running"):
+                body = (await client.get(f"/executions/{execution_id}", params={"wait": 30})).json()
+                status = body["status"]
+            completion_ms.append((time.perf_counter() - t0) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        prober = asyncio.create_task(probe_health())
+        started = time.perf_counter()
+        await asyncio.gather(*(one_execution() for _ in range(args.executions)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+        checks = await check_queue_events(engine)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "executions": args.executions,
+            "delay_seconds": args.delay,
+            "action_steps": args.steps,
+            "max_concurrent": args.max_concurrent,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "throughput_executions_per_s": round(args.executions / elapsed, 2) if elapsed > 0 else 0,
+        "statuses": statuses,
+        "submit": summarize_ms(submit_ms),
+        "completion": summarize_ms(completion_ms),
+        "health_during_load": summarize_ms(health_ms),
+        "peak_rss_mb": peak_rss_mb(),
+        "checks": checks,
+    }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de execucao concorrente de workflows")
+    parser.add_argument("--executions", type=int, default=1000, help="Execucoes submetidas simultaneamente")
+    parser.add_argument("--delay", type=float, default=1.0, help="Segundos do passo delay de cada execucao")
+    parser.add_argument("--steps", type=int, default=5, help="Passos de acao apos o delay")
+    parser.add_argument("--max-concurrent", type=int, default=1000, help="Limite de execucoes em andamento")
+    parser.add_argument("--output", default="bench_automation.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    print(f"[bench] {args.executions} execucoes em {report['elapsed_s']}s "
+          f"({report['throughput_executions_per_s']} exec/s) status={report['statuses']}")
+    print(f"[bench] submit p99={report['submit']['p99_ms']}ms conclusao p50={report['completion']['p50_ms']}ms "
+          f"p99={report['completion']['p99_ms']}ms /health p99={report['health_during_load']['p99_ms']}ms")
+    print(f"[bench] verificacoes {report['checks']}")
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] relatorio gravado em {args.output}")
+    return 0 if report["checks"]["queue_events_ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
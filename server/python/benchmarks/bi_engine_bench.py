@@ -0,0 +1,449 @@
+"""
+Arcadia BI Engine - Benchmark reproduzivel
+Sobe um PostgreSQL local efemero (initdb/pg_ctl, sem container) ou usa
+--database-url, popula tabelas sinteticas na escala pedida e dispara
+cargas concorrentes de /chart-data, /micro-bi e /query contra o app FastAPI
+do BI Engine (in-process, via httpx.ASGITransport).
+
+O resultado (p50/p95/p99 e throughput das respostas 2xx, erros por status,
+RSS no inicio/pico de cada carga) e gravado em JSON para
+comparacao entre versoes:
+
+    python -m server.python.benchmarks.bi_engine_bench --rows 1e5 \\
+        --concurrency 16 --requests 2000 --output bench_bi.json
+    python -m server.python.benchmarks.bi_engine_bench --rows 1e5 \\
+        --compare bench_bi.json --output bench_bi_new.json
+
+Executar a partir da raiz do repositorio.
+"""
+
+import argparse
+import asyncio
+import glob
+import importlib
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_TABLE = "bench_sales"
+DEFAULT_WORKLOADS = ("chart", "micro_bi", "query")
+
+REGIONS = ["norte", "nordeste", "centro_oeste", "sudeste", "sul"]
+CHANNELS = ["loja", "ecommerce", "marketplace", "televendas"]
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+
+
+# ==================== POSTGRES EFEMERO ====================
+
+def _find_pg_binary(name: str) -> Optional[str]:
+    pg_bin = os.environ.get("PG_BIN")
+    if pg_bin and os.path.exists(os.path.join(pg_bin, name)):
+        return os.path.join(pg_bin, name)
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(glob.glob(f"/usr/lib/postgresql/*/bin/{name}")) + \
+        sorted(glob.glob(f"/usr/local/pgsql/bin/{name}"))
+    return candidates[-1] if candidates else None
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class EphemeralPostgres:
+    """Instancia PostgreSQL descartavel em diretorio temporario, sem durabilidade."""
+
+    def __init__(self):
+        self.initdb = _find_pg_binary("initdb")
+        self.pg_ctl = _find_pg_binary("pg_ctl")
+        if not self.initdb or not self.pg_ctl:
+            raise RuntimeError("initdb/pg_ctl nao encontrados (defina PG_BIN ou use --database-url)")
+        self.tmpdir = ""
+        self.port = 0
+
+    @property
+    def datadir(self) -> str:
+        return os.path.join(self.tmpdir, "data")
+
+    @property
+    def url(self) -> str:
+        return f"postgresql://bench@127.0.0.1:{self.port}/postgres"
+
+    def __enter__(self) -> "EphemeralPostgres":
+        self.tmpdir = tempfile.mkdtemp(prefix="arcadia-bench-pg-")
+        self.port = _free_port()
+        subprocess.run(
+            [self.initdb, "-D", self.datadir, "-U", "bench", "-A", "trust", "-E", "UTF8", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        options = (
+            f"-p {self.port} -k {self.tmpdir} -c listen_addresses=127.0.0.1 "
+            "-c fsync=off -c synchronous_commit=off -c full_page_writes=off"
+        )
+        subprocess.run(
+            [self.pg_ctl, "-D", self.datadir, "-o", options, "-l", os.path.join(self.tmpdir, "pg.log"), "-w", "start"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            subprocess.run([self.pg_ctl, "-D", self.datadir, "-m", "fast", "-w", "stop"],
+                           check=False, stdout=subprocess.DEVNULL)
+        finally:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+# ==================== DADOS SINTETICOS ====================
+
+def seed_database(database_url: str, rows: int, seed: int) -> Dict[str, Any]:
+    import psycopg2
+
+    start = time.perf_counter()
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("SELECT setseed(%s)", (((seed % 1000) / 1000.0),))
+    cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cur.execute(f"""
+        CREATE TABLE {BENCH_TABLE} (
+            id          BIGSERIAL PRIMARY KEY,
+            created_at  TIMESTAMP NOT NULL,
+            region      TEXT NOT NULL,
+            channel     TEXT NOT NULL,
+            product     TEXT NOT NULL,
+            amount      NUMERIC(12, 2) NOT NULL,
+            quantity    INTEGER NOT NULL
+        )
+    """)
+    cur.execute(f"""
+        INSERT INTO {BENCH_TABLE} (created_at, region, channel, product, amount, quantity)
+        SELECT
+            NOW() - (random() * INTERVAL '730 days'),
+            (%s::text[])[1 + floor(random() * %s)::int],
+            (%s::text[])[1 + floor(random() * %s)::int],
+            'produto_' || (1 + floor(random() * 500)::int),
+            round((random() * 2000)::numeric, 2),
+            1 + floor(random() * 20)::int
+        FROM generate_series(1, %s)
+    """, (REGIONS, len(REGIONS), CHANNELS, len(CHANNELS), rows))
+    cur.execute(f"CREATE INDEX ON {BENCH_TABLE} (created_at)")
+    cur.execute(f"ANALYZE {BENCH_TABLE}")
+    cur.execute("SHOW server_version")
+    version = cur.fetchone()[0]
+    conn.close()
+    return {"rows": rows, "seed_seconds": round(time.perf_counter() - start, 2), "server_version": version}
+
+
+# ==================== CARGAS ====================
+
+def chart_requests(rng: random.Random, variants: int) -> List[Dict]:
+    pool = []
+    for i in range(variants):
+        pool.append({
+            "table": BENCH_TABLE,
+            "x_axis": rng.choice(["region", "channel", "created_at"]),
+            "y_axis": rng.choice(["amount", "quantity"]),
+            "aggregation": rng.choice(["sum", "avg", "count", "max"]),
+            "group_by": rng.choice([None, "channel"]),
+            "time_grain": None,
+            "filters": [{"column": "quantity", "operator": ">=", "value": i % 20}],
+            "limit": 100,
+        })
+        if pool[-1]["x_axis"] == "created_at":
+            pool[-1]["time_grain"] = rng.choice(["day", "week", "month"])
+    return [{"path": "/chart-data", "json": body} for body in pool]
+
+
+def micro_bi_requests(rng: random.Random, variants: int) -> List[Dict]:
+    pool = []
+    for i in range(variants):
+        pool.append({
+            "table": BENCH_TABLE,
+            "metrics": ["count", "sum:amount", "avg:quantity"],
+            "dimension": rng.choice([None, "region", "channel"]),
+            "period": rng.choice(["week", "month", "quarter", "year"]),
+            "compare_previous": rng.random() < 0.5,
+            "filters": [{"column": "amount", "operator": ">", "value": i}],
+        })
+    return [{"path": "/micro-bi", "json": body} for body in pool]
+
+
+def query_requests(rng: random.Random, variants: int) -> List[Dict]:
+    pool = []
+    for i in range(variants):
+        region = rng.choice(REGIONS)
+        pool.append({
+            "sql": (
+                f"SELECT product, SUM(amount) AS total, COUNT(*) AS n FROM {BENCH_TABLE} "
+                f"WHERE region = '{region}' AND quantity > {i % 20} "
+                f"GROUP BY product ORDER BY total DESC"
+            ),
+            "limit": 500,
+            "use_cache": True,
+        })
+    return [{"path": "/query", "json": body} for body in pool]
+
+
+WORKLOAD_BUILDERS: Dict[str, Callable[[random.Random, int], List[Dict]]] = {
+    "chart": chart_requests,
+    "micro_bi": micro_bi_requests,
+    "query": query_requests,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def peak_rss_mb() -> float:
+    """Pico de RSS acumulado do processo (desde o inicio, nao por carga)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def current_rss_mb() -> Optional[float]:
+    """RSS atual via /proc (Linux); None onde nao houver."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler:
+    """Amostra o RSS durante uma carga para medir o pico dela (e nao o acumulado)."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self):
+        while True:
+            rss = current_rss_mb()
+            if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+                self.peak_mb = rss
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.start_mb is not None:
+            self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> Dict[str, Optional[float]]:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.start_mb is None:
+            return {"rss_start_mb": None, "rss_peak_mb": None, "rss_delta_mb": None}
+        rss = current_rss_mb()
+        if rss is not None:
+            self.peak_mb = max(self.peak_mb, rss)
+        return {
+            "rss_start_mb": round(self.start_mb, 1),
+            "rss_peak_mb": round(self.peak_mb, 1),
+            "rss_delta_mb": round(self.peak_mb - self.start_mb, 1),
+        }
+
+
+async def run_workload(app, name: str, pool: List[Dict], total: int, concurrency: int,
+                       warmup: int, rng: random.Random) -> Dict[str, Any]:
+    import httpx
+
+    schedule = [rng.choice(pool) for _ in range(total)]
+    # Latencias so de respostas 2xx: rejeicoes (429/503) e erros sao contados a parte
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bi-bench", timeout=120) as client:
+        for req in pool[:warmup]:
+            await client.post(req["path"], json=req["json"], headers={"X-Tenant-Id": "bench-warmup"})
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for req in schedule:
+            queue.put_nowait(req)
+
+        async def worker(client_id: int):
+            # Cada cliente simulado e um tenant: o admission control nao junta todos no "anonymous"
+            headers = {"X-Tenant-Id": f"bench-{client_id}"}
+            while True:
+                try:
+                    req = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.post(req["path"], json=req["json"], headers=headers)
+                except Exception as e:
+                    key = type(e).__name__
+                    errors[key] = errors.get(key, 0) + 1
+                    continue
+                if 200 <= resp.status_code < 300:
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                else:
+                    key = str(resp.status_code)
+                    errors[key] = errors.get(key, 0) + 1
+
+        rss = RssSampler()
+        rss.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        memory = await rss.stop()
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0,
+        **memory,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_reports(baseline: Dict, current: Dict, threshold_pct: float) -> List[str]:
+    """Retorna a lista de regressoes acima do limite (latencias maiores ou throughput menor)."""
+    regressions = []
+    for name, cur in current.get("workloads", {}).items():
+        base = baseline.get("workloads", {}).get(name)
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            b, c = base.get(metric), cur.get(metric)
+            if not b or c is None:
+                continue
+            delta = (c - b) / b * 100
+            worse = delta < -threshold_pct if metric == "throughput_rps" else delta > threshold_pct
+            flag = "  REGRESSAO" if worse else ""
+            print(f"  {name:10s} {metric:15s} {b:>12.3f} -> {c:>12.3f} ({delta:+.1f}%){flag}")
+            if worse:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+async def run_benchmark(args, database_url: str) -> Dict[str, Any]:
+    os.environ["DATABASE_URL"] = database_url
+    # Mede o motor, nao o rate limit: desliga o token bucket por tenant (sobrescrevivel)
+    os.environ.setdefault("BI_TENANT_RATE_LIMIT", "0")
+    seed_info = seed_database(database_url, args.rows, args.seed)
+    print(f"[bench] {seed_info['rows']} linhas geradas em {seed_info['seed_seconds']}s "
+          f"(PostgreSQL {seed_info['server_version']})")
+
+    bi_engine = importlib.import_module("server.python.bi_engine")
+    rng = random.Random(args.seed)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": args.rows,
+            "seed": args.seed,
+            "variants": args.variants,
+            "postgres_version": seed_info["server_version"],
+        },
+        "workloads": {},
+    }
+
+    for name in args.workloads:
+        bi_engine.cache.invalidate()
+        pool = WORKLOAD_BUILDERS[name](rng, args.variants)
+        result = await run_workload(bi_engine.app, name, pool, args.requests, args.concurrency, args.warmup, rng)
+        result["cache"] = bi_engine.cache.stats()
+        report["workloads"][name] = result
+        print(f"[bench] {name:10s} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+              f"p99={result['p99_ms']}ms {result['throughput_rps']} req/s erros={result['errors']} "
+              f"rss+{result['rss_delta_mb']}MB")
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark reproduzivel do Arcadia BI Engine")
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"),
+                        help="PostgreSQL existente (padrao: instancia efemera via initdb)")
+    parser.add_argument("--rows", type=lambda v: int(float(v)), default=10_000,
+                        help="Linhas da tabela sintetica (1e4 a 1e7)")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests por carga")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=5, help="Requests de aquecimento por carga")
+    parser.add_argument("--variants", type=int, default=50,
+                        help="Variacoes distintas por carga (controla a taxa de acerto do cache)")
+    parser.add_argument("--workloads", default=",".join(DEFAULT_WORKLOADS),
+                        type=lambda v: [w.strip() for w in v.split(",") if w.strip()])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_bi_engine.json")
+    parser.add_argument("--compare", help="Relatorio JSON anterior para comparacao")
+    parser.add_argument("--fail-threshold", type=float, default=10.0,
+                        help="Percentual de piora que faz o processo sair com codigo 1")
+    args = parser.parse_args(argv)
+    unknown = [w for w in args.workloads if w not in WORKLOAD_BUILDERS]
+    if unknown:
+        parser.error(f"cargas desconhecidas: {unknown}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    if args.database_url:
+        report = asyncio.run(run_benchmark(args, args.database_url))
+    else:
+        with EphemeralPostgres() as pg:
+            report = asyncio.run(run_benchmark(args, pg.url))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] relatorio gravado em {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"[bench] comparacao com {args.compare} (limite {args.fail_threshold}%):")
+        if compare_reports(baseline, report, args.fail_threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Arcadia Cron - Benchmark do calculo de proxima execucao
+Mede compilacao e next_run das expressoes compiladas (server/python/cron.py)
+contra a varredura minuto a minuto usada anteriormente, e confere que as
+duas estrategias concordam. Usa apenas a biblioteca padrao:
+
+    python -m server.python.benchmarks.cron_bench --iterations 20000
+    python -m server.python.benchmarks.cron_bench --output bench_cron.json
+
+Executar a partir da raiz do repositorio.
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from server.python.cron import CronExpression
+
+DEFAULT_EXPRESSIONS = (
+    "* * * * *",
+    "*/15 9-17 * * mon-fri",
+    "0 9 * * 1",
+    "30 4 1,15 * 5",
+    "0 0 1 1 *",
+    "0 0 29 2 *",
+    "59 23 31 * *",
+)
+
+# Limite da varredura legada (um ano de minutos, como no algoritmo antigo)
+SCAN_LIMIT_MINUTES = 525960
+
+
+def minute_scan_next_run(cron: CronExpression, from_dt: datetime,
+                         limit: int = SCAN_LIMIT_MINUTES) -> Optional[datetime]:
+    """Estrategia anterior: testa cada minuto ate casar ou esgotar o limite."""
+    dt = from_dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    for _ in range(limit):
+        if cron.matches(dt):
+            return dt
+        dt += timedelta(minutes=1)
+    return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_us(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(s * 1e6 for s in samples)
+    return {
+        "p50_us": round(percentile(ordered, 50), 2),
+        "p99_us": round(percentile(ordered, 99), 2),
+        "max_us": round(ordered[-1], 2),
+    }
+
+
+def bench_expression(expr: str, starts: List[datetime], scan_samples: int) -> Dict[str, Any]:
+    compile_times = []
+    for _ in range(200):
+        t0 = time.perf_counter()
+        CronExpression(expr)
+        compile_times.append(time.perf_counter() - t0)
+
+    cron = CronExpression(expr)
+    next_times = []
+    for start in starts:
+        t0 = time.perf_counter()
+        cron.next_run(start)
+        next_times.append(time.perf_counter() - t0)
+
+    scan_times = []
+    mismatches = 0
+    for start in starts[:scan_samples]:
+        t0 = time.perf_counter()
+        scanned = minute_scan_next_run(cron, start)
+        scan_times.append(time.perf_counter() - t0)
+        if scanned is not None and scanned != cron.next_run(start):
+            mismatches += 1
+
+    result = {
+        "expression": expr,
+        "compile": summarize_us(compile_times),
+        "next_run": summarize_us(next_times),
+        "mismatches": mismatches,
+    }
+    if scan_times:
+        result["minute_scan"] = summarize_us(scan_times)
+        result["speedup_p50"] = round(result["minute_scan"]["p50_us"] / max(result["next_run"]["p50_us"], 0.01), 1)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do calculo de proxima execucao cron")
+    parser.add_argument("--iterations", type=int, default=10000, help="Chamadas de next_run por expressao")
+    parser.add_argument("--scan-samples", type=int, default=20,
+                        help="Chamadas da varredura minuto a minuto por expressao (0 desativa)")
+    parser.add_argument("--expressions", default=";".join(DEFAULT_EXPRESSIONS),
+                        help="Expressoes separadas por ';'")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Grava o relatorio JSON neste arquivo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    origin = datetime(2024, 1, 1)
+    starts = [origin + timedelta(minutes=rng.randrange(0, 4 * 525960)) for _ in range(args.iterations)]
+
+    results = []
+    for expr in [e.strip() for e in args.expressions.split(";") if e.strip()]:
+        result = bench_expression(expr, starts, args.scan_samples)
+        results.append(result)
+        line = (f"[bench] {expr:<24} compile p50 {result['compile']['p50_us']:>8.2f}us  "
+                f"next_run p50 {result['next_run']['p50_us']:>8.2f}us p99 {result['next_run']['p99_us']:>8.2f}us")
+        if "minute_scan" in result:
+            line += f"  varredura p50 {result['minute_scan']['p50_us']:>12.2f}us ({result['speedup_p50']}x)"
+        print(line)
+
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] relatorio gravado em {args.output}")
+
+    if any(r["mismatches"] for r in results):
+        print("[bench] divergencia entre next_run e a varredura minuto a minuto")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
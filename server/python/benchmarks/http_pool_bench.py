@@ -0,0 +1,243 @@
+"""
+Arcadia HTTP Pool - Benchmark e verificacao contra servidor stub local
+Sobe um servidor HTTP/1.1 keep-alive em um processo separado (127.0.0.1,
+porta livre, fora do GIL do cliente) e
+compara o pool compartilhado (server/python/http_pool.py) com o passo HTTP
+anterior (urllib com conexao nova por requisicao via asyncio.to_thread),
+ambos com N requisicoes simultaneas contra um endpoint com latencia
+simulada. Tambem confere retries (/flaky), circuit breaker (/down) e limite
+de tamanho (/big):
+
+    python -m server.python.benchmarks.http_pool_bench --requests 2000 \\
+        --concurrency 20 --latency-ms 50 --output bench_http_pool.json
+
+Executar a partir da raiz do repositorio.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+from server.python.benchmarks.bi_engine_bench import git_revision, percentile
+from server.python.http_pool import CircuitOpenError, HttpPool
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabecalho e corpo saem em writes separados; sem isso Nagle + delayed
+    # ACK somam ~40ms por resposta em conexoes keep-alive.
+    disable_nagle_algorithm = True
+    flaky_counts: Dict[str, int] = {}
+    connections = None  # multiprocessing.Value compartilhado com o benchmark
+
+    def setup(self):
+        super().setup()
+        with StubHandler.connections.get_lock():
+            StubHandler.connections.value += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == "/ok":
+            delay_ms = float(query.get("delay_ms", ["0"])[0])
+            if delay_ms:
+                time.sleep(delay_ms / 1000)
+            self._reply(200, b'{"ok": true}')
+        elif parts.path == "/big":
+            size = int(query.get("bytes", ["1000000"])[0])
+            self._reply(200, b"x" * size, "text/plain")
+        elif parts.path == "/flaky":
+            key = query.get("key", [""])[0]
+            failures = int(query.get("failures", ["2"])[0])
+            seen = StubHandler.flaky_counts.get(key, 0)
+            StubHandler.flaky_counts[key] = seen + 1
+            if seen < failures:
+                self._reply(503, b'{"error": "indisponivel"}')
+            else:
+                self._reply(200, b'{"ok": true, "attempt": %d}' % (seen + 1))
+        elif parts.path == "/down":
+            self._reply(500, b'{"error": "fora do ar"}')
+        else:
+            self._reply(404, b'{"error": "nao encontrado"}')
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def _serve(ports, connections):
+    StubHandler.connections = connections
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+class Stub:
+    def __init__(self):
+        self.connections = multiprocessing.Value("i", 0)
+        ports = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve, args=(ports, self.connections), daemon=True)
+        self.process.start()
+        self.base = f"http://127.0.0.1:{ports.get(timeout=10)}"
+
+    def connection_count(self) -> int:
+        return self.connections.value
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(5)
+
+
+def summarize_ms(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50_ms": round(percentile(values, 50), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+    }
+
+
+async def bench_urllib(stub: Stub, url: str, total: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    gate = asyncio.Semaphore(concurrency)
+
+    def fetch():
+        with urllib.request.urlopen(urllib.request.Request(url), timeout=10) as resp:
+            resp.read()
+
+    async def one():
+        async with gate:
+            t0 = time.perf_counter()
+            await asyncio.to_thread(fetch)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    before = stub.connection_count()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    return {"elapsed_s": round(elapsed, 3), "requests_per_s": round(total / elapsed, 1),
+            "connections": stub.connection_count() - before, **summarize_ms(latencies)}
+
+
+async def bench_pool(stub: Stub, pool: HttpPool, url: str, total: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            t0 = time.perf_counter()
+            await pool.request("GET", url)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    before = stub.connection_count()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    return {"elapsed_s": round(elapsed, 3), "requests_per_s": round(total / elapsed, 1),
+            "connections": stub.connection_count() - before, **summarize_ms(latencies)}
+
+
+async def check_behaviour(base: str) -> Dict[str, Any]:
+    checks: Dict[str, Any] = {}
+
+    pool = HttpPool(retries=3, backoff_seconds=0.01, breaker_threshold=3, breaker_reset_seconds=60)
+    flaky = await pool.request("GET", f"{base}/flaky?key=bench&failures=2")
+    checks["retry_recovers"] = flaky["status"] == 200 and flaky["attempts"] == 3
+
+    big = await pool.request("GET", f"{base}/big?bytes=500000", max_bytes=100000)
+    checks["truncates_large_body"] = big["truncated"] and big["bytes"] == 100000
+    try:
+        await pool.request("GET", f"{base}/big?bytes=500000", max_bytes=100000, on_oversize="error")
+        checks["rejects_large_body"] = False
+    except ValueError:
+        checks["rejects_large_body"] = True
+
+    # Host separado (localhost x 127.0.0.1) para o breaker nao afetar os demais
+    down = base.replace("127.0.0.1", "localhost") + "/down"
+    for _ in range(3):
+        await pool.request("GET", down, retries=0)
+    try:
+        await pool.request("GET", down, retries=0)
+        checks["circuit_opens"] = False
+    except CircuitOpenError:
+        checks["circuit_opens"] = True
+    checks["pool_stats"] = pool.stats()
+    await pool.close()
+    return checks
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pool HTTP contra servidor stub local")
+    parser.add_argument("--requests", type=int, default=2000, help="Requisicoes por estrategia")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requisicoes simultaneas")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latencia simulada do endpoint")
+    parser.add_argument("--output", help="Grava o relatorio JSON neste arquivo")
+    return parser.parse_args(argv)
+
+
+async def run(args) -> Dict[str, Any]:
+    stub = Stub()
+    try:
+        url = f"{stub.base}/ok?delay_ms={args.latency_ms}"
+        urllib_result = await bench_urllib(stub, url, args.requests, args.concurrency)
+        pool = HttpPool(max_per_host=args.concurrency, max_keepalive=args.concurrency)
+        pool_result = await bench_pool(stub, pool, url, args.requests, args.concurrency)
+        await pool.close()
+        checks = await check_behaviour(stub.base)
+    finally:
+        stub.stop()
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "cpus": os.cpu_count(),
+        },
+        "urllib_per_request": urllib_result,
+        "pooled": pool_result,
+        "speedup": round(pool_result["requests_per_s"] / max(urllib_result["requests_per_s"], 0.1), 2),
+        "checks": checks,
+    }
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    for name in ("urllib_per_request", "pooled"):
+        r = report[name]
+        print(f"[bench] {name:<20} {r['requests_per_s']:>9.1f} req/s  p50 {r['p50_ms']:.2f}ms  "
+              f"p99 {r['p99_ms']:.2f}ms  conexoes {r['connections']}")
+    checks = {k: v for k, v in report["checks"].items() if k != "pool_stats"}
+    print(f"[bench] speedup {report['speedup']}x  verificacoes {checks}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] relatorio gravado em {args.output}")
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
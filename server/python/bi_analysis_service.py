@@ -8,13 +8,20 @@ import json
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
 import pandas as pd
 import numpy as np
 
+try:
+    from .instrumentation import instrument_app
+    from .dataset_store import DatasetStore, DatasetTooLarge
+except ImportError:
+    from instrumentation import instrument_app
+    from dataset_store import DatasetStore, DatasetTooLarge
+
 app = FastAPI(
     title="Arcádia BI Analysis Service",
     description="Análise de dados com Pandas para o módulo de BI",
@@ -29,9 +36,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "bi-analysis")
+
+datasets = DatasetStore.from_env()
+
 
 class AnalysisRequest(BaseModel):
-    data: List[Dict[str, Any]] = Field(..., description="Dados para análise em formato JSON")
+    data: Optional[List[Dict[str, Any]]] = Field(None, description="Dados para análise em formato JSON")
+    dataset_id: Optional[str] = Field(None, description="Handle retornado por POST /datasets, no lugar de data")
     question: Optional[str] = Field(None, description="Pergunta específica sobre os dados")
 
 
@@ -61,6 +73,58 @@ class AnalysisResult(BaseModel):
     suggested_charts: List[Dict[str, Any]]
 
 
+FILTER_OPERATORS = {
+    "eq": lambda x, v: x == v,
+    "ne": lambda x, v: x != v,
+    "gt": lambda x, v: x > v,
+    "gte": lambda x, v: x >= v,
+    "lt": lambda x, v: x < v,
+    "lte": lambda x, v: x <= v,
+    "in": lambda x, v: x.isin(v if isinstance(v, list) else [v]),
+    # Substring literal (regex=False): ".", "*", "(" etc. não são mais padrões de regex
+    "contains": lambda x, v: x.str.contains(str(v), case=False, na=False, regex=False),
+    "startswith": lambda x, v: x.str.startswith(str(v), na=False),
+    "endswith": lambda x, v: x.str.endswith(str(v), na=False),
+    "is_null": lambda x, v: x.isna(),
+    "not_null": lambda x, v: x.notna(),
+}
+
+AGG_FUNCTIONS = {
+    "sum": "sum",
+    "mean": "mean",
+    "avg": "mean",
+    "count": "count",
+    "min": "min",
+    "max": "max",
+    "median": "median",
+    "std": "std",
+    "nunique": "nunique",
+}
+
+DERIVE_OPERATORS = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+    "div": lambda a, b: a / b,
+    "mod": lambda a, b: a % b,
+    "pow": lambda a, b: a ** b,
+}
+
+PIPELINE_OPERATIONS = ("filter", "derive", "select", "group_by", "sort", "top_k", "pivot")
+
+
+class DatasetRequest(BaseModel):
+    data: List[Dict[str, Any]] = Field(..., description="Registros do dataset em formato JSON")
+    name: Optional[str] = Field(None, description="Nome descritivo do dataset")
+
+
+class PipelineRequest(BaseModel):
+    data: Optional[List[Dict[str, Any]]] = Field(None, description="Dados de entrada em formato JSON")
+    dataset_id: Optional[str] = Field(None, description="Handle retornado por POST /datasets, no lugar de data")
+    operations: List[Dict[str, Any]] = Field(..., description="Operações aplicadas em ordem: filter, derive, select, group_by, sort, top_k, pivot")
+    limit: Optional[int] = Field(None, description="Limite de linhas no resultado")
+
+
 def analyze_column(df: pd.DataFrame, col: str) -> ColumnStats:
     """Analisa uma coluna e retorna estatísticas"""
     series = df[col]
@@ -191,6 +255,154 @@ def suggest_charts(df: pd.DataFrame) -> List[Dict[str, Any]]:
     return suggestions
 
 
+def load_frame(data: Optional[List[Dict[str, Any]]], dataset_id: Optional[str]) -> pd.DataFrame:
+    """Resolve o DataFrame a partir de um handle do store ou dos registros enviados.
+
+    Frames vindos do store são compartilhados: os chamadores não devem alterá-los in-place.
+    """
+    if dataset_id:
+        try:
+            return datasets.get(dataset_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' não encontrado ou expirado")
+    if not data:
+        raise HTTPException(status_code=400, detail="Dados vazios")
+    return pd.DataFrame(data)
+
+
+def _require_columns(df: pd.DataFrame, columns: List[str], op: str):
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Operação '{op}': colunas não encontradas {missing}")
+
+
+def _as_list(value: Any) -> List:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _filter_mask(df: pd.DataFrame, op: Dict[str, Any]) -> pd.Series:
+    """Combina as condições de um passo filter em uma única máscara booleana."""
+    conditions = op.get("conditions") or [op]
+    combine_or = op.get("mode", "and") == "or"
+    mask = None
+    for cond in conditions:
+        column, operator = cond.get("column"), cond.get("operator", "eq")
+        _require_columns(df, [column], "filter")
+        if operator not in FILTER_OPERATORS:
+            raise HTTPException(status_code=400, detail=f"Operador inválido: {operator}. Use: {list(FILTER_OPERATORS.keys())}")
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype) and operator in ("gt", "gte", "lt", "lte"):
+            series = series.astype(object)
+        cond_mask = FILTER_OPERATORS[operator](series, cond.get("value"))
+        if mask is None:
+            mask = cond_mask
+        else:
+            mask = (mask | cond_mask) if combine_or else (mask & cond_mask)
+    return mask
+
+
+def _derive_operand(df: pd.DataFrame, operand: Any):
+    if isinstance(operand, str):
+        _require_columns(df, [operand], "derive")
+        series = df[operand]
+        if pd.api.types.is_integer_dtype(series) and series.dtype.itemsize < 8:
+            series = series.astype(np.int64)
+        return series
+    if isinstance(operand, (int, float)):
+        return operand
+    raise HTTPException(status_code=400, detail=f"Operando inválido em derive: {operand!r}")
+
+
+def run_pipeline(df: pd.DataFrame, operations: List[Dict[str, Any]]) -> tuple:
+    """Executa as operações em sequência sobre um único DataFrame.
+
+    Filtros consecutivos são fundidos em uma única máscara antes do recorte, e
+    nenhuma operação altera o DataFrame de entrada.
+    """
+    steps = []
+    pending_mask = None
+    pending_steps = []
+
+    def flush_filters(frame):
+        nonlocal pending_mask
+        if pending_mask is not None:
+            frame = frame[pending_mask]
+            pending_mask = None
+        for step in pending_steps:
+            step["rows"] = len(frame)
+        pending_steps.clear()
+        return frame
+
+    for op in operations:
+        kind = op.get("op")
+        if kind == "filter":
+            mask = _filter_mask(df, op)
+            pending_mask = mask if pending_mask is None else (pending_mask & mask)
+            pending_steps.append({"op": kind})
+            steps.append(pending_steps[-1])
+            continue
+
+        df = flush_filters(df)
+        if kind == "derive":
+            name, operator = op.get("name"), op.get("operator", "add")
+            if not name or operator not in DERIVE_OPERATORS:
+                raise HTTPException(status_code=400, detail=f"derive requer 'name' e operator em {list(DERIVE_OPERATORS.keys())}")
+            values = DERIVE_OPERATORS[operator](_derive_operand(df, op.get("left")), _derive_operand(df, op.get("right")))
+            if op.get("round") is not None:
+                values = values.round(int(op["round"]))
+            df = df.assign(**{name: values})
+        elif kind == "select":
+            columns = _as_list(op.get("columns"))
+            _require_columns(df, columns, kind)
+            df = df[columns]
+        elif kind == "group_by":
+            by = _as_list(op.get("by"))
+            if not by:
+                raise HTTPException(status_code=400, detail="group_by requer ao menos uma coluna em 'by'")
+            aggregations = op.get("aggregations") or []
+            _require_columns(df, by + [a.get("column") for a in aggregations], kind)
+            named = {}
+            for agg in aggregations:
+                func = AGG_FUNCTIONS.get(agg.get("function", "sum"))
+                if func is None:
+                    raise HTTPException(status_code=400, detail=f"Função de agregação inválida. Use: {list(AGG_FUNCTIONS.keys())}")
+                alias = agg.get("as") or f"{agg['column']}_{agg.get('function', 'sum')}"
+                named[alias] = pd.NamedAgg(column=agg["column"], aggfunc=func)
+            if not named:
+                df = df.groupby(by, observed=True, sort=False).size().reset_index(name="count")
+            else:
+                df = df.groupby(by, observed=True, sort=False).agg(**named).reset_index()
+        elif kind == "sort":
+            by = _as_list(op.get("by"))
+            _require_columns(df, by, kind)
+            df = df.sort_values(by, ascending=op.get("ascending", True), kind="mergesort")
+        elif kind == "top_k":
+            by, k = op.get("by"), int(op.get("k", 10))
+            _require_columns(df, [by], kind)
+            df = df.nsmallest(k, by) if op.get("ascending", False) else df.nlargest(k, by)
+        elif kind == "pivot":
+            index, columns, values = op.get("index"), op.get("columns"), op.get("values")
+            _require_columns(df, _as_list(index) + [columns, values], kind)
+            func = AGG_FUNCTIONS.get(op.get("function", "sum"))
+            if func is None:
+                raise HTTPException(status_code=400, detail=f"Função de agregação inválida. Use: {list(AGG_FUNCTIONS.keys())}")
+            df = df.pivot_table(index=index, columns=columns, values=values, aggfunc=func,
+                                fill_value=op.get("fill_value"), observed=True).reset_index()
+            df.columns = [str(c) for c in df.columns]
+        else:
+            raise HTTPException(status_code=400, detail=f"Operação inválida: {kind}. Use: {list(PIPELINE_OPERATIONS)}")
+        steps.append({"op": kind, "rows": len(df)})
+
+    return flush_filters(df), steps
+
+
+def dataframe_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Serializa o DataFrame convertendo NaN/NaT em None."""
+    return df.astype(object).where(pd.notna(df), None).to_dict(orient="records")
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "service": "bi-analysis", "pandas_version": pd.__version__}
@@ -200,10 +412,7 @@ async def health_check():
 async def analyze_data(request: AnalysisRequest):
     """Analisa um conjunto de dados com pandas"""
     try:
-        if not request.data or len(request.data) == 0:
-            raise HTTPException(status_code=400, detail="Dados vazios")
-        
-        df = pd.DataFrame(request.data)
+        df = load_frame(request.data, request.dataset_id)
         
         columns_stats = [analyze_column(df, col) for col in df.columns]
         
@@ -249,20 +458,23 @@ async def analyze_data(request: AnalysisRequest):
             suggested_charts=suggested_charts
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
 
 @app.post("/aggregate")
 async def aggregate_data(
-    data: List[Dict[str, Any]],
     group_by: str,
     agg_column: str,
-    agg_function: str = "sum"
+    agg_function: str = "sum",
+    data: Optional[List[Dict[str, Any]]] = Body(None),
+    dataset_id: Optional[str] = None
 ):
     """Agrega dados por uma coluna"""
     try:
-        df = pd.DataFrame(data)
+        df = load_frame(data, dataset_id)
         
         if group_by not in df.columns:
             raise HTTPException(status_code=400, detail=f"Coluna '{group_by}' não encontrada")
@@ -282,7 +494,7 @@ async def aggregate_data(
         if agg_function not in agg_funcs:
             raise HTTPException(status_code=400, detail=f"Função de agregação inválida. Use: {list(agg_funcs.keys())}")
         
-        result = df.groupby(group_by)[agg_column].agg(agg_funcs[agg_function]).reset_index()
+        result = df.groupby(group_by, observed=True)[agg_column].agg(agg_funcs[agg_function]).reset_index()
         result.columns = [group_by, agg_column]
         
         return {
@@ -302,34 +514,27 @@ async def aggregate_data(
 
 @app.post("/filter")
 async def filter_data(
-    data: List[Dict[str, Any]],
     column: str,
     operator: str,
-    value: Any
+    value: Any,
+    data: Optional[List[Dict[str, Any]]] = Body(None),
+    dataset_id: Optional[str] = None
 ):
-    """Filtra dados por uma condição"""
+    """Filtra dados por uma condição.
+
+    O operador "contains" compara substring literal, sem diferenciar
+    maiúsculas; versões anteriores interpretavam o valor como regex.
+    """
     try:
-        df = pd.DataFrame(data)
+        df = load_frame(data, dataset_id)
         
         if column not in df.columns:
             raise HTTPException(status_code=400, detail=f"Coluna '{column}' não encontrada")
         
-        ops = {
-            "eq": lambda x, v: x == v,
-            "ne": lambda x, v: x != v,
-            "gt": lambda x, v: x > v,
-            "gte": lambda x, v: x >= v,
-            "lt": lambda x, v: x < v,
-            "lte": lambda x, v: x <= v,
-            "contains": lambda x, v: x.str.contains(str(v), case=False, na=False),
-            "startswith": lambda x, v: x.str.startswith(str(v), na=False),
-            "endswith": lambda x, v: x.str.endswith(str(v), na=False)
-        }
-        
-        if operator not in ops:
-            raise HTTPException(status_code=400, detail=f"Operador inválido. Use: {list(ops.keys())}")
+        if operator not in FILTER_OPERATORS:
+            raise HTTPException(status_code=400, detail=f"Operador inválido. Use: {list(FILTER_OPERATORS.keys())}")
         
-        mask = ops[operator](df[column], value)
+        mask = FILTER_OPERATORS[operator](df[column], value)
         result = df[mask]
         
         return {
@@ -345,10 +550,79 @@ async def filter_data(
         
     except HTTPException:
         raise
+    except (TypeError, ValueError) as e:
+        # Ex.: comparar coluna numérica com texto
+        raise HTTPException(status_code=400, detail=f"Filtro inválido para a coluna '{column}': {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro no filtro: {str(e)}")
 
 
+@app.post("/pipeline")
+async def pipeline_data(request: PipelineRequest):
+    """Executa uma sequência de operações sobre os dados em uma única chamada"""
+    try:
+        for op in request.operations:
+            if op.get("op") not in PIPELINE_OPERATIONS:
+                raise HTTPException(status_code=400, detail=f"Operação inválida: {op.get('op')}. Use: {list(PIPELINE_OPERATIONS)}")
+        
+        df = load_frame(request.data, request.dataset_id)
+        original_count = len(df)
+        
+        result, steps = run_pipeline(df, request.operations)
+        if request.limit is not None:
+            result = result.head(request.limit)
+        
+        return {
+            "data": dataframe_records(result),
+            "columns": [str(c) for c in result.columns],
+            "original_count": original_count,
+            "result_count": len(result),
+            "steps": steps
+        }
+        
+    except HTTPException:
+        raise
+    except (TypeError, ValueError, KeyError) as e:
+        # Erros do pandas causados pela requisição (tipos incompatíveis, parâmetros inválidos)
+        raise HTTPException(status_code=400, detail=f"Pipeline inválido para os dados: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro no pipeline: {str(e)}")
+
+
+@app.post("/datasets")
+async def create_dataset(request: DatasetRequest):
+    """Armazena os dados já parseados e retorna um handle reutilizável nas análises"""
+    if not request.data:
+        raise HTTPException(status_code=400, detail="Dados vazios")
+    try:
+        return datasets.put(request.data, name=request.name)
+    except DatasetTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+@app.get("/datasets")
+async def list_datasets():
+    """Lista os datasets armazenados e o uso de memória do store"""
+    return datasets.stats()
+
+
+@app.get("/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """Retorna o descritor de um dataset armazenado"""
+    try:
+        return datasets.info(dataset_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' não encontrado ou expirado")
+
+
+@app.delete("/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """Remove um dataset do store"""
+    if not datasets.delete(dataset_id):
+        raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' não encontrado ou expirado")
+    return {"deleted": dataset_id}
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("BI_ANALYSIS_PORT", 8003))
@@ -16,7 +16,8 @@ from datetime import datetime, date, timedelta
 from decimal import Decimal
 from collections import OrderedDict
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
@@ -30,6 +31,13 @@ try:
 except ImportError:
     HAS_PSYCOPG2 = False
 
+try:
+    from .instrumentation import instrument_app, track_db, record_cache
+    from .admission import AdmissionController
+except ImportError:
+    from instrumentation import instrument_app, track_db, record_cache
+    from admission import AdmissionController
+
 app = FastAPI(
     title="Arcadia BI Engine",
     description="Motor de Business Intelligence - SQL, Charts, Micro-BI, Analise de Dados",
@@ -44,6 +52,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "bi-engine")
+
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
 MAX_ROWS = 10000
 QUERY_TIMEOUT_MS = 30000
@@ -86,10 +96,12 @@ class QueryCache:
             if time.time() - entry["ts"] < self._ttl:
                 self._hits += 1
                 self._cache.move_to_end(key)
+                record_cache("query", True)
                 return entry["data"]
             else:
                 del self._cache[key]
         self._misses += 1
+        record_cache("query", False)
         return None
 
     def set(self, sql: str, data: Any, params: dict = None):
@@ -119,6 +131,7 @@ class QueryCache:
 
 
 cache = QueryCache()
+admission = AdmissionController.from_env("BI")
 
 
 class SQLQueryRequest(BaseModel):
@@ -194,7 +207,8 @@ def get_db_connection():
     if not DATABASE_URL:
         raise HTTPException(status_code=500, detail="DATABASE_URL nao configurada")
     try:
-        conn = psycopg2.connect(DATABASE_URL)
+        with track_db("connect"):
+            conn = psycopg2.connect(DATABASE_URL)
         conn.set_session(readonly=True, autocommit=True)
         return conn
     except Exception as e:
@@ -213,9 +227,10 @@ def execute_query(sql: str, params: dict = None, limit: int = MAX_ROWS) -> Dict[
     try:
         start = time.time()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(f"SET statement_timeout = '{QUERY_TIMEOUT_MS}';")
-        cur.execute(sql, params)
-        rows = cur.fetchall()
+        with track_db("execute_query"):
+            cur.execute(f"SET statement_timeout = '{QUERY_TIMEOUT_MS}';")
+            cur.execute(sql, params)
+            rows = cur.fetchall()
         elapsed = round((time.time() - start) * 1000, 2)
 
         columns = []
@@ -238,6 +253,24 @@ def execute_query(sql: str, params: dict = None, limit: int = MAX_ROWS) -> Dict[
         conn.close()
 
 
+def tenant_key(request: Request) -> str:
+    # Valor controlado pelo cliente: o AdmissionController limita o estado e os
+    # labels de metrica por tenant (BI_TENANT_IDLE_SECONDS, BI_TENANT_METRIC_LABELS)
+    tenant_id = request.headers.get("x-tenant-id")
+    if tenant_id:
+        return tenant_id.strip()[:64]
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return "anonymous"
+
+
+async def run_admitted_query(tenant: str, endpoint: str, sql: str, params: dict = None,
+                             limit: int = MAX_ROWS) -> Dict[str, Any]:
+    async with admission.slot(tenant, endpoint):
+        return await run_in_threadpool(execute_query, sql, params, limit)
+
+
 def build_chart_query(req: ChartDataRequest) -> str:
     if req.sql:
         return req.sql
@@ -425,6 +458,7 @@ async def version():
 async def metrics():
     return {
         "cache": cache.stats(),
+        "admission": admission.stats(),
         "limits": {
             "max_rows": MAX_ROWS,
             "query_timeout_ms": QUERY_TIMEOUT_MS,
@@ -434,8 +468,8 @@ async def metrics():
 
 
 @app.get("/tables")
-async def list_tables():
-    result = execute_query("""
+async def list_tables(tenant: str = Depends(tenant_key)):
+    result = await run_admitted_query(tenant, "tables", """
         SELECT table_name, table_type
         FROM information_schema.tables
         WHERE table_schema = 'public'
@@ -445,9 +479,9 @@ async def list_tables():
 
 
 @app.get("/tables/{table_name}/columns")
-async def table_columns(table_name: str):
+async def table_columns(table_name: str, tenant: str = Depends(tenant_key)):
     safe_name = re.sub(r'[^a-zA-Z0-9_]', '', table_name)
-    result = execute_query(f"""
+    result = await run_admitted_query(tenant, "tables", f"""
         SELECT column_name, data_type, is_nullable, column_default
         FROM information_schema.columns
         WHERE table_schema = 'public' AND table_name = '{safe_name}'
@@ -457,17 +491,18 @@ async def table_columns(table_name: str):
 
 
 @app.get("/tables/{table_name}/preview")
-async def table_preview(table_name: str, limit: int = Query(default=50, le=500)):
+async def table_preview(table_name: str, limit: int = Query(default=50, le=500),
+                        tenant: str = Depends(tenant_key)):
     safe_name = re.sub(r'[^a-zA-Z0-9_]', '', table_name)
-    result = execute_query(f"SELECT * FROM {safe_name} LIMIT {limit}")
+    result = await run_admitted_query(tenant, "tables", f"SELECT * FROM {safe_name} LIMIT {limit}")
     return result
 
 
 @app.get("/tables/{table_name}/stats")
-async def table_stats(table_name: str):
+async def table_stats(table_name: str, tenant: str = Depends(tenant_key)):
     safe_name = re.sub(r'[^a-zA-Z0-9_]', '', table_name)
-    count_result = execute_query(f"SELECT COUNT(*) as total FROM {safe_name}")
-    cols_result = execute_query(f"""
+    count_result = await run_admitted_query(tenant, "tables", f"SELECT COUNT(*) as total FROM {safe_name}")
+    cols_result = await run_admitted_query(tenant, "tables", f"""
         SELECT column_name, data_type
         FROM information_schema.columns
         WHERE table_schema = 'public' AND table_name = '{safe_name}'
@@ -482,13 +517,13 @@ async def table_stats(table_name: str):
 
 
 @app.post("/query")
-async def run_query(request: SQLQueryRequest):
+async def run_query(request: SQLQueryRequest, tenant: str = Depends(tenant_key)):
     if request.use_cache:
         cached = cache.get(request.sql, request.params)
         if cached:
             return {**cached, "cached": True}
 
-    result = execute_query(request.sql, request.params, request.limit or MAX_ROWS)
+    result = await run_admitted_query(tenant, "query", request.sql, request.params, request.limit or MAX_ROWS)
 
     if request.use_cache:
         cache.set(request.sql, result, request.params)
@@ -497,14 +532,14 @@ async def run_query(request: SQLQueryRequest):
 
 
 @app.post("/chart-data")
-async def chart_data(request: ChartDataRequest):
+async def chart_data(request: ChartDataRequest, tenant: str = Depends(tenant_key)):
     query = build_chart_query(request)
 
     cached = cache.get(query)
     if cached:
         return {**cached, "cached": True, "query": query}
 
-    result = execute_query(query, limit=request.limit or 100)
+    result = await run_admitted_query(tenant, "chart-data", query, limit=request.limit or 100)
 
     series_data = {}
     for row in result["data"]:
@@ -528,7 +563,7 @@ async def chart_data(request: ChartDataRequest):
 
 
 @app.post("/micro-bi")
-async def micro_bi(request: MicroBIRequest):
+async def micro_bi(request: MicroBIRequest, tenant: str = Depends(tenant_key)):
     safe_table = re.sub(r'[^a-zA-Z0-9_]', '', request.table)
     results = {}
 
@@ -584,7 +619,7 @@ async def micro_bi(request: MicroBIRequest):
     else:
         query = f"SELECT {', '.join(metric_exprs)} FROM {safe_table} {where_clause}"
 
-    result = execute_query(query)
+    result = await run_admitted_query(tenant, "micro-bi", query)
     results["current"] = result["data"]
 
     if request.compare_previous and request.period and prev_where_parts:
@@ -592,7 +627,7 @@ async def micro_bi(request: MicroBIRequest):
             prev_query = f"SELECT {safe_dim} AS dimension, {', '.join(metric_exprs)} FROM {safe_table} {prev_where_clause} GROUP BY {safe_dim} ORDER BY {metric_exprs[0].split(' AS ')[1]} DESC LIMIT 20"
         else:
             prev_query = f"SELECT {', '.join(metric_exprs)} FROM {safe_table} {prev_where_clause}"
-        prev_result = execute_query(prev_query)
+        prev_result = await run_admitted_query(tenant, "micro-bi", prev_query)
         results["previous"] = prev_result["data"]
 
         if not request.dimension and results["current"] and results["previous"]:
@@ -699,6 +734,11 @@ async def cache_stats():
     return cache.stats()
 
 
+@app.get("/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("BI_PORT", os.environ.get("BI_ENGINE_PORT", "8004")))
@@ -13,6 +13,11 @@ import json
 import os
 import re
 
+try:
+    from .instrumentation import instrument_app
+except ImportError:
+    from instrumentation import instrument_app
+
 app = FastAPI(
     title="Arcádia Contábil",
     description="Motor de Contabilidade - DRE, Balanço, Balancete, SPED ECD",
@@ -27,6 +32,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "contabil")
+
 # ========== Models ==========
 
 class ContaContabil(BaseModel):
@@ -0,0 +1,226 @@
+"""
+Arcadia Cron - Expressoes cron compiladas
+Cada expressao e compilada uma unica vez em bitsets por campo (minuto,
+hora, dia do mes, mes, dia da semana). O calculo da proxima execucao salta
+campo a campo (mes -> dia -> hora -> minuto) em vez de testar minuto a
+minuto, entao agendas esparsas como "0 0 29 2 *" resolvem em microssegundos.
+
+Semantica (Vixie cron):
+    minuto 0-59, hora 0-23, dia 1-31, mes 1-12 ou jan-dec,
+    dia da semana 0-7 ou sun-sat (0 e 7 = domingo)
+    listas (1,15), faixas (1-5), passos (*/15, 10-40/5, 5/10) e macros
+    (@hourly, @daily, @midnight, @weekly, @monthly, @yearly, @annually).
+    Se dia do mes e dia da semana forem ambos restritos (nao comecam com
+    "*"), basta um casar; caso contrario os dois precisam casar.
+
+Uso:
+    from cron import compile_cron
+    cron = compile_cron("*/15 9-17 * * mon-fri")
+    cron.next_run(datetime.now())
+"""
+
+import calendar
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+MONTH_NAMES = {name.lower(): i for i, name in enumerate(calendar.month_abbr) if name}
+DOW_NAMES = {"sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6}
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+# (nome, minimo, maximo, nomes aceitos)
+FIELDS = (
+    ("minuto", 0, 59, None),
+    ("hora", 0, 23, None),
+    ("dia", 1, 31, None),
+    ("mes", 1, 12, MONTH_NAMES),
+    ("dia da semana", 0, 7, DOW_NAMES),
+)
+
+# Maior quantidade de dias possivel em cada mes (fevereiro em ano bissexto)
+_MAX_MONTH_DAYS = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Limite de anos percorridos por next_run; expressoes validas sempre disparam
+# bem antes (29/02 numa segunda-feira, o pior caso, repete em ate 40 anos).
+_MAX_YEARS = 400
+
+
+def _parse_value(token: str, field: Tuple) -> int:
+    name, low, high, names = field
+    key = token.lower()
+    if names and key in names:
+        return names[key]
+    try:
+        value = int(token)
+    except ValueError:
+        raise ValueError(f"Valor invalido para {name}: '{token}'")
+    if not low <= value <= high:
+        raise ValueError(f"Valor fora do intervalo para {name}: {value} (permitido {low}-{high})")
+    return value
+
+
+def _parse_field(spec: str, field: Tuple) -> int:
+    """Converte um campo cron em bitset (bit n ligado = valor n permitido)."""
+    name, low, high, _ = field
+    mask = 0
+    for item in spec.split(","):
+        if not item:
+            raise ValueError(f"Lista vazia no campo {name}: '{spec}'")
+        base, _, step_str = item.partition("/")
+        step = 1
+        if step_str:
+            if not step_str.isdigit() or int(step_str) == 0:
+                raise ValueError(f"Passo invalido no campo {name}: '{item}'")
+            step = int(step_str)
+
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            start_str, end_str = base.split("-", 1)
+            start, end = _parse_value(start_str, field), _parse_value(end_str, field)
+            if start > end:
+                raise ValueError(f"Faixa invertida no campo {name}: '{item}'")
+        else:
+            start = _parse_value(base, field)
+            end = high if step_str else start
+
+        for value in range(start, end + 1, step):
+            mask |= 1 << value
+    return mask
+
+
+def _next_bit(mask: int, start: int) -> Optional[int]:
+    """Menor valor >= start presente no bitset, ou None."""
+    shifted = mask >> start
+    if not shifted:
+        return None
+    return start + (shifted & -shifted).bit_length() - 1
+
+
+class CronExpression:
+    def __init__(self, expr: str):
+        self.expr = expr.strip()
+        source = MACROS.get(self.expr.lower(), self.expr)
+        self.parts = source.split()
+        if len(self.parts) != 5:
+            raise ValueError(f"Cron expression deve ter 5 partes: {expr}")
+
+        masks = [_parse_field(part, field) for part, field in zip(self.parts, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, dow = masks
+        if dow & (1 << 7):
+            dow = (dow | 1) & ~(1 << 7)
+        self.weekdays = dow
+        self.day_any = self.parts[2].startswith("*")
+        self.weekday_any = self.parts[4].startswith("*")
+
+        # Dias do mes casados pelo dia da semana, indexado pelo dia da semana
+        # do dia 1 (0 = domingo).
+        self._weekday_days = []
+        for first in range(7):
+            days = 0
+            for day in range(1, 32):
+                if dow >> ((first + day - 1) % 7) & 1:
+                    days |= 1 << day
+            self._weekday_days.append(days)
+
+        if self.day_any or self.weekday_any:
+            if not any(self.days & ((1 << (_MAX_MONTH_DAYS[m] + 1)) - 1)
+                       for m in range(1, 13) if self.months >> m & 1):
+                raise ValueError(f"Cron expression nunca dispara: {expr}")
+
+    def _day_mask(self, year: int, month: int) -> int:
+        """Bitset dos dias do mes (1..n) em que a expressao pode disparar."""
+        first_weekday, ndays = calendar.monthrange(year, month)
+        valid = ((1 << (ndays + 1)) - 1) & ~1
+        by_weekday = self._weekday_days[(first_weekday + 1) % 7]
+        if self.day_any or self.weekday_any:
+            return self.days & by_weekday & valid
+        return (self.days | by_weekday) & valid
+
+    def matches(self, dt: datetime) -> bool:
+        return bool(
+            self.minutes >> dt.minute & 1 and
+            self.hours >> dt.hour & 1 and
+            self.months >> dt.month & 1 and
+            self._day_mask(dt.year, dt.month) >> dt.day & 1
+        )
+
+    def next_run(self, from_dt: datetime = None) -> datetime:
+        """Proximo disparo estritamente apos from_dt (padrao: agora)."""
+        dt = from_dt or datetime.now()
+        year, month, day = dt.year, dt.month, dt.day
+        hour, minute = dt.hour, dt.minute + 1
+        limit = year + _MAX_YEARS
+
+        while year <= limit:
+            next_month = _next_bit(self.months, month)
+            if next_month is None:
+                year, month, day, hour, minute = year + 1, 1, 1, 0, 0
+                continue
+            if next_month != month:
+                month, day, hour, minute = next_month, 1, 0, 0
+
+            next_day = _next_bit(self._day_mask(year, month), day)
+            if next_day is None:
+                month, day, hour, minute = month + 1, 1, 0, 0
+                if month > 12:
+                    year, month = year + 1, 1
+                continue
+            if next_day != day:
+                day, hour, minute = next_day, 0, 0
+
+            next_hour = _next_bit(self.hours, hour)
+            if next_hour is None:
+                nxt = datetime(year, month, day) + timedelta(days=1)
+                year, month, day, hour, minute = nxt.year, nxt.month, nxt.day, 0, 0
+                continue
+            if next_hour != hour:
+                hour, minute = next_hour, 0
+
+            next_minute = _next_bit(self.minutes, minute)
+            if next_minute is None:
+                hour, minute = hour + 1, 0
+                if hour > 23:
+                    nxt = datetime(year, month, day) + timedelta(days=1)
+                    year, month, day, hour = nxt.year, nxt.month, nxt.day, 0
+                continue
+
+            return dt.replace(year=year, month=month, day=day, hour=hour,
+                              minute=next_minute, second=0, microsecond=0)
+
+        raise ValueError(f"Cron expression nunca dispara: {self.expr}")
+
+    def upcoming(self, count: int, from_dt: datetime = None) -> List[datetime]:
+        runs = []
+        dt = from_dt or datetime.now()
+        for _ in range(count):
+            dt = self.next_run(dt)
+            runs.append(dt)
+        return runs
+
+    def describe(self) -> Dict:
+        def values(mask: int) -> List[int]:
+            return [i for i in range(mask.bit_length()) if mask >> i & 1]
+        return {
+            "expression": self.expr,
+            "minutes": values(self.minutes),
+            "hours": values(self.hours),
+            "days": None if self.day_any else values(self.days),
+            "months": values(self.months),
+            "weekdays": None if self.weekday_any else values(self.weekdays),
+        }
+
+
+@lru_cache(maxsize=1024)
+def compile_cron(expr: str) -> CronExpression:
+    """Compila (com cache) uma expressao cron. Levanta ValueError se invalida."""
+    return CronExpression(expr)
@@ -0,0 +1,208 @@
+"""
+Arcadia Dataset Store - Handles de datasets para analises repetidas
+Armazena DataFrames ja parseados sob um identificador, evitando que o
+cliente reenvie (e o servico reconstrua) os mesmos registros a cada chamada
+de analise. Os frames sao compactados na entrada (inteiros reduzidos ao menor
+tipo que comporta os valores, texto de baixa cardinalidade como category) e
+despejados por TTL, LRU e limite de memoria.
+
+O store vive no processo: com varios workers uvicorn cada um tem o seu.
+
+Uso:
+    from dataset_store import DatasetStore
+    datasets = DatasetStore.from_env()
+    info = datasets.put(records)
+    df = datasets.get(info["dataset_id"])
+"""
+
+import os
+import time
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+try:
+    from .instrumentation import Gauge, record_cache
+except ImportError:
+    from instrumentation import Gauge, record_cache
+
+DATASET_STORE_BYTES = Gauge(
+    "arcadia_dataset_store_bytes",
+    "Memoria ocupada pelos datasets armazenados",
+)
+DATASET_STORE_ITEMS = Gauge(
+    "arcadia_dataset_store_items",
+    "Quantidade de datasets armazenados",
+)
+
+CATEGORY_MAX_RATIO = 0.5
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Reduz o footprint do DataFrame sem alterar os valores.
+
+    Inteiros sao convertidos para o menor tipo inteiro que comporta a coluna e
+    colunas de texto com ate CATEGORY_MAX_RATIO de valores distintos viram
+    category. Floats sao mantidos em 64 bits para nao perder precisao.
+    """
+    columns = {}
+    rows = len(df)
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            columns[col] = pd.to_numeric(series, downcast="integer")
+        elif (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)) and rows:
+            try:
+                unique = series.nunique(dropna=True)
+            except TypeError:
+                continue
+            if unique <= rows * CATEGORY_MAX_RATIO:
+                columns[col] = series.astype("category")
+    return df.assign(**columns) if columns else df
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DatasetTooLarge(ValueError):
+    pass
+
+
+class _Entry:
+    __slots__ = ("df", "name", "nbytes", "created_at", "last_access", "hits")
+
+    def __init__(self, df: pd.DataFrame, name: Optional[str], nbytes: int):
+        self.df = df
+        self.name = name
+        self.nbytes = nbytes
+        self.created_at = time.time()
+        self.last_access = time.monotonic()
+        self.hits = 0
+
+
+class DatasetStore:
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, max_items: int = 64, ttl_seconds: float = 1800):
+        self.max_bytes = max(int(max_bytes), 1)
+        self.max_items = max(int(max_items), 1)
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = {"ttl": 0, "lru": 0, "deleted": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str = "DATASET_STORE") -> "DatasetStore":
+        return cls(
+            max_bytes=int(float(os.environ.get(f"{prefix}_MAX_MB", "512")) * 1024 * 1024),
+            max_items=int(os.environ.get(f"{prefix}_MAX_ITEMS", "64")),
+            ttl_seconds=float(os.environ.get(f"{prefix}_TTL_SECONDS", "1800")),
+        )
+
+    def _drop(self, dataset_id: str, reason: str):
+        entry = self._entries.pop(dataset_id)
+        self._bytes -= entry.nbytes
+        self._evictions[reason] += 1
+
+    def _expire(self):
+        if self.ttl_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [k for k, e in self._entries.items() if e.last_access < cutoff]
+        for dataset_id in expired:
+            self._drop(dataset_id, "ttl")
+
+    def _publish(self):
+        DATASET_STORE_BYTES.set(self._bytes)
+        DATASET_STORE_ITEMS.set(len(self._entries))
+
+    def put(self, data: Union[List[Dict[str, Any]], pd.DataFrame], name: Optional[str] = None) -> Dict[str, Any]:
+        """Parseia, compacta e armazena os dados; retorna o descritor do handle."""
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        df = compact_frame(df)
+        nbytes = frame_bytes(df)
+        if nbytes > self.max_bytes:
+            raise DatasetTooLarge(
+                f"Dataset ocupa {nbytes} bytes, acima do limite do store ({self.max_bytes} bytes)"
+            )
+
+        dataset_id = uuid.uuid4().hex
+        entry = _Entry(df, name, nbytes)
+        with self._lock:
+            self._expire()
+            while self._entries and (len(self._entries) >= self.max_items or self._bytes + nbytes > self.max_bytes):
+                self._drop(next(iter(self._entries)), "lru")
+            self._entries[dataset_id] = entry
+            self._bytes += nbytes
+            self._publish()
+        return self._describe(dataset_id, entry)
+
+    def get(self, dataset_id: str) -> pd.DataFrame:
+        """Retorna o DataFrame do handle. Levanta KeyError se expirado ou inexistente.
+
+        O frame e compartilhado entre chamadas: quem o usa nao deve altera-lo
+        in-place.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                self._publish()
+                record_cache("dataset", False)
+                raise KeyError(dataset_id)
+            self._entries.move_to_end(dataset_id)
+            entry.last_access = time.monotonic()
+            entry.hits += 1
+        record_cache("dataset", True)
+        return entry.df
+
+    def info(self, dataset_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                raise KeyError(dataset_id)
+            return self._describe(dataset_id, entry)
+
+    def delete(self, dataset_id: str) -> bool:
+        with self._lock:
+            if dataset_id not in self._entries:
+                return False
+            self._drop(dataset_id, "deleted")
+            self._publish()
+            return True
+
+    def _describe(self, dataset_id: str, entry: _Entry) -> Dict[str, Any]:
+        expires_in = None
+        if self.ttl_seconds > 0:
+            expires_in = max(0, round(self.ttl_seconds - (time.monotonic() - entry.last_access)))
+        return {
+            "dataset_id": dataset_id,
+            "name": entry.name,
+            "rows": len(entry.df),
+            "columns": [str(c) for c in entry.df.columns],
+            "dtypes": {str(c): str(t) for c, t in entry.df.dtypes.items()},
+            "memory_bytes": entry.nbytes,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(entry.created_at)),
+            "hits": entry.hits,
+            "expires_in_seconds": expires_in,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            self._publish()
+            return {
+                "datasets": len(self._entries),
+                "memory_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_items": self.max_items,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": dict(self._evictions),
+                "items": [self._describe(k, e) for k, e in self._entries.items()],
+            }
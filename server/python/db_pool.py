@@ -0,0 +1,140 @@
+"""
+Arcadia DB Pool - Pool de conexoes PostgreSQL compartilhado entre threads
+Envolve psycopg2.pool.ThreadedConnectionPool com:
+    - criacao preguicosa (o servico sobe mesmo sem banco)
+    - semaforo do tamanho do pool: quem chega com o pool cheio espera ate
+      acquire_timeout em vez de receber PoolError
+    - sessao configurada uma vez por conexao (readonly/autocommit e
+      statement_timeout via options)
+    - descarte de conexoes quebradas ao devolver
+
+Uso:
+    from db_pool import DbPool
+    pool = DbPool.from_env(DATABASE_URL, "AUTOMATION_DB")
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1")
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+try:
+    import psycopg2
+    import psycopg2.pool
+    HAS_PSYCOPG2 = True
+except ImportError:
+    HAS_PSYCOPG2 = False
+
+try:
+    from .instrumentation import Gauge, track_db
+except ImportError:
+    from instrumentation import Gauge, track_db
+
+DB_POOL_IN_USE = Gauge(
+    "arcadia_db_pool_connections_in_use",
+    "Conexoes do pool PostgreSQL emprestadas no momento",
+    ("pool",),
+)
+
+
+class PoolUnavailable(RuntimeError):
+    pass
+
+
+class DbPool:
+    def __init__(self, database_url: str, name: str = "default", min_size: int = 1,
+                 max_size: int = 10, acquire_timeout: float = 10.0,
+                 statement_timeout_ms: int = 10000, readonly: bool = True):
+        self.name = name
+        self.min_size = max(int(min_size), 0)
+        self.max_size = max(int(max_size), 1, self.min_size)
+        self.acquire_timeout = float(acquire_timeout)
+        self.statement_timeout_ms = int(statement_timeout_ms)
+        self.readonly = readonly
+        self._database_url = database_url
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._in_use = 0
+        self._counts = {"acquired": 0, "discarded": 0, "timeouts": 0}
+
+    @classmethod
+    def from_env(cls, database_url: str, prefix: str = "AUTOMATION_DB", name: str = "automation") -> "DbPool":
+        env = os.environ.get
+        return cls(
+            database_url,
+            name=name,
+            min_size=int(env(f"{prefix}_POOL_MIN", "1")),
+            max_size=int(env(f"{prefix}_POOL_MAX", "10")),
+            acquire_timeout=float(env(f"{prefix}_POOL_TIMEOUT_SECONDS", "10")),
+            statement_timeout_ms=int(env(f"{prefix}_STATEMENT_TIMEOUT_MS", "10000")),
+        )
+
+    @property
+    def available(self) -> bool:
+        return HAS_PSYCOPG2 and bool(self._database_url)
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if not self.available:
+                        raise PoolUnavailable("Database nao disponivel")
+                    with track_db("connect"):
+                        self._pool = psycopg2.pool.ThreadedConnectionPool(
+                            self.min_size, self.max_size, self._database_url,
+                            options=f"-c statement_timeout={self.statement_timeout_ms}",
+                        )
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexao; espera ate acquire_timeout se o pool estiver cheio."""
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._counts["timeouts"] += 1
+            raise PoolUnavailable(f"Pool '{self.name}' esgotado apos {self.acquire_timeout}s")
+        conn = None
+        broken = False
+        try:
+            conn = pool.getconn()
+            with self._lock:
+                self._in_use += 1
+                self._counts["acquired"] += 1
+            DB_POOL_IN_USE.labels(self.name).set(self._in_use)
+            if not conn.autocommit:
+                # Conexao nova do pool: configura a sessao uma unica vez
+                conn.set_session(readonly=self.readonly, autocommit=True)
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if conn is not None:
+                broken = broken or bool(conn.closed)
+                if broken:
+                    self._counts["discarded"] += 1
+                pool.putconn(conn, close=broken)
+                with self._lock:
+                    self._in_use -= 1
+                DB_POOL_IN_USE.labels(self.name).set(self._in_use)
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "available": self.available,
+            "open": self._pool is not None,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": self._in_use,
+            **self._counts,
+        }
@@ -21,6 +21,11 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+try:
+    from .instrumentation import instrument_app, track_db, track_http
+except ImportError:
+    from instrumentation import instrument_app, track_db, track_http
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -108,7 +113,7 @@ def generate_embedding(text: str) -> Optional[list]:
             }
         )
 
-        with urllib.request.urlopen(req, timeout=15) as response:
+        with track_http("litellm_embeddings"), urllib.request.urlopen(req, timeout=15) as response:
             result = json.loads(response.read())
             return result["data"][0]["embedding"]
 
@@ -139,6 +144,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "embeddings")
+
 
 @app.get("/health")
 def health():
@@ -154,25 +161,26 @@ def add_document(req: AddDocumentRequest):
         conn = get_conn()
         cur = conn.cursor()
 
-        if embedding:
-            cur.execute("""
-                INSERT INTO document_embeddings (doc_id, document, metadata, embedding, updated_at)
-                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (doc_id) DO UPDATE SET
-                    document   = EXCLUDED.document,
-                    metadata   = EXCLUDED.metadata,
-                    embedding  = EXCLUDED.embedding,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (req.doc_id, req.document, json.dumps(req.metadata), str(embedding)))
-        else:
-            cur.execute("""
-                INSERT INTO document_embeddings (doc_id, document, metadata, updated_at)
-                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (doc_id) DO UPDATE SET
-                    document   = EXCLUDED.document,
-                    metadata   = EXCLUDED.metadata,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (req.doc_id, req.document, json.dumps(req.metadata)))
+        with track_db("embeddings_upsert"):
+            if embedding:
+                cur.execute("""
+                    INSERT INTO document_embeddings (doc_id, document, metadata, embedding, updated_at)
+                    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (doc_id) DO UPDATE SET
+                        document   = EXCLUDED.document,
+                        metadata   = EXCLUDED.metadata,
+                        embedding  = EXCLUDED.embedding,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (req.doc_id, req.document, json.dumps(req.metadata), str(embedding)))
+            else:
+                cur.execute("""
+                    INSERT INTO document_embeddings (doc_id, document, metadata, updated_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (doc_id) DO UPDATE SET
+                        document   = EXCLUDED.document,
+                        metadata   = EXCLUDED.metadata,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (req.doc_id, req.document, json.dumps(req.metadata)))
 
         conn.commit()
         cur.close()
@@ -198,34 +206,35 @@ def search_documents(req: SearchRequest):
         conn = get_conn()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        if query_embedding:
-            # Busca vetorial por similaridade coseno
-            cur.execute("""
-                SELECT
-                    doc_id,
-                    document,
-                    metadata,
-                    1 - (embedding <=> %s::vector) AS similarity
-                FROM document_embeddings
-                WHERE embedding IS NOT NULL
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-            """, (str(query_embedding), str(query_embedding), req.n_results))
-        else:
-            # Fallback: full-text search com LIKE
-            cur.execute("""
-                SELECT
-                    doc_id,
-                    document,
-                    metadata,
-                    0.5 AS similarity
-                FROM document_embeddings
-                WHERE document ILIKE %s
-                ORDER BY updated_at DESC
-                LIMIT %s
-            """, (f"%{req.query}%", req.n_results))
-
-        rows = cur.fetchall()
+        with track_db("embeddings_search"):
+            if query_embedding:
+                # Busca vetorial por similaridade coseno
+                cur.execute("""
+                    SELECT
+                        doc_id,
+                        document,
+                        metadata,
+                        1 - (embedding <=> %s::vector) AS similarity
+                    FROM document_embeddings
+                    WHERE embedding IS NOT NULL
+                    ORDER BY embedding <=> %s::vector
+                    LIMIT %s
+                """, (str(query_embedding), str(query_embedding), req.n_results))
+            else:
+                # Fallback: full-text search com LIKE
+                cur.execute("""
+                    SELECT
+                        doc_id,
+                        document,
+                        metadata,
+                        0.5 AS similarity
+                    FROM document_embeddings
+                    WHERE document ILIKE %s
+                    ORDER BY updated_at DESC
+                    LIMIT %s
+                """, (f"%{req.query}%", req.n_results))
+
+            rows = cur.fetchall()
         cur.close()
         conn.close()
 
@@ -0,0 +1,369 @@
+"""
+Arcadia Event Log - Log append-only segmentado em disco
+Registros JSON gravados em segmentos sequenciais ({offset_base}.log). Cada
+registro tem cabecalho fixo (offset, tamanho, crc32) seguido do payload, o
+que permite detectar e truncar uma cauda corrompida por crash na abertura.
+
+    append   O(1), com fsync em lote por uma thread (fsync_mode="batch"),
+             a cada registro ("always") ou delegado ao SO ("never")
+    read     leitura via mmap a partir de qualquer offset, usando um indice
+             esparso por segmento para nao varrer o segmento desde o inicio
+    compact  reescreve os segmentos fechados mantendo so o registro mais
+             recente de cada "key" (tombstone = "data": None remove a chave)
+             e descartando registros sem key mais antigos que a retencao;
+             automatica quando ha mais de compact_after_segments segmentos,
+             so depois que um segmento fecha desde a ultima compactacao e
+             no maximo uma vez a cada compact_min_interval segundos
+
+Uso:
+    log = EventLog("data/automation/event-log")
+    offset = log.append({"kind": "event", "data": {...}})
+    for offset, record in log.read(from_offset=0):
+        ...
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+
+HEADER = struct.Struct(">QII")  # offset, tamanho do payload, crc32 do payload
+SEGMENT_SUFFIX = ".log"
+
+
+class _Segment:
+    __slots__ = ("base", "path", "size", "index", "last_offset")
+
+    def __init__(self, base: int, path: str):
+        self.base = base
+        self.path = path
+        self.size = 0
+        self.index: List[Tuple[int, int]] = []  # (offset, posicao) esparso
+        self.last_offset = base - 1
+
+
+def _scan(path: str, index_interval: int) -> Tuple[int, List[Tuple[int, int]], int]:
+    """Valida os registros do arquivo. Retorna (tamanho valido, indice, ultimo offset)."""
+    index: List[Tuple[int, int]] = []
+    last_offset = -1
+    valid = 0
+    count = 0
+    file_size = os.path.getsize(path)
+    if file_size == 0:
+        return 0, index, last_offset
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0
+        while pos + HEADER.size <= file_size:
+            offset, length, crc = HEADER.unpack_from(mm, pos)
+            end = pos + HEADER.size + length
+            if end > file_size or zlib.crc32(mm[pos + HEADER.size:end]) != crc or offset <= last_offset:
+                break
+            if count % index_interval == 0:
+                index.append((offset, pos))
+            last_offset = offset
+            count += 1
+            pos = valid = end
+    return valid, index, last_offset
+
+
+def _records(mm, pos: int, end: int, path: str) -> Iterator[Tuple[int, Dict]]:
+    """Itera os registros de mm[pos:end], validando o crc32 de cada payload."""
+    while pos + HEADER.size <= end:
+        offset, length, crc = HEADER.unpack_from(mm, pos)
+        body_start = pos + HEADER.size
+        body = mm[body_start:body_start + length]
+        if body_start + length > end or zlib.crc32(body) != crc:
+            raise ValueError(f"{path}: registro corrompido na posicao {pos} (offset {offset})")
+        pos = body_start + length
+        yield offset, json.loads(body)
+
+
+class EventLog:
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, fsync_mode: str = "batch",
+                 fsync_interval: float = 0.05, index_interval: int = 256, retention_seconds: float = 0,
+                 compact_after_segments: int = 8, compact_min_interval: float = 600.0):
+        if fsync_mode not in ("batch", "always", "never"):
+            raise ValueError(f"fsync_mode invalido: {fsync_mode}")
+        self.directory = directory
+        self.segment_bytes = max(int(segment_bytes), 4096)
+        self.fsync_mode = fsync_mode
+        self.fsync_interval = fsync_interval
+        self.index_interval = max(int(index_interval), 1)
+        self.retention_seconds = retention_seconds
+        self.compact_after_segments = compact_after_segments
+        self.compact_min_interval = max(float(compact_min_interval), 0.0)
+        self._rolls_since_compact = 0
+        self._last_compact = 0.0
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._file = None
+        self._next_offset = 0
+        self._dirty = threading.Event()
+        self._closed = False
+        self._stats = {"appended": 0, "fsyncs": 0, "compactions": 0, "truncated_bytes": 0, "reclaimed_bytes": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._flusher = None
+        if fsync_mode == "batch":
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    @classmethod
+    def from_env(cls, default_dir: str, prefix: str = "AUTOMATION_EVENT_LOG") -> Optional["EventLog"]:
+        directory = os.environ.get(f"{prefix}_DIR", default_dir)
+        if not directory:
+            return None
+        return cls(
+            directory,
+            segment_bytes=int(float(os.environ.get(f"{prefix}_SEGMENT_MB", "64")) * 1024 * 1024),
+            fsync_mode=os.environ.get(f"{prefix}_FSYNC", "batch"),
+            fsync_interval=float(os.environ.get(f"{prefix}_FSYNC_INTERVAL_MS", "50")) / 1000,
+            retention_seconds=float(os.environ.get(f"{prefix}_RETENTION_HOURS", "168")) * 3600,
+            compact_min_interval=float(os.environ.get(f"{prefix}_COMPACT_INTERVAL_SECONDS", "600")),
+        )
+
+    # --- abertura e escrita ---
+
+    def _segment_path(self, base: int) -> str:
+        return os.path.join(self.directory, f"{base:020d}{SEGMENT_SUFFIX}")
+
+    def _recover(self):
+        bases = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                       if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+        for base in bases:
+            segment = _Segment(base, self._segment_path(base))
+            valid, segment.index, last = _scan(segment.path, self.index_interval)
+            actual = os.path.getsize(segment.path)
+            if valid < actual:
+                # Cauda parcial (crash no meio de uma escrita): descarta
+                with open(segment.path, "r+b") as f:
+                    f.truncate(valid)
+                self._stats["truncated_bytes"] += actual - valid
+                print(f"[EventLog] {segment.path}: {actual - valid} bytes corrompidos truncados")
+            segment.size = valid
+            segment.last_offset = last if last >= 0 else base - 1
+            self._segments.append(segment)
+            self._next_offset = max(self._next_offset, segment.last_offset + 1, base)
+        if not self._segments:
+            self._segments.append(_Segment(0, self._segment_path(0)))
+        self._file = open(self._segments[-1].path, "ab")
+
+    def _roll(self):
+        self._file.flush()
+        if self.fsync_mode != "never":
+            os.fsync(self._file.fileno())
+        self._file.close()
+        segment = _Segment(self._next_offset, self._segment_path(self._next_offset))
+        self._segments.append(segment)
+        self._file = open(segment.path, "ab")
+        self._rolls_since_compact += 1
+
+    def append(self, record: Dict) -> int:
+        """Grava o registro e retorna o seu offset."""
+        payload = json.dumps(record, default=str, separators=(",", ":")).encode()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("EventLog fechado")
+            segment = self._segments[-1]
+            if segment.size >= self.segment_bytes:
+                self._roll()
+                segment = self._segments[-1]
+            offset = self._next_offset
+            if (offset - segment.base) % self.index_interval == 0 or not segment.index:
+                segment.index.append((offset, segment.size))
+            self._file.write(HEADER.pack(offset, len(payload), zlib.crc32(payload)))
+            self._file.write(payload)
+            segment.size += HEADER.size + len(payload)
+            segment.last_offset = offset
+            self._next_offset += 1
+            self._stats["appended"] += 1
+            if self.fsync_mode == "always":
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._stats["fsyncs"] += 1
+        if self.fsync_mode == "batch":
+            self._dirty.set()
+        return offset
+
+    def sync(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._file.flush()
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+            self._stats["fsyncs"] += 1
+        finally:
+            os.close(fd)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            # Janela de agrupamento: os appends desse intervalo saem num unico fsync
+            time.sleep(self.fsync_interval)
+            self._dirty.clear()
+            try:
+                self.sync()
+                if self._compact_due():
+                    self.compact()
+            except Exception as e:
+                print(f"[EventLog] Erro no flush: {e}")
+
+    def _compact_due(self) -> bool:
+        # Com mais dados vivos do que compact_after_segments segmentos comportam,
+        # a contagem nunca cai abaixo do gatilho: sem exigir um segmento novo e um
+        # intervalo minimo, cada flush reescreveria todos os segmentos fechados
+        return (bool(self.compact_after_segments)
+                and len(self._segments) > self.compact_after_segments
+                and self._rolls_since_compact > 0
+                and time.monotonic() - self._last_compact >= self.compact_min_interval)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._file.flush()
+            if self.fsync_mode != "never":
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._closed = True
+        self._dirty.set()
+
+    # --- leitura ---
+
+    @property
+    def next_offset(self) -> int:
+        return self._next_offset
+
+    def read(self, from_offset: int = 0, limit: Optional[int] = None) -> Iterator[Tuple[int, Dict]]:
+        """Itera (offset, registro) a partir de from_offset, em ordem.
+
+        Os segmentos sao abertos sob o lock, junto com o snapshot de tamanho e
+        indice: a compactacao troca os arquivos (os.replace) sob o mesmo lock,
+        entao cada descritor aberto continua apontando para o conteudo que o
+        snapshot descreve, mesmo que o arquivo seja substituido durante a leitura.
+        Um registro com crc32 divergente interrompe a leitura com ValueError.
+        """
+        opened = []
+        try:
+            with self._lock:
+                if not self._closed:
+                    self._file.flush()
+                bases = [s.base for s in self._segments]
+                start = max(bisect_right(bases, from_offset) - 1, 0)
+                for s in self._segments[start:]:
+                    if s.size:
+                        opened.append((open(s.path, "rb"), s.path, s.size, list(s.index)))
+
+            produced = 0
+            for f, path, size, index in opened:
+                keys = [o for o, _ in index]
+                i = bisect_right(keys, from_offset) - 1
+                pos = index[i][1] if i >= 0 else 0
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for offset, record in _records(mm, pos, min(size, len(mm)), path):
+                        if offset < from_offset:
+                            continue
+                        yield offset, record
+                        produced += 1
+                        if limit is not None and produced >= limit:
+                            return
+        finally:
+            for f, *_ in opened:
+                f.close()
+
+    # --- compactacao ---
+
+    def compact(self) -> Dict:
+        """Compacta os segmentos fechados (todos menos o ativo)."""
+        with self._compact_lock:
+            with self._lock:
+                sealed = list(self._segments[:-1])
+                self._rolls_since_compact = 0
+            self._last_compact = time.monotonic()
+            if not sealed:
+                return {"segments": 0, "reclaimed_bytes": 0}
+
+            latest: Dict[str, int] = {}
+            for offset, record in self.read(0):
+                if record.get("key") is not None:
+                    latest[record["key"]] = offset
+
+            cutoff = time.time() - self.retention_seconds if self.retention_seconds else None
+            reclaimed = 0
+            replaced: Dict[int, Optional[_Segment]] = {}
+            for segment in sealed:
+                tmp_path = segment.path + ".compact"
+                rewritten = _Segment(segment.base, segment.path)
+                count = 0
+                with open(tmp_path, "wb") as out:
+                    for offset, record in self._read_segment(segment):
+                        key = record.get("key")
+                        if key is not None:
+                            if latest.get(key) != offset or record.get("data") is None:
+                                continue
+                        elif cutoff is not None and record.get("ts", cutoff) < cutoff:
+                            continue
+                        payload = json.dumps(record, default=str, separators=(",", ":")).encode()
+                        if count % self.index_interval == 0:
+                            rewritten.index.append((offset, rewritten.size))
+                        out.write(HEADER.pack(offset, len(payload), zlib.crc32(payload)))
+                        out.write(payload)
+                        rewritten.size += HEADER.size + len(payload)
+                        rewritten.last_offset = offset
+                        count += 1
+                    out.flush()
+                    os.fsync(out.fileno())
+                reclaimed += segment.size - rewritten.size
+                if count == 0:
+                    os.remove(tmp_path)
+                    replaced[segment.base] = None
+                else:
+                    replaced[segment.base] = rewritten
+
+            # Troca dos arquivos e dos metadados sob o mesmo lock em que read()
+            # abre os segmentos: um leitor ve o arquivo antigo com o snapshot
+            # antigo ou o novo com o novo, nunca a mistura
+            with self._lock:
+                for base, rewritten in replaced.items():
+                    path = self._segment_path(base)
+                    if rewritten is None:
+                        os.remove(path)
+                    else:
+                        os.replace(path + ".compact", path)
+                segments = []
+                for segment in self._segments:
+                    if segment.base in replaced:
+                        if replaced[segment.base] is not None:
+                            segments.append(replaced[segment.base])
+                    else:
+                        segments.append(segment)
+                self._segments = segments
+                self._stats["compactions"] += 1
+                self._stats["reclaimed_bytes"] += reclaimed
+            return {"segments": len(sealed), "reclaimed_bytes": reclaimed}
+
+    def _read_segment(self, segment: _Segment) -> Iterator[Tuple[int, Dict]]:
+        if segment.size == 0:
+            return
+        with open(segment.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from _records(mm, 0, min(segment.size, len(mm)), segment.path)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "segments": len(self._segments),
+                "bytes": sum(s.size for s in self._segments),
+                "next_offset": self._next_offset,
+                "fsync_mode": self.fsync_mode,
+                **self._stats,
+            }
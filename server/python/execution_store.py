@@ -0,0 +1,438 @@
+"""
+Arcadia Execution Store - Historico persistente de execucoes de workflows
+Execucoes concluidas vao para uma tabela indexada por workflow, status e
+tempo: SQLite (arquivo local, modo WAL) em desenvolvimento e PostgreSQL em
+producao. As gravacoes entram numa fila e uma thread dedicada as grava em
+lotes (uma transacao por lote), entao o event loop nunca espera pelo disco.
+
+    - contadores por (workflow_id, status) atualizados na mesma transacao
+      do insert; sao acumulados e nao diminuem com a retencao
+    - consultas paginadas por cursor (keyset em submitted_ts, id), sem
+      OFFSET, com custo constante em qualquer pagina
+    - retencao por idade (geral e, opcionalmente, menor para execucoes
+      concluidas com sucesso) e por quantidade maxima de linhas, aplicada
+      periodicamente pela mesma thread
+
+Uso:
+    from execution_store import open_execution_store
+    store = open_execution_store("data/automation/executions.db", DATABASE_URL)
+    store.put(execution)
+    page, cursor = store.query(workflow_id="wf-1", status="error", limit=50)
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .db_pool import HAS_PSYCOPG2, DbPool
+    from .instrumentation import Gauge, track_db
+except ImportError:
+    from db_pool import HAS_PSYCOPG2, DbPool
+    from instrumentation import Gauge, track_db
+
+EXECUTION_STORE_PENDING = Gauge(
+    "arcadia_execution_store_pending",
+    "Execucoes aguardando gravacao no execution store",
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS automation_executions (
+        id TEXT PRIMARY KEY,
+        workflow_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        submitted_ts DOUBLE PRECISION NOT NULL,
+        duration_ms DOUBLE PRECISION,
+        error TEXT,
+        data TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_automation_exec_time ON automation_executions (submitted_ts, id)",
+    "CREATE INDEX IF NOT EXISTS idx_automation_exec_workflow ON automation_executions (workflow_id, submitted_ts, id)",
+    "CREATE INDEX IF NOT EXISTS idx_automation_exec_status ON automation_executions (status, submitted_ts, id)",
+    "CREATE INDEX IF NOT EXISTS idx_automation_exec_workflow_status "
+    "ON automation_executions (workflow_id, status, submitted_ts, id)",
+    """CREATE TABLE IF NOT EXISTS automation_execution_counters (
+        workflow_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        total BIGINT NOT NULL,
+        PRIMARY KEY (workflow_id, status)
+    )""",
+)
+
+INSERT_SQL = """
+INSERT INTO automation_executions (id, workflow_id, status, submitted_ts, duration_ms, error, data)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO NOTHING
+"""
+
+COUNTER_SQL = """
+INSERT INTO automation_execution_counters (workflow_id, status, total) VALUES (?, ?, ?)
+ON CONFLICT (workflow_id, status)
+DO UPDATE SET total = automation_execution_counters.total + excluded.total
+"""
+
+PRUNE_BATCH = 5000
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_cursor(submitted_ts: float, exec_id: str) -> str:
+    return f"{submitted_ts!r}:{exec_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    ts, sep, exec_id = cursor.partition(":")
+    if not sep:
+        raise ValueError(f"Cursor invalido: {cursor}")
+    return float(ts), exec_id
+
+
+class ExecutionStore:
+    """Base: fila de escrita, thread de gravacao em lote, consultas e retencao.
+
+    Subclasses definem backend, o placeholder de parametros e _connection(),
+    um context manager que entrega uma conexao DB-API e faz commit ao sair.
+    """
+
+    backend = "base"
+    placeholder = "?"
+
+    def __init__(self, retention_days: float = 30.0, completed_retention_days: float = 0.0,
+                 max_rows: int = 0, batch_size: int = 500, prune_interval: float = 300.0):
+        self.retention_days = max(float(retention_days), 0.0)
+        self.completed_retention_days = max(float(completed_retention_days), 0.0)
+        self.max_rows = max(int(max_rows), 0)
+        self.batch_size = max(int(batch_size), 1)
+        self.prune_interval = max(float(prune_interval), 1.0)
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue()
+        self._idle = threading.Condition()
+        self._unfinished = 0
+        self._counts = {"written": 0, "duplicates": 0, "pruned": 0, "write_errors": 0}
+        self._last_error: Optional[str] = None
+        self._last_prune = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    # --- backend ---
+
+    @contextmanager
+    def _connection(self):
+        raise NotImplementedError
+
+    def _sql(self, sql: str) -> str:
+        return sql if self.placeholder == "?" else sql.replace("?", self.placeholder)
+
+    def _init_schema(self):
+        with self._connection() as conn:
+            cur = conn.cursor()
+            for ddl in SCHEMA:
+                cur.execute(ddl)
+
+    # --- escrita ---
+
+    def start(self):
+        if self._thread is None:
+            self._init_schema()
+            self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+            self._thread.start()
+
+    def put(self, execution: Dict):
+        """Enfileira a execucao concluida; nunca bloqueia."""
+        with self._idle:
+            self._unfinished += 1
+        self._queue.put(execution)
+        EXECUTION_STORE_PENDING.set(self._unfinished)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Espera a fila esvaziar (ate timeout). Retorna False se expirou."""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._unfinished > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _writer_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.prune_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            batch = [item] if item else []
+            while len(batch) < self.batch_size:
+                try:
+                    extra = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is None:
+                    self._queue.put(None)
+                    break
+                batch.append(extra)
+
+            if batch:
+                self._write_batch(batch)
+                with self._idle:
+                    self._unfinished -= len(batch)
+                    self._idle.notify_all()
+                EXECUTION_STORE_PENDING.set(self._unfinished)
+            if time.monotonic() - self._last_prune >= self.prune_interval:
+                self.prune()
+
+    def _write_batch(self, batch: List[Dict]):
+        rows = []
+        for execution in batch:
+            submitted = _timestamp(execution.get("submitted_at")) or time.time()
+            started = _timestamp(execution.get("started_at"))
+            completed = _timestamp(execution.get("completed_at"))
+            duration = round((completed - started) * 1000, 3) if started and completed else None
+            rows.append((
+                execution["id"], execution["workflow_id"], execution.get("status", "unknown"),
+                submitted, duration, execution.get("error"), json.dumps(execution, default=str),
+            ))
+        try:
+            counters: Dict[Tuple[str, str], int] = defaultdict(int)
+            with track_db("execution_store_write"), self._connection() as conn:
+                cur = conn.cursor()
+                insert = self._sql(INSERT_SQL)
+                for row in rows:
+                    cur.execute(insert, row)
+                    if cur.rowcount == 1:
+                        counters[(row[1], row[2])] += 1
+                    else:
+                        self._counts["duplicates"] += 1
+                if counters:
+                    cur.executemany(self._sql(COUNTER_SQL),
+                                    [(wf, status, n) for (wf, status), n in counters.items()])
+            self._counts["written"] += sum(counters.values())
+            self._last_error = None
+        except Exception as e:
+            self._counts["write_errors"] += len(rows)
+            self._last_error = str(e)
+            print(f"[ExecutionStore] Falha ao gravar {len(rows)} execucoes: {e}")
+
+    # --- leitura ---
+
+    def get(self, exec_id: str) -> Optional[Dict]:
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql("SELECT data FROM automation_executions WHERE id = ?"), (exec_id,))
+            row = cur.fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, workflow_id: Optional[str] = None, status: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Pagina de execucoes da mais recente para a mais antiga.
+
+        Retorna (execucoes, proximo_cursor); o cursor e None na ultima pagina.
+        """
+        limit = max(min(int(limit), 1000), 1)
+        where, params = [], []
+        if workflow_id:
+            where.append("workflow_id = ?")
+            params.append(workflow_id)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if since is not None:
+            where.append("submitted_ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("submitted_ts < ?")
+            params.append(until)
+        if cursor:
+            ts, exec_id = decode_cursor(cursor)
+            where.append("(submitted_ts < ? OR (submitted_ts = ? AND id < ?))")
+            params.extend([ts, ts, exec_id])
+        sql = "SELECT submitted_ts, id, data FROM automation_executions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY submitted_ts DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with track_db("execution_store_query"), self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(sql), params)
+            rows = cur.fetchall()
+        next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [json.loads(row[2]) for row in rows[:limit]], next_cursor
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        """Totais acumulados por workflow e status."""
+        result: Dict[str, Dict[str, int]] = defaultdict(dict)
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT workflow_id, status, total FROM automation_execution_counters")
+            for workflow_id, status, total in cur.fetchall():
+                result[workflow_id][status] = int(total)
+        return dict(result)
+
+    # --- retencao ---
+
+    def prune(self) -> int:
+        """Aplica a retencao configurada; retorna quantas execucoes removeu."""
+        self._last_prune = time.monotonic()
+        rules = []
+        now = time.time()
+        if self.retention_days:
+            rules.append(("submitted_ts < ?", [now - self.retention_days * 86400]))
+        if self.completed_retention_days:
+            rules.append(("status = 'completed' AND submitted_ts < ?",
+                          [now - self.completed_retention_days * 86400]))
+        removed = 0
+        try:
+            with track_db("execution_store_prune"):
+                if self.max_rows:
+                    with self._connection() as conn:
+                        cur = conn.cursor()
+                        cur.execute(self._sql(
+                            "SELECT submitted_ts FROM automation_executions "
+                            "ORDER BY submitted_ts DESC LIMIT 1 OFFSET ?"), (self.max_rows - 1,))
+                        row = cur.fetchone()
+                    if row:
+                        rules.append(("submitted_ts < ?", [row[0]]))
+                for condition, params in rules:
+                    # Lotes curtos para nao segurar locks por muito tempo
+                    while True:
+                        with self._connection() as conn:
+                            cur = conn.cursor()
+                            cur.execute(self._sql(
+                                "DELETE FROM automation_executions WHERE id IN ("
+                                f"SELECT id FROM automation_executions WHERE {condition} LIMIT ?)"),
+                                params + [PRUNE_BATCH])
+                            deleted = cur.rowcount
+                        removed += max(deleted, 0)
+                        if deleted < PRUNE_BATCH:
+                            break
+        except Exception as e:
+            self._last_error = str(e)
+            print(f"[ExecutionStore] Falha na retencao: {e}")
+        self._counts["pruned"] += removed
+        return removed
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(10)
+            self._thread = None
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "pending": self._unfinished,
+            "retention_days": self.retention_days,
+            "completed_retention_days": self.completed_retention_days,
+            "max_rows": self.max_rows,
+            "last_error": self._last_error,
+            **self._counts,
+        }
+
+
+class SqliteExecutionStore(ExecutionStore):
+    backend = "sqlite"
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connection(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "path": self.path}
+
+
+class PostgresExecutionStore(ExecutionStore):
+    backend = "postgres"
+    placeholder = "%s"
+
+    def __init__(self, database_url: str, pool_size: int = 4, **kwargs):
+        super().__init__(**kwargs)
+        self._pool = DbPool(database_url, name="executions", min_size=1, max_size=pool_size,
+                            statement_timeout_ms=30000, readonly=False)
+
+    @contextmanager
+    def _connection(self):
+        with self._pool.connection() as conn:
+            conn.autocommit = False
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+
+    def close(self):
+        super().close()
+        self._pool.close()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "pool": self._pool.stats()}
+
+
+def open_execution_store(default_path: str, database_url: str = "",
+                         prefix: str = "AUTOMATION_EXECUTION_STORE") -> Optional[ExecutionStore]:
+    """Escolhe o backend por {prefix} (auto|sqlite|postgres|off).
+
+    auto usa PostgreSQL quando ha DATABASE_URL e psycopg2, senao SQLite em
+    {prefix}_PATH (padrao default_path). off mantem so o historico em memoria.
+    """
+    env = os.environ.get
+    mode = env(prefix, "auto").lower()
+    if mode in ("off", "false", "0", "memory"):
+        return None
+    options = dict(
+        retention_days=float(env(f"{prefix}_RETENTION_DAYS", "30")),
+        completed_retention_days=float(env(f"{prefix}_COMPLETED_RETENTION_DAYS", "0")),
+        max_rows=int(env(f"{prefix}_MAX_ROWS", "0")),
+        batch_size=int(env(f"{prefix}_BATCH_SIZE", "500")),
+        prune_interval=float(env(f"{prefix}_PRUNE_INTERVAL_SECONDS", "300")),
+    )
+    has_postgres = HAS_PSYCOPG2 and bool(database_url)
+    if mode == "postgres" or (mode == "auto" and has_postgres):
+        if not has_postgres:
+            raise RuntimeError("Execution store postgres requer psycopg2 e DATABASE_URL")
+        store: ExecutionStore = PostgresExecutionStore(database_url, **options)
+    else:
+        store = SqliteExecutionStore(env(f"{prefix}_PATH") or default_path, **options)
+    store.start()
+    return store
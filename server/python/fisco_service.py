@@ -48,6 +48,11 @@ except ImportError:
     ZEEP_AVAILABLE = False
     print("[WARN] zeep not available for SEFAZ communication")
 
+try:
+    from .instrumentation import instrument_app
+except ImportError:
+    from instrumentation import instrument_app
+
 app = FastAPI(
     title="Arcádia Fisco Service",
     description="Serviço de emissão de NF-e/NFC-e com nfelib",
@@ -62,6 +67,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "fisco")
+
 
 class Ambiente(str, Enum):
     PRODUCAO = "1"
@@ -0,0 +1,346 @@
+"""
+Arcadia HTTP Pool - Cliente HTTP assincrono compartilhado
+Um unico httpx.AsyncClient por event loop, com pool de conexoes keep-alive
+(reutilizadas por origem) e HTTP/2 quando o pacote h2 esta instalado. Sobre
+ele:
+    - limite de requisicoes simultaneas por host
+    - retries com backoff exponencial + jitter (respeita Retry-After) para
+      falhas de conexao, timeouts e status 429/502/503/504; metodos nao
+      idempotentes so sao repetidos se pedido explicitamente
+    - circuit breaker por host: apos N falhas consecutivas o host fica
+      "open" e as chamadas falham na hora; depois de reset_seconds uma
+      chamada de teste (half_open) decide se fecha ou reabre
+    - corpo lido em streaming com limite de bytes (trunca ou falha)
+
+Uso:
+    from http_pool import HttpPool
+    pool = HttpPool.from_env("AUTOMATION_HTTP")
+    result = await pool.request("GET", "https://api.exemplo.com/itens")
+    await pool.close()
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import h2  # noqa: F401
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+try:
+    from .instrumentation import Counter, track_http
+except ImportError:
+    from instrumentation import Counter, track_http
+
+HTTP_POOL_EVENTS = Counter(
+    "arcadia_http_pool_events_total",
+    "Eventos do pool HTTP de saida (retry, circuit_open, truncated, error)",
+    ("event",),
+)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class ResponseTooLarge(ValueError):
+    pass
+
+
+class CircuitBreaker:
+    """Breaker de um host: closed -> open (apos falhas) -> half_open -> closed."""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_seconds = float(reset_seconds)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def status(self) -> Dict:
+        status = {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+        if self.state == "open":
+            status["retry_in_seconds"] = round(max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)), 2)
+        return status
+
+
+class HttpPool:
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20,
+                 keepalive_expiry: float = 30.0, max_per_host: int = 20,
+                 timeout_seconds: float = 10.0, retries: int = 2,
+                 backoff_seconds: float = 0.2, backoff_max_seconds: float = 5.0,
+                 breaker_threshold: int = 5, breaker_reset_seconds: float = 30.0,
+                 max_response_bytes: int = 1024 * 1024, http2: bool = True):
+        self.max_connections = max(int(max_connections), 1)
+        self.max_keepalive = max(int(max_keepalive), 0)
+        self.keepalive_expiry = float(keepalive_expiry)
+        self.max_per_host = max(int(max_per_host), 1)
+        self.timeout_seconds = float(timeout_seconds)
+        self.retries = max(int(retries), 0)
+        self.backoff_seconds = float(backoff_seconds)
+        self.backoff_max_seconds = float(backoff_max_seconds)
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.max_response_bytes = max(int(max_response_bytes), 1)
+        self.http2 = bool(http2) and HAS_H2
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._counts = {"requests": 0, "attempts": 0, "retried": 0, "failures": 0,
+                        "circuit_rejections": 0, "truncated": 0}
+
+    @classmethod
+    def from_env(cls, prefix: str = "AUTOMATION_HTTP") -> "HttpPool":
+        env = os.environ.get
+        return cls(
+            max_connections=int(env(f"{prefix}_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(env(f"{prefix}_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(env(f"{prefix}_KEEPALIVE_SECONDS", "30")),
+            max_per_host=int(env(f"{prefix}_MAX_PER_HOST", "20")),
+            timeout_seconds=float(env(f"{prefix}_TIMEOUT_SECONDS", "10")),
+            retries=int(env(f"{prefix}_RETRIES", "2")),
+            backoff_seconds=float(env(f"{prefix}_BACKOFF_SECONDS", "0.2")),
+            backoff_max_seconds=float(env(f"{prefix}_BACKOFF_MAX_SECONDS", "5")),
+            breaker_threshold=int(env(f"{prefix}_BREAKER_THRESHOLD", "5")),
+            breaker_reset_seconds=float(env(f"{prefix}_BREAKER_RESET_SECONDS", "30")),
+            max_response_bytes=int(env(f"{prefix}_MAX_RESPONSE_BYTES", str(1024 * 1024))),
+            http2=env(f"{prefix}_HTTP2", "on").lower() not in ("off", "false", "0"),
+        )
+
+    # --- cliente ---
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop or self._client.is_closed:
+            # Um AsyncClient fica preso ao loop em que abriu as conexoes
+            if self._client is not None and not self._client.is_closed:
+                self._retire_client(self._client, self._loop, loop)
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                follow_redirects=True,
+            )
+            self._loop = loop
+            self._host_slots = {}
+        return self._client
+
+    @staticmethod
+    def _retire_client(client: "httpx.AsyncClient", old_loop: Optional[asyncio.AbstractEventLoop],
+                       loop: asyncio.AbstractEventLoop):
+        """Fecha o cliente de um loop anterior sem bloquear o loop atual."""
+        async def close_quietly():
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+        if old_loop is not None and old_loop.is_running():
+            asyncio.run_coroutine_threadsafe(close_quietly(), old_loop)
+        else:
+            # Loop antigo parado ou fechado: fecha daqui (sockets sao soltos mesmo se o aclose falhar)
+            loop.create_task(close_quietly())
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset_seconds)
+        return breaker
+
+    def _slots(self, host: str) -> asyncio.Semaphore:
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return slots
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), self.backoff_max_seconds)
+            except ValueError:
+                pass
+        delay = min(self.backoff_seconds * (2 ** attempt), self.backoff_max_seconds)
+        return delay * (0.5 + random.random() / 2)
+
+    # --- requisicao ---
+
+    async def request(self, method: str, url: str, headers: Optional[Dict] = None,
+                      params: Optional[Dict] = None, json_body: Any = None, content: Any = None,
+                      timeout: Optional[float] = None, retries: Optional[int] = None,
+                      retry_non_idempotent: bool = False, max_bytes: Optional[int] = None,
+                      on_oversize: str = "truncate") -> Dict:
+        """Executa a requisicao com retries e breaker do host.
+
+        Retorna status, headers, body (JSON decodificado quando o content-type
+        e JSON e o corpo veio inteiro; senao texto), bytes lidos, truncated,
+        attempts e http_version. Levanta CircuitOpenError, ResponseTooLarge
+        (on_oversize="error") ou o erro httpx da ultima tentativa.
+        """
+        method = method.upper()
+        host = urlsplit(url).netloc
+        if not host:
+            raise ValueError(f"URL invalida: {url}")
+        client = self._get_client()
+        breaker = self._breaker(host)
+        max_retries = self.retries if retries is None else max(int(retries), 0)
+        if method not in IDEMPOTENT_METHODS and not retry_non_idempotent:
+            max_retries = 0
+        limit = max(int(max_bytes or self.max_response_bytes), 1)
+        self._counts["requests"] += 1
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self._counts["circuit_rejections"] += 1
+                HTTP_POOL_EVENTS.labels("circuit_open").inc()
+                raise CircuitOpenError(f"Circuito aberto para {host}")
+            self._counts["attempts"] += 1
+            retry_after = None
+            settled = False
+            try:
+                async with self._slots(host):
+                    with track_http("workflow_http"):
+                        result = await self._send(client, method, url, headers, params, json_body,
+                                                  content, timeout, limit, on_oversize)
+                settled = True
+                if result["status"] >= 500:
+                    breaker.failure()
+                else:
+                    breaker.success()
+                if result["status"] not in RETRY_STATUSES or attempt >= max_retries:
+                    result["attempts"] = attempt + 1
+                    return result
+                retry_after = result["headers"].get("retry-after")
+            except ResponseTooLarge:
+                settled = True
+                breaker.success()
+                raise
+            except (httpx.TransportError, httpx.TimeoutException):
+                settled = True
+                breaker.failure()
+                if attempt >= max_retries:
+                    self._counts["failures"] += 1
+                    HTTP_POOL_EVENTS.labels("error").inc()
+                    raise
+            finally:
+                if not settled:
+                    # Cancelamento (fail_fast, timeout, wait_for) ou outro erro httpx
+                    # (TooManyRedirects, DecodingError): conta como falha e libera a
+                    # chamada de teste do half_open, senao o host fica rejeitado
+                    self._counts["failures"] += 1
+                    breaker.failure()
+            attempt += 1
+            self._counts["retried"] += 1
+            HTTP_POOL_EVENTS.labels("retry").inc()
+            await asyncio.sleep(self._backoff(attempt - 1, retry_after))
+
+    async def _send(self, client, method, url, headers, params, json_body, content,
+                    timeout, limit: int, on_oversize: str) -> Dict:
+        started = time.perf_counter()
+        kwargs = {"headers": headers, "params": params, "timeout": timeout or self.timeout_seconds}
+        if json_body is not None:
+            kwargs["json"] = json_body
+        elif content is not None:
+            kwargs["content"] = content
+        async with client.stream(method, url, **kwargs) as resp:
+            declared = resp.headers.get("content-length")
+            if on_oversize == "error" and declared and declared.isdigit() and int(declared) > limit:
+                raise ResponseTooLarge(f"Resposta de {declared} bytes excede o limite de {limit}")
+            chunks = []
+            size = 0
+            truncated = False
+            async for chunk in resp.aiter_bytes():
+                if size + len(chunk) > limit:
+                    if on_oversize == "error":
+                        raise ResponseTooLarge(f"Resposta excede o limite de {limit} bytes")
+                    chunks.append(chunk[:limit - size])
+                    size = limit
+                    truncated = True
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+            raw = b"".join(chunks)
+            if truncated:
+                self._counts["truncated"] += 1
+                HTTP_POOL_EVENTS.labels("truncated").inc()
+
+            text = raw.decode(resp.encoding or "utf-8", errors="replace")
+            body: Any = text
+            if not truncated and "json" in resp.headers.get("content-type", "") and text:
+                try:
+                    body = json.loads(text)
+                except ValueError:
+                    pass
+            return {
+                "status": resp.status_code,
+                "headers": dict(resp.headers),
+                "body": body,
+                "bytes": size,
+                "truncated": truncated,
+                "http_version": resp.http_version,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+
+    def stats(self) -> Dict:
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "max_per_host": self.max_per_host,
+            "retries": self.retries,
+            "max_response_bytes": self.max_response_bytes,
+            **self._counts,
+            "hosts": {host: breaker.status() for host, breaker in self._breakers.items()},
+        }
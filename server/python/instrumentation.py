@@ -0,0 +1,486 @@
+"""
+Arcadia Instrumentation - Metricas no formato Prometheus
+Modulo compartilhado pelos servicos FastAPI: histogramas de latencia de
+requests, gauge de requests em andamento, tempos de chamadas DB/HTTP e
+contadores de cache, expostos em texto Prometheus via GET /metrics/prom.
+
+Multiplos workers (uvicorn --workers N): cada processo tem seu proprio
+registro, entao sem agregacao cada scrape veria os contadores de um worker
+aleatorio. Com ARCADIA_METRICS_DIR definido (o entrypoint Docker define), cada
+worker grava um snapshot em <dir>/<pid>.json a cada
+ARCADIA_METRICS_FLUSH_SECONDS (padrao 5s) e na saida; o /metrics/prom de
+qualquer worker soma counters e histogramas de todos os arquivos (inclusive
+de workers que ja terminaram, para que nao regridam), soma gauges dos workers
+vivos e publica as metricas process_* com o label pid. Snapshots dos outros
+workers podem ter ate um intervalo de atraso; o diretorio deve ser limpo ao
+iniciar o servico. Sem ARCADIA_METRICS_DIR, cada serie leva o label pid do
+processo que respondeu.
+
+Uso:
+    from instrumentation import instrument_app, track_db
+    instrument_app(app, "bi-engine")
+    with track_db("execute_query"):
+        cur.execute(sql)
+"""
+
+import atexit
+import json
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._lock = threading.Lock()
+        self._const_labels: Dict[str, str] = {}
+        self._multiprocess_dir: Optional[str] = None
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric: "_Metric"):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Metrica ja registrada: {metric.name}")
+            self._metrics.append(metric)
+
+    def set_const_labels(self, **labels: str):
+        self._const_labels = {k: str(v) for k, v in labels.items()}
+
+    # --- multiprocesso ---
+
+    def enable_multiprocess(self, directory: str, flush_seconds: float = 5.0):
+        """Agrega as metricas dos workers que gravam snapshots em directory."""
+        if self._multiprocess_dir is not None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._multiprocess_dir = directory
+        self.flush()
+        atexit.register(self.flush)
+
+        def loop():
+            while True:
+                time.sleep(max(flush_seconds, 0.5))
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"[Metrics] Falha ao gravar snapshot: {e}")
+
+        threading.Thread(target=loop, name="metrics-flush", daemon=True).start()
+
+    def snapshot(self) -> Dict:
+        return {"pid": os.getpid(), "metrics": {m.name: m.snapshot() for m in list(self._metrics)}}
+
+    def flush(self):
+        """Grava o snapshot deste processo (escrita atomica via rename)."""
+        if self._multiprocess_dir is None:
+            return
+        path = os.path.join(self._multiprocess_dir, f"{os.getpid()}.json")
+        with self._flush_lock:
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.snapshot(), f, separators=(",", ":"))
+            os.replace(tmp, path)
+
+    def _read_snapshots(self) -> List[Tuple[int, bool, Dict]]:
+        snapshots = []
+        for entry in os.scandir(self._multiprocess_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            pid = int(data.get("pid", 0))
+            snapshots.append((pid, _pid_alive(pid), data.get("metrics", {})))
+        return snapshots
+
+    def render(self) -> str:
+        lines: List[str] = []
+        if self._multiprocess_dir is None:
+            const = {**self._const_labels, "pid": str(os.getpid())}
+            for metric in list(self._metrics):
+                lines.extend(metric.render(const))
+        else:
+            self.flush()
+            snapshots = self._read_snapshots()
+            for metric in list(self._metrics):
+                lines.extend(metric.render_merged(self._const_labels, snapshots))
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+    # Agregacao entre processos: "sum" soma tudo (counters/histogramas, mesmo
+    # de processos mortos), "livesum" soma os vivos, "pid" publica cada vivo
+    multiprocess_mode = "sum"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = None):
+        self.name = name
+        self.documentation = documentation
+        self._labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self._labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self._labelnames):
+                raise ValueError(f"{self.name}: esperado labels {self._labelnames}, recebido {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_str(self, const: Dict[str, str], values: Tuple[str, ...], extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = list(const.items()) + list(zip(self._labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self, const: Dict[str, str]) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_data(const, values, self._child_data(child)))
+        return lines
+
+    def snapshot(self) -> List:
+        return [[list(values), self._child_data(child)] for values, child in list(self._children.items())]
+
+    def render_merged(self, const: Dict[str, str], snapshots: List[Tuple[int, bool, Dict]]) -> List[str]:
+        merged: Dict[Tuple[str, ...], object] = {}
+        for pid, alive, metrics in snapshots:
+            if self.multiprocess_mode != "sum" and not alive:
+                continue
+            for values, data in metrics.get(self.name, []):
+                key = tuple(values)
+                if self.multiprocess_mode == "pid":
+                    key += (str(pid),)
+                merged[key] = data if key not in merged else self._merge_data(merged[key], data)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, data in merged.items():
+            if self.multiprocess_mode == "pid":
+                lines.extend(self._render_data(const, key[:-1], data, [("pid", key[-1])]))
+            else:
+                lines.extend(self._render_data(const, key, data))
+        return lines
+
+    def _child_data(self, child):
+        return child.get()
+
+    def _merge_data(self, a, b):
+        return a + b
+
+    def _render_data(self, const, values, data, extra: Iterable[Tuple[str, str]] = ()) -> List[str]:
+        return [f"{self.name}{self._label_str(const, values, extra)} {_format_value(data)}"]
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ("_fn",)
+
+    def __init__(self):
+        super().__init__()
+        self._fn: Optional[Callable[[], float]] = None
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        self._value = float(value)
+
+    def set_function(self, fn: Callable[[], float]):
+        self._fn = fn
+
+    def get(self) -> float:
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return float("nan")
+        return self._value
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = None, multiprocess_mode: str = "livesum"):
+        if multiprocess_mode not in ("livesum", "pid"):
+            raise ValueError(f"multiprocess_mode invalido: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, fn: Callable[[], float]):
+        self.labels().set_function(fn)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = None):
+        self._bounds = tuple(sorted(float(b) for b in buckets if b != float("inf")))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self._bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _child_data(self, child):
+        counts, total = child.snapshot()
+        return [counts, total]
+
+    def _merge_data(self, a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+    def _render_data(self, const, values, data, extra: Iterable[Tuple[str, str]] = ()) -> List[str]:
+        counts, total = data
+        extra = list(extra)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float("inf"),), counts):
+            cumulative += count
+            labels = self._label_str(const, values, extra + [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        base = self._label_str(const, values, extra)
+        lines.append(f"{self.name}_sum{base} {_format_value(total)}")
+        lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+# ==================== METRICAS PADRAO ====================
+
+REQUEST_LATENCY = Histogram(
+    "arcadia_http_request_duration_seconds",
+    "Latencia das requests HTTP atendidas pelo servico",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "arcadia_http_requests_in_flight",
+    "Requests HTTP em andamento",
+)
+DB_QUERY_LATENCY = Histogram(
+    "arcadia_db_query_duration_seconds",
+    "Tempo de chamadas ao banco de dados",
+    ("operation",),
+)
+HTTP_CLIENT_LATENCY = Histogram(
+    "arcadia_http_client_request_duration_seconds",
+    "Tempo de chamadas HTTP de saida",
+    ("target",),
+)
+CACHE_REQUESTS = Counter(
+    "arcadia_cache_requests_total",
+    "Consultas a caches internos por resultado (hit/miss)",
+    ("cache", "result"),
+)
+PROCESS_START_TIME = Gauge(
+    "process_start_time_seconds",
+    "Inicio do processo em segundos desde epoch",
+    multiprocess_mode="pid",
+)
+PROCESS_START_TIME.set(time.time())
+
+
+def _resident_memory_bytes() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+PROCESS_RESIDENT_MEMORY = Gauge(
+    "process_resident_memory_bytes",
+    "Memoria residente do processo em bytes",
+    multiprocess_mode="pid",
+)
+PROCESS_RESIDENT_MEMORY.set_function(_resident_memory_bytes)
+
+
+def track_db(operation: str):
+    return DB_QUERY_LATENCY.labels(operation).time()
+
+
+def track_http(target: str):
+    return HTTP_CLIENT_LATENCY.labels(target).time()
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+# ==================== ASGI ====================
+
+class PrometheusMiddleware:
+    """Middleware ASGI puro: mede latencia por rota (template, nao path bruto)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels()
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route, status).observe(time.perf_counter() - start)
+
+
+def instrument_app(app, service: str):
+    """Registra o middleware de metricas e monta GET /metrics/prom no app."""
+    from starlette.responses import Response
+
+    REGISTRY.set_const_labels(service=service)
+    metrics_dir = os.environ.get("ARCADIA_METRICS_DIR")
+    if metrics_dir:
+        REGISTRY.enable_multiprocess(
+            metrics_dir, float(os.environ.get("ARCADIA_METRICS_FLUSH_SECONDS", "5")))
+    app.add_middleware(PrometheusMiddleware)
+
+    @app.get("/metrics/prom", include_in_schema=False)
+    async def prometheus_metrics():
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
+    return app
@@ -0,0 +1,400 @@
+"""
+Arcadia Leader Election - Lider unico entre replicas via lease no PostgreSQL
+Cada processo do servico disputa um lease nomeado em uma tabela do banco.
+Quem detem o lease e o lider e o renova a cada ttl/3; se o lider morre, o
+lease expira e outra replica assume em ate ~ttl + ttl/3. O tempo do lease e
+sempre o do banco (now()), entao relogios divergentes entre replicas nao
+importam.
+
+Cada aquisicao de um lease expirado (ou de outro holder) incrementa o epoch,
+que funciona como fencing token: escritas feitas pelo lider (ex.: registro
+de disparo do scheduler) so sao aceitas se o lease ainda pertence a este
+holder com o mesmo epoch, o que barra um lider antigo que ficou pausado
+alem do TTL.
+
+As entradas do scheduler tambem ficam no banco (automation_schedule_entries):
+a configuracao e gravada por qualquer replica que recebe o POST/DELETE, e o
+progresso (next_run, last_run, ...) pelo lider, com o mesmo fencing. Todas as
+replicas recarregam a tabela periodicamente, entao um novo lider assume com as
+entradas e os slots do anterior. Os registros de disparo sao podados apos
+AUTOMATION_SCHEDULE_FIRES_RETENTION_HOURS (padrao 168h).
+
+A eleicao e opt-in: com AUTOMATION_LEADER_ELECTION=postgres as tabelas
+automation_leases, automation_schedule_fires e automation_schedule_entries sao
+criadas no DATABASE_URL na primeira conexao. Sem essa variavel (ou sem
+psycopg2/DATABASE_URL) o processo e lider sozinho (modo local), como antes.
+"""
+
+import os
+import socket
+import threading
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import psycopg2
+    HAS_PSYCOPG2 = True
+except ImportError:
+    HAS_PSYCOPG2 = False
+
+LEASE_DDL = """
+CREATE TABLE IF NOT EXISTS automation_leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    epoch BIGINT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS automation_schedule_fires (
+    entry_id TEXT NOT NULL,
+    slot TIMESTAMP NOT NULL,
+    holder TEXT NOT NULL,
+    epoch BIGINT NOT NULL,
+    fired_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (entry_id, slot)
+);
+CREATE INDEX IF NOT EXISTS automation_schedule_fires_fired_at ON automation_schedule_fires (fired_at);
+CREATE TABLE IF NOT EXISTS automation_schedule_entries (
+    id TEXT PRIMARY KEY,
+    config TEXT,
+    progress TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+ACQUIRE_SQL = """
+INSERT INTO automation_leases AS l (name, holder, epoch, expires_at)
+VALUES (%(name)s, %(holder)s, 1, now() + make_interval(secs => %(ttl)s))
+ON CONFLICT (name) DO UPDATE
+SET holder = EXCLUDED.holder,
+    epoch = CASE WHEN l.holder = EXCLUDED.holder AND l.expires_at > now()
+                 THEN l.epoch ELSE l.epoch + 1 END,
+    expires_at = EXCLUDED.expires_at,
+    updated_at = now()
+WHERE l.holder = EXCLUDED.holder OR l.expires_at <= now()
+RETURNING epoch
+"""
+
+RELEASE_SQL = """
+UPDATE automation_leases SET expires_at = now(), updated_at = now()
+WHERE name = %(name)s AND holder = %(holder)s AND epoch = %(epoch)s
+"""
+
+FENCED_FIRE_SQL = """
+INSERT INTO automation_schedule_fires (entry_id, slot, holder, epoch)
+SELECT %(entry_id)s, %(slot)s, %(holder)s, %(epoch)s
+WHERE EXISTS (
+    SELECT 1 FROM automation_leases
+    WHERE name = %(name)s AND holder = %(holder)s AND epoch = %(epoch)s AND expires_at > now()
+)
+ON CONFLICT DO NOTHING
+RETURNING entry_id
+"""
+
+PRUNE_FIRES_SQL = """
+DELETE FROM automation_schedule_fires WHERE fired_at < now() - make_interval(secs => %(retention)s)
+"""
+
+# config NULL = entrada removida; a linha fica para nao ser republicada por
+# uma replica que ainda a tenha no event log local
+PUBLISH_ENTRY_SQL = """
+INSERT INTO automation_schedule_entries (id, config, progress, updated_at)
+VALUES (%(id)s, %(config)s, NULL, now())
+ON CONFLICT (id) DO UPDATE
+SET config = EXCLUDED.config, progress = NULL, updated_at = now()
+"""
+
+FENCED_PROGRESS_SQL = """
+UPDATE automation_schedule_entries SET progress = %(progress)s, updated_at = now()
+WHERE id = %(id)s AND config IS NOT NULL AND EXISTS (
+    SELECT 1 FROM automation_leases
+    WHERE name = %(name)s AND holder = %(holder)s AND epoch = %(epoch)s AND expires_at > now()
+)
+"""
+
+ENTRIES_SQL = "SELECT id, config, progress FROM automation_schedule_entries"
+
+CURRENT_SQL = "SELECT holder, epoch, expires_at FROM automation_leases WHERE name = %(name)s"
+
+
+def default_instance_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class LeaderElector:
+    PRUNE_INTERVAL_SECONDS = 3600.0
+
+    def __init__(self, database_url: str = "", name: str = "automation-scheduler",
+                 ttl_seconds: float = 15.0, instance_id: Optional[str] = None,
+                 fires_retention_seconds: float = 7 * 86400):
+        self.name = name
+        self.ttl = max(float(ttl_seconds), 3.0)
+        self.instance_id = instance_id or default_instance_id()
+        self.local = not (HAS_PSYCOPG2 and database_url)
+        self._database_url = database_url
+        self._conn = None
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._valid_until = 0.0
+        self._running = False
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._transitions = 0
+        self._last_error: Optional[str] = None
+        self.fires_retention = fires_retention_seconds
+        self._next_prune = 0.0
+        self._fence_retries = 0
+
+    @classmethod
+    def from_env(cls, database_url: str, prefix: str = "AUTOMATION") -> "LeaderElector":
+        mode = os.environ.get(f"{prefix}_LEADER_ELECTION", "off").lower()
+        if mode not in ("off", "false", "0", "postgres", "on", "true", "1"):
+            raise ValueError(f"{prefix}_LEADER_ELECTION invalido: {mode} (use off ou postgres)")
+        enabled = mode in ("postgres", "on", "true", "1")
+        if enabled and not (HAS_PSYCOPG2 and database_url):
+            print(f"[Leader] {prefix}_LEADER_ELECTION={mode} sem psycopg2/DATABASE_URL: modo local")
+        return cls(
+            database_url=database_url if enabled else "",
+            ttl_seconds=float(os.environ.get(f"{prefix}_LEADER_LEASE_SECONDS", "15")),
+            instance_id=os.environ.get(f"{prefix}_INSTANCE_ID") or None,
+            fires_retention_seconds=float(os.environ.get(f"{prefix}_SCHEDULE_FIRES_RETENTION_HOURS", "168")) * 3600,
+        )
+
+    # --- conexao ---
+
+    def _cursor(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(self._database_url, connect_timeout=max(1, int(self.ttl / 3)))
+            self._conn.autocommit = True
+            with self._conn.cursor() as cur:
+                cur.execute(LEASE_DDL)
+        return self._conn.cursor()
+
+    def _drop_connection(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    # --- lease ---
+
+    def is_leader(self) -> bool:
+        if self.local:
+            return True
+        return time.monotonic() < self._valid_until
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def try_acquire(self) -> bool:
+        """Adquire ou renova o lease. Retorna True se este processo e o lider."""
+        if self.local:
+            return True
+        was_leader = self.is_leader()
+        # O prazo local conta a partir de antes da query e desconta uma margem,
+        # para expirar aqui antes de expirar no banco.
+        started = time.monotonic()
+        with self._lock:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(ACQUIRE_SQL, {"name": self.name, "holder": self.instance_id, "ttl": self.ttl})
+                    row = cur.fetchone()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+                self._drop_connection()
+                row = None
+                if self.is_leader():
+                    # Mantem a lideranca ate o prazo local; depois ela cai sozinha
+                    return True
+
+            if row:
+                self._epoch = row[0]
+                self._valid_until = started + self.ttl * 0.8
+            else:
+                self._valid_until = 0.0
+
+        if was_leader != self.is_leader():
+            self._transitions += 1
+            state = f"lider (epoch {self._epoch})" if self.is_leader() else "seguidor"
+            print(f"[Leader] {self.instance_id} agora e {state} de '{self.name}'")
+        return self.is_leader()
+
+    def release(self):
+        if self.local or not self.is_leader():
+            return
+        with self._lock:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(RELEASE_SQL, {"name": self.name, "holder": self.instance_id, "epoch": self._epoch})
+            except Exception as e:
+                self._last_error = str(e)
+                self._drop_connection()
+            self._valid_until = 0.0
+        print(f"[Leader] {self.instance_id} liberou o lease '{self.name}'")
+
+    def fence_fire(self, entry_id: str, slot: datetime) -> bool:
+        """Registra o disparo (entry_id, slot) condicionado ao lease atual.
+
+        Falha se o lease mudou de dono/epoch ou se o slot ja foi disparado,
+        garantindo no maximo um disparo por slot entre todas as replicas.
+        Erros de banco sao retentados enquanto o lease local ainda vale; se ele
+        expirar antes, o slot fica para o proximo lider (que retoma o progresso
+        gravado e aplica a misfire_policy).
+        """
+        if self.local:
+            return True
+        delay = 0.1
+        while self.is_leader():
+            with self._lock:
+                try:
+                    with self._cursor() as cur:
+                        cur.execute(FENCED_FIRE_SQL, {
+                            "entry_id": entry_id, "slot": slot, "holder": self.instance_id,
+                            "epoch": self._epoch, "name": self.name,
+                        })
+                        accepted = cur.fetchone() is not None
+                    break
+                except Exception as e:
+                    self._last_error = str(e)
+                    self._drop_connection()
+            self._fence_retries += 1
+            print(f"[Leader] Erro ao registrar disparo de {entry_id}, nova tentativa em {delay:.1f}s: {self._last_error}")
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+        else:
+            return False
+        if not accepted:
+            print(f"[Leader] Disparo de {entry_id} em {slot.isoformat()} recusado pelo fencing (epoch {self._epoch})")
+        return accepted
+
+    # --- entradas compartilhadas do scheduler ---
+
+    def publish_entry(self, entry_id: str, config: Optional[Dict]):
+        """Grava (ou remove, com config None) a configuracao de uma entrada para todas as replicas.
+
+        Zera o progresso: a entrada nova ou alterada e agendada a partir de agora.
+        Levanta a excecao do banco para o chamador recusar a alteracao.
+        """
+        if self.local:
+            return
+        with self._lock:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(PUBLISH_ENTRY_SQL, {
+                        "id": entry_id, "config": json.dumps(config, default=str) if config is not None else None,
+                    })
+            except Exception as e:
+                self._last_error = str(e)
+                self._drop_connection()
+                raise
+
+    def record_progress(self, entry_id: str, progress: Dict) -> bool:
+        """Grava next_run/last_run/contadores da entrada; so o lider do epoch atual consegue."""
+        if self.local or not self.is_leader():
+            return False
+        with self._lock:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(FENCED_PROGRESS_SQL, {
+                        "id": entry_id, "progress": json.dumps(progress, default=str),
+                        "name": self.name, "holder": self.instance_id, "epoch": self._epoch,
+                    })
+                    return cur.rowcount > 0
+            except Exception as e:
+                self._last_error = str(e)
+                self._drop_connection()
+                print(f"[Leader] Falha ao gravar progresso de {entry_id}: {e}")
+                return False
+
+    def load_entries(self) -> List[Tuple[str, Optional[Dict], Optional[Dict]]]:
+        """Retorna (id, config, progress) de todas as entradas; config None = removida."""
+        if self.local:
+            return []
+        with self._lock:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(ENTRIES_SQL)
+                    rows = cur.fetchall()
+            except Exception as e:
+                self._last_error = str(e)
+                self._drop_connection()
+                raise
+        return [(row[0], json.loads(row[1]) if row[1] is not None else None,
+                 json.loads(row[2]) if row[2] is not None else None) for row in rows]
+
+    def _prune_fires(self):
+        """Apaga registros de disparo mais antigos que a retencao (no maximo uma vez por hora)."""
+        if not self.fires_retention or time.monotonic() < self._next_prune or not self.is_leader():
+            return
+        self._next_prune = time.monotonic() + self.PRUNE_INTERVAL_SECONDS
+        with self._lock:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(PRUNE_FIRES_SQL, {"retention": self.fires_retention})
+                    pruned = cur.rowcount
+            except Exception as e:
+                self._last_error = str(e)
+                self._drop_connection()
+                return
+        if pruned:
+            print(f"[Leader] {pruned} registros de disparo antigos removidos")
+
+    # --- loop de renovacao ---
+
+    def start(self):
+        if self.local or self._running:
+            return
+        self._running = True
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        self.release()
+
+    def _run_loop(self):
+        while self._running:
+            self.try_acquire()
+            self._prune_fires()
+            self._wake.wait(self.ttl / 3)
+
+    def status(self) -> Dict:
+        status = {
+            "mode": "local" if self.local else "postgres",
+            "lease": self.name,
+            "instance_id": self.instance_id,
+            "is_leader": self.is_leader(),
+            "epoch": self._epoch,
+            "ttl_seconds": self.ttl,
+            "transitions": self._transitions,
+            "fence_retries": self._fence_retries,
+            "last_error": self._last_error,
+        }
+        if not self.local:
+            status["lease_valid_for_seconds"] = round(max(0.0, self._valid_until - time.monotonic()), 2)
+        return status
+
+    def current_holder(self) -> Optional[Dict]:
+        if self.local:
+            return {"holder": self.instance_id, "epoch": 0, "expires_at": None}
+        with self._lock:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(CURRENT_SQL, {"name": self.name})
+                    row = cur.fetchone()
+            except Exception as e:
+                self._last_error = str(e)
+                self._drop_connection()
+                return None
+        if not row:
+            return None
+        return {"holder": row[0], "epoch": row[1], "expires_at": row[2].isoformat()}
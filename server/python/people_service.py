@@ -12,6 +12,11 @@ from decimal import Decimal
 import json
 import os
 
+try:
+    from .instrumentation import instrument_app
+except ImportError:
+    from instrumentation import instrument_app
+
 app = FastAPI(
     title="Arcádia People",
     description="Motor de RH - Folha de Pagamento, Ponto, Férias, eSocial",
@@ -26,6 +31,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "people")
+
 # ========== Tabelas de Cálculo (2024) ==========
 
 TABELA_INSS_2024 = [
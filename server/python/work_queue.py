@@ -0,0 +1,348 @@
+"""
+Arcadia Work Queue - Fila compartilhada de execucoes de workflows
+A API enfileira execucoes numa tabela e processos worker (automation_worker.py,
+em varios nucleos ou nos) as reivindicam em lotes:
+
+    - PostgreSQL: claim com FOR UPDATE SKIP LOCKED, entao workers concorrentes
+      nunca disputam a mesma linha nem esperam uns pelos outros
+    - SQLite (arquivo local em modo WAL): substituto de broker para varios
+      processos no mesmo host; o claim roda em BEGIN IMMEDIATE
+    - visibility timeout: o claim concede um lease (lease_until) que o worker
+      renova via heartbeat; se o worker morrer, a linha volta a ser
+      reivindicavel quando o lease expira, ate max_attempts tentativas
+    - complete() so vale para o dono atual do lease (resultado de um worker
+      que perdeu o lease e descartado)
+    - a API que enfileirou (origin) recolhe as linhas concluidas com collect()
+    - tabela de workers com heartbeat e contadores de throughput
+
+Uso:
+    from work_queue import open_work_queue
+    queue = open_work_queue("data/automation/work-queue.db", DATABASE_URL)
+    queue.enqueue(execution["id"], execution["workflow_id"], "api-1", payload)
+    jobs = queue.claim("worker-1", limit=10, visibility_timeout=60)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    from .db_pool import HAS_PSYCOPG2, DbPool
+    from .instrumentation import track_db
+except ImportError:
+    from db_pool import HAS_PSYCOPG2, DbPool
+    from instrumentation import track_db
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS automation_work_queue (
+        id TEXT PRIMARY KEY,
+        workflow_id TEXT NOT NULL,
+        origin TEXT NOT NULL,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker_id TEXT,
+        lease_until DOUBLE PRECISION,
+        enqueued_ts DOUBLE PRECISION NOT NULL,
+        payload TEXT NOT NULL,
+        result TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_automation_work_claim ON automation_work_queue (state, enqueued_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_automation_work_origin ON automation_work_queue (origin, state)",
+    """CREATE TABLE IF NOT EXISTS automation_workers (
+        worker_id TEXT PRIMARY KEY,
+        host TEXT,
+        pid INTEGER,
+        started_ts DOUBLE PRECISION NOT NULL,
+        heartbeat_ts DOUBLE PRECISION NOT NULL,
+        concurrency INTEGER,
+        running INTEGER,
+        claimed BIGINT,
+        completed BIGINT,
+        failed BIGINT,
+        lost BIGINT,
+        throughput DOUBLE PRECISION
+    )""",
+)
+
+CLAIM_SQL = """
+UPDATE automation_work_queue
+SET state = 'running', worker_id = ?, attempts = attempts + 1, lease_until = ?
+WHERE id IN (
+    SELECT id FROM automation_work_queue
+    WHERE (state = 'queued' OR (state = 'running' AND lease_until < ?)) AND attempts < ?
+    ORDER BY enqueued_ts
+    LIMIT ?{lock}
+)
+RETURNING id, attempts, payload
+"""
+
+# Leases expirados sem tentativas restantes: concluidos sem resultado (collect gera o erro)
+EXHAUSTED_SQL = """
+UPDATE automation_work_queue SET state = 'done', lease_until = NULL
+WHERE state = 'running' AND lease_until < ? AND attempts >= ?
+"""
+
+COLLECT_SQL = """
+DELETE FROM automation_work_queue
+WHERE id IN (
+    SELECT id FROM automation_work_queue
+    WHERE origin = ? AND state = 'done'
+    ORDER BY enqueued_ts
+    LIMIT ?{lock}
+)
+RETURNING id, attempts, worker_id, payload, result
+"""
+
+WORKER_SQL = """
+INSERT INTO automation_workers (worker_id, host, pid, started_ts, heartbeat_ts, concurrency,
+                                running, claimed, completed, failed, lost, throughput)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (worker_id) DO UPDATE SET
+    heartbeat_ts = excluded.heartbeat_ts, running = excluded.running, claimed = excluded.claimed,
+    completed = excluded.completed, failed = excluded.failed, lost = excluded.lost,
+    throughput = excluded.throughput
+"""
+
+WORKER_COLUMNS = ("worker_id", "host", "pid", "started_ts", "heartbeat_ts", "concurrency",
+                  "running", "claimed", "completed", "failed", "lost", "throughput")
+
+
+class WorkQueue:
+    """Base: enqueue/claim/heartbeat/complete/collect sobre uma tabela.
+
+    Subclasses definem backend, placeholder, lock_clause e _connection(), um
+    context manager que entrega uma conexao DB-API numa transacao de escrita
+    e faz commit ao sair.
+    """
+
+    backend = "base"
+    placeholder = "?"
+    lock_clause = ""
+
+    def __init__(self, max_attempts: int = 3):
+        self.max_attempts = max(int(max_attempts), 1)
+        self._counts = {"enqueued": 0, "collected": 0}
+
+    @contextmanager
+    def _connection(self):
+        raise NotImplementedError
+
+    def _sql(self, sql: str) -> str:
+        sql = sql.replace("{lock}", self.lock_clause)
+        return sql if self.placeholder == "?" else sql.replace("?", self.placeholder)
+
+    def init_schema(self):
+        with self._connection() as conn:
+            cur = conn.cursor()
+            for ddl in SCHEMA:
+                cur.execute(ddl)
+
+    # --- produtor (API) ---
+
+    def enqueue(self, job_id: str, workflow_id: str, origin: str, payload: Dict):
+        with track_db("work_queue_enqueue"), self._connection() as conn:
+            conn.cursor().execute(self._sql(
+                "INSERT INTO automation_work_queue (id, workflow_id, origin, state, enqueued_ts, payload) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)"),
+                (job_id, workflow_id, origin, time.time(), json.dumps(payload, default=str)))
+        self._counts["enqueued"] += 1
+
+    def collect(self, origin: str, limit: int = 500) -> List[Dict]:
+        """Remove e retorna as linhas concluidas enfileiradas por origin.
+
+        result e None quando o job esgotou max_attempts sem nenhum worker concluir.
+        """
+        with track_db("work_queue_collect"), self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(EXHAUSTED_SQL), (time.time(), self.max_attempts))
+            cur.execute(self._sql(COLLECT_SQL), (origin, max(int(limit), 1)))
+            rows = cur.fetchall()
+        self._counts["collected"] += len(rows)
+        return [{"id": row[0], "attempts": row[1], "worker_id": row[2], "payload": json.loads(row[3]),
+                 "result": json.loads(row[4]) if row[4] else None} for row in rows]
+
+    # --- consumidor (worker) ---
+
+    def claim(self, worker_id: str, limit: int, visibility_timeout: float) -> List[Dict]:
+        """Reivindica ate limit jobs (novos ou com lease expirado) por visibility_timeout segundos."""
+        if limit <= 0:
+            return []
+        now = time.time()
+        with track_db("work_queue_claim"), self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(CLAIM_SQL),
+                        (worker_id, now + visibility_timeout, now, self.max_attempts, int(limit)))
+            rows = cur.fetchall()
+        return [{"id": row[0], "attempts": row[1], "payload": json.loads(row[2])} for row in rows]
+
+    def heartbeat(self, worker_id: str, job_ids: List[str], visibility_timeout: float,
+                  worker: Optional[Dict] = None) -> int:
+        """Renova o lease dos jobs ainda em posse do worker e grava suas metricas.
+
+        Retorna quantos leases foram renovados.
+        """
+        now = time.time()
+        renewed = 0
+        with track_db("work_queue_heartbeat"), self._connection() as conn:
+            cur = conn.cursor()
+            if job_ids:
+                marks = ", ".join("?" * len(job_ids))
+                cur.execute(self._sql(
+                    "UPDATE automation_work_queue SET lease_until = ? "
+                    f"WHERE worker_id = ? AND state = 'running' AND id IN ({marks})"),
+                    [now + visibility_timeout, worker_id, *job_ids])
+                renewed = max(cur.rowcount, 0)
+            if worker is not None:
+                row = {**worker, "worker_id": worker_id, "heartbeat_ts": now}
+                cur.execute(self._sql(WORKER_SQL), [row.get(col) for col in WORKER_COLUMNS])
+        return renewed
+
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        """Grava o resultado; False se o worker ja nao detem o lease."""
+        with track_db("work_queue_complete"), self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(
+                "UPDATE automation_work_queue SET state = 'done', result = ?, lease_until = NULL "
+                "WHERE id = ? AND worker_id = ? AND state = 'running'"),
+                (json.dumps(result, default=str), job_id, worker_id))
+            return cur.rowcount == 1
+
+    def release(self, job_ids: List[str], worker_id: str) -> int:
+        """Devolve jobs nao iniciados/interrompidos a fila (desligamento do worker)."""
+        if not job_ids:
+            return 0
+        marks = ", ".join("?" * len(job_ids))
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql(
+                "UPDATE automation_work_queue SET state = 'queued', worker_id = NULL, lease_until = NULL, "
+                f"attempts = attempts - 1 WHERE worker_id = ? AND state = 'running' AND id IN ({marks})"),
+                [worker_id, *job_ids])
+            return max(cur.rowcount, 0)
+
+    # --- observabilidade ---
+
+    def workers(self, stale_after: float = 60.0) -> List[Dict]:
+        now = time.time()
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {', '.join(WORKER_COLUMNS)} FROM automation_workers ORDER BY worker_id")
+            rows = cur.fetchall()
+        result = []
+        for row in rows:
+            worker = dict(zip(WORKER_COLUMNS, row))
+            worker["alive"] = now - worker["heartbeat_ts"] <= stale_after
+            worker["uptime_s"] = round(worker["heartbeat_ts"] - worker["started_ts"], 1)
+            result.append(worker)
+        return result
+
+    def prune_workers(self, older_than: float = 3600.0) -> int:
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self._sql("DELETE FROM automation_workers WHERE heartbeat_ts < ?"),
+                        (time.time() - older_than,))
+            return max(cur.rowcount, 0)
+
+    def depth(self) -> Dict[str, int]:
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT state, COUNT(*) FROM automation_work_queue GROUP BY state")
+            return {state: int(total) for state, total in cur.fetchall()}
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "max_attempts": self.max_attempts, **self._counts}
+
+
+class SqliteWorkQueue(WorkQueue):
+    backend = "sqlite"
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connection(self):
+        # IMMEDIATE pega o lock de escrita ja no inicio: dois processos nunca
+        # leem a mesma linha livre e depois disputam o upgrade do lock
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "path": self.path}
+
+
+class PostgresWorkQueue(WorkQueue):
+    backend = "postgres"
+    placeholder = "%s"
+    lock_clause = " FOR UPDATE SKIP LOCKED"
+
+    def __init__(self, database_url: str, pool_size: int = 4, **kwargs):
+        super().__init__(**kwargs)
+        self._pool = DbPool(database_url, name="work_queue", min_size=1, max_size=pool_size,
+                            statement_timeout_ms=30000, readonly=False)
+
+    @contextmanager
+    def _connection(self):
+        with self._pool.connection() as conn:
+            conn.autocommit = False
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+
+    def close(self):
+        self._pool.close()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "pool": self._pool.stats()}
+
+
+def open_work_queue(default_path: str, database_url: str = "",
+                    prefix: str = "AUTOMATION_WORK_QUEUE") -> Optional[WorkQueue]:
+    """Escolhe o backend por {prefix} (off|auto|sqlite|postgres); padrao off.
+
+    off mantem a execucao no proprio processo da API. auto usa PostgreSQL
+    quando ha DATABASE_URL e psycopg2, senao SQLite em {prefix}_PATH.
+    """
+    env = os.environ.get
+    mode = env(prefix, "off").lower()
+    if mode in ("off", "false", "0", ""):
+        return None
+    options = dict(max_attempts=int(env(f"{prefix}_MAX_ATTEMPTS", "3")))
+    has_postgres = HAS_PSYCOPG2 and bool(database_url)
+    if mode == "postgres" or (mode == "auto" and has_postgres):
+        if not has_postgres:
+            raise RuntimeError("Work queue postgres requer psycopg2 e DATABASE_URL")
+        queue: WorkQueue = PostgresWorkQueue(database_url, **options)
+    else:
+        queue = SqliteWorkQueue(env(f"{prefix}_PATH") or default_path, **options)
+    queue.init_schema()
+    return queue